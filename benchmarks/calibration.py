@@ -0,0 +1,29 @@
+"""Калібрувальне навантаження для порівняння замірів між машинами.
+
+baseline зберігає час етапів у одиницях цього заміру (ratio = час етапу / час калібрування),
+тож повільніша чи швидша машина зсуває обидва значення однаково і не дає хибних регресій.
+"""
+import time
+import numpy as np
+
+CALIBRATION_REPEAT = 10
+
+
+def calibration_workload() -> float:
+    """Фіксована суміш інтерпретованого циклу (як у backtrader) та векторних операцій NumPy"""
+    total = 0.0
+    for i in range(200_000):
+        total += i % 7 * 0.5
+    values = np.random.default_rng(0).normal(size=500_000)
+    return total + float(np.sort(np.cumsum(values))[-1])
+
+
+def calibrate(repeat: int = CALIBRATION_REPEAT) -> float:
+    """Найкращий час калібрувального навантаження після прогрівального запуску, секунд"""
+    calibration_workload()
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        calibration_workload()
+        best = min(best, time.perf_counter() - started)
+    return best
@@ -0,0 +1,194 @@
+"""Офлайн бенчмарк етапів бектесту на синтетичних свічках.
+
+Запуск з кореня проєкту:
+    python -m benchmarks.pipeline                    # порівняння з benchmarks/baseline.json
+    python -m benchmarks.pipeline --update-baseline  # запис нового baseline
+Час етапів у baseline зберігається відносно калібрувального заміру (benchmarks.calibration), тож baseline
+можна порівнювати на іншій машині; на дуже відмінному залізі (інший CPU/BLAS) його варто перезаписати.
+Завершується з кодом 1, якщо якийсь етап повільніший або потребує більше пам'яті, ніж дозволяє допуск.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable
+from benchmarks.calibration import calibrate
+from benchmarks.synthetic import synthetic_frames
+from strategy import Controller
+from utils.ledger import TradeLedger, remove_ledger
+from utils.plotting import render_chart
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+CASES = {
+    '1w': ('2023-01-01', '2023-01-08'),
+    '3m': ('2023-01-01', '2023-04-01'),
+    '2y': ('2023-01-01', '2025-01-01'),
+}
+DEPOSIT = 1000
+# Вікно перецентрування для етапу walk-forward, днів
+WALK_FORWARD_DAYS = 7
+# Абсолютний запас на шум таймера для дуже коротких етапів, секунд
+TIME_SLACK = 0.005
+# Запусків калібрувального навантаження перед кожним замірюваним запуском етапу
+CALIBRATION_PER_RUN = 3
+
+
+def build_stages(controller: Controller, df_strategy,
+                 walk_forward: Controller) -> tuple[dict[str, tuple[Callable, Callable]], Callable]:
+    """Етапи пайплайну: (підготовка без заміру, замірюваний виклик), та прибирання тимчасових файлів"""
+    state = {}
+
+    def fresh_ledger():
+        remove_ledger(state.get('ledger_path'))
+        ledger = TradeLedger(controller._strategy_timestamps())
+        state['ledger_path'] = ledger.path
+        return ledger
+
+    def prepare_strategy():
+        controller.data_strategy = controller._dataframe_to_backtrader(df_strategy)
+        state['ledger'] = fresh_ledger()
+
+    def run_strategy():
+        with state['ledger'] as ledger:
+            state['chart'] = controller._run_strategy(ledger)[1]
+
+    def prepare_fast():
+        state['ledger'] = fresh_ledger()
+
+    def run_fast_strategy():
+        with state['ledger'] as ledger:
+            controller._run_fast_strategy(ledger)
+
+    def prepare_walk_forward():
+        walk_forward._compute_indicators()
+        state['ledger'] = fresh_ledger()
+
+    def run_fast_walk_forward():
+        with state['ledger'] as ledger:
+            walk_forward._run_fast_strategy(ledger)
+
+    stages = {
+        'dataframe_to_backtrader': (lambda: None, lambda: controller._dataframe_to_backtrader(df_strategy)),
+        'compute_indicators': (lambda: None, controller._compute_indicators),
+        'run_strategy': (prepare_strategy, run_strategy),
+        'run_fast_strategy': (prepare_fast, run_fast_strategy),
+        'run_fast_walk_forward': (prepare_walk_forward, run_fast_walk_forward),
+        'render_chart': (lambda: None, lambda: render_chart(state['chart'])),
+    }
+    return stages, lambda: remove_ledger(state.get('ledger_path'))
+
+
+def measure(prepare: Callable, stage: Callable, repeat: int) -> dict[str, float]:
+    """Найкращий час з repeat запусків після прогрівального та пік пам'яті (tracemalloc) окремим запуском.
+
+    Прогрівальний запуск не замірюється: в ньому лінивий імпорт (matplotlib) та перші виділення пам'яті.
+    Калібрування чергується з запусками етапу, тож ratio враховує навантаження машини саме під час заміру.
+    """
+    prepare()
+    stage()
+    best, calibration = float('inf'), float('inf')
+    for _ in range(repeat):
+        calibration = min(calibration, calibrate(CALIBRATION_PER_RUN))
+        prepare()
+        started = time.perf_counter()
+        stage()
+        best = min(best, time.perf_counter() - started)
+    prepare()
+    tracemalloc.start()
+    try:
+        stage()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'time': round(best, 6), 'ratio': round(best / calibration, 4), 'peak_mb': round(peak / 2 ** 20, 3)}
+
+
+def run_case(name: str, repeat: int, volatility: float, seed: int) -> dict[str, dict[str, float]]:
+    start_date, end_date = CASES[name]
+    df_indicators, df_strategy = synthetic_frames(start_date, end_date, volatility, seed)
+    controller = Controller(start_date, end_date, 'SYNTHETIC', DEPOSIT, None, None,
+                            frames=(df_indicators, df_strategy))
+    walk_forward = Controller(start_date, end_date, 'SYNTHETIC', DEPOSIT, None, None,
+                              frames=(df_indicators, df_strategy), recenter_days=WALK_FORWARD_DAYS)
+    results = {}
+    stages, cleanup = build_stages(controller, df_strategy, walk_forward)
+    try:
+        for stage_name, (prepare, stage) in stages.items():
+            results[stage_name] = measure(prepare, stage, repeat)
+    finally:
+        cleanup()
+    return {'bars': len(df_strategy), **results}
+
+
+def to_baseline(results: dict) -> dict:
+    """Результати у форматі baseline: без абсолютного часу, лише ratio до калібрування та пік пам'яті"""
+    return {case: {stage: {'ratio': metrics['ratio'], 'peak_mb': metrics['peak_mb']}
+                   if isinstance(metrics, dict) else metrics for stage, metrics in stages.items()}
+            for case, stages in results.items()}
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list[str]:
+    """Список регресій відносно baseline; очікуваний час - ratio з baseline, помножений на калібрування заміру"""
+    regressions = []
+    for case, stages in results.items():
+        for stage, metrics in stages.items():
+            expected = baseline.get(case, {}).get(stage)
+            if not isinstance(metrics, dict) or not isinstance(expected, dict) or 'ratio' not in expected:
+                continue
+            expected_time = expected['ratio'] * metrics['time'] / metrics['ratio']
+            if metrics['time'] > expected_time * time_tolerance + TIME_SLACK:
+                regressions.append(f"{case}/{stage}: time {metrics['time']:.4f}s > baseline {expected_time:.4f}s "
+                                   f"({expected['ratio']:.2f} x calibration)")
+            if metrics['peak_mb'] > expected['peak_mb'] * memory_tolerance + 0.1:
+                regressions.append(f"{case}/{stage}: peak {metrics['peak_mb']:.2f}MB "
+                                   f"> baseline {expected['peak_mb']:.2f}MB")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', default=','.join(CASES), help='через кому, з ' + ', '.join(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--volatility', type=float, default=0.006)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--time-tolerance', type=float, default=1.5, help='допустиме сповільнення, разів')
+    parser.add_argument('--memory-tolerance', type=float, default=1.25, help='допустиме зростання піку пам\'яті, разів')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for case in args.cases.split(','):
+        if case not in CASES:
+            parser.error(f'Unknown case: {case}')
+        results[case] = run_case(case, args.repeat, args.volatility, args.seed)
+        print(f"{case} ({results[case]['bars']} bars)")
+        for stage, metrics in results[case].items():
+            if isinstance(metrics, dict):
+                print(f"  {stage:<26}{metrics['time']:>10.4f}s{metrics['ratio']:>10.2f}x{metrics['peak_mb']:>10.2f}MB")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline.update(to_baseline(results))
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2)
+            file.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --update-baseline')
+        return 0
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file), args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Бенчмарк холодного старту: імпорт модулів бота, запуск пулу воркерів та перший бектест у воркері.
+
+Кожен замір - окремий свіжий інтерпретатор; перший прохід прогрівальний і не замірюється (компіляція .pyc,
+кеш файлової системи). Час у baseline - відносно калібрувального заміру (benchmarks.calibration).
+Запуск з кореня проєкту:
+    python -m benchmarks.startup                    # порівняння з розділом startup у benchmarks/baseline.json
+    python -m benchmarks.startup --update-baseline  # запис нового baseline
+Завершується з кодом 1, якщо етап повільніший, ніж дозволяє допуск, або бот імпортує важкі залежності.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from benchmarks.calibration import calibrate
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Модулі, які процес бота не має імпортувати (завантажуються лише у воркерах)
+HEAVY_MODULES = ('pandas', 'backtrader', 'binance', 'matplotlib', 'strategy')
+# Модулі бота без aiogram-обвʼязки handlers/loader, яким потрібен токен та aiogram3_calendar
+BOT_MODULES = ('utils.handlers_utils', 'utils.keyboards', 'utils.fsm')
+TIME_SLACK = 0.05
+CALIBRATION_PER_RUN = 3
+
+BOT_IMPORT_PROBE = f'''
+import json, sys, time
+started = time.perf_counter()
+for module in {BOT_MODULES!r}:
+    __import__(module)
+elapsed = time.perf_counter() - started
+print(json.dumps({{'bot_import': elapsed,
+                  'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+'''
+
+WORKER_PROBE = '''
+import asyncio, json, sys, time
+from utils.worker_pool import BacktestScheduler
+from benchmarks.startup import first_backtest
+
+async def main():
+    scheduler = BacktestScheduler(max_workers=int(sys.argv[1]))
+    started = time.perf_counter()
+    await scheduler.start()
+    worker_start = time.perf_counter() - started
+    started = time.perf_counter()
+    await scheduler.submit(0, first_backtest)
+    result = {'worker_start': worker_start, 'first_backtest': time.perf_counter() - started}
+    scheduler.shutdown()
+    return result
+
+print(json.dumps(asyncio.run(main())))
+'''
+
+
+def first_backtest() -> None:
+    """Бектест тижня синтетичних свічок швидким симулятором - задача для заміру першого запуску у воркері"""
+    from benchmarks.synthetic import synthetic_frames
+    from strategy import Controller
+
+    frames = synthetic_frames('2023-01-01', '2023-01-08')
+    controller = Controller('2023-01-01', '2023-01-08', 'SYNTHETIC', 1000, None, None, frames=frames)
+    _, _, ledger_path = controller.run('fast')
+    os.remove(ledger_path)
+
+
+def probe(code: str, start_method: str | None, *argv: str) -> dict:
+    env = {**os.environ, 'PYTHONPATH': ROOT + os.pathsep + os.environ.get('PYTHONPATH', '')}
+    if start_method:
+        env['BACKTEST_START_METHOD'] = start_method
+    output = subprocess.run([sys.executable, '-c', code, *argv], cwd=ROOT, env=env, check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_startup(repeat: int, workers: int, start_method: str | None = None,
+                    worker_probe: bool = True) -> tuple[dict[str, float], set[str], float]:
+    """Найкращі часи етапів з repeat проходів після прогрівального, важкі модулі в процесі бота та калібрування"""
+    probe(BOT_IMPORT_PROBE, start_method)
+    if worker_probe:
+        probe(WORKER_PROBE, start_method, str(workers))
+    results, heavy, calibration = {}, set(), float('inf')
+    for _ in range(repeat):
+        # калібрування чергується з замірами, щоб ratio враховував поточне навантаження машини
+        calibration = min(calibration, calibrate(CALIBRATION_PER_RUN))
+        started = time.perf_counter()
+        measured = probe(BOT_IMPORT_PROBE, start_method)
+        heavy.update(measured.pop('heavy'))
+        if worker_probe:
+            measured.update(probe(WORKER_PROBE, start_method, str(workers)))
+            measured['total'] = time.perf_counter() - started
+        for stage, seconds in measured.items():
+            results[stage] = min(results.get(stage, float('inf')), round(seconds, 4))
+    return results, heavy, calibration
+
+
+def compare(results: dict[str, float], baseline: dict, calibration: float, time_tolerance: float) -> list[str]:
+    """Список регресій відносно розділу startup у baseline"""
+    regressions = []
+    for stage, seconds in results.items():
+        expected = baseline.get('startup', {}).get(stage)
+        if not isinstance(expected, dict) or 'ratio' not in expected:
+            continue
+        expected_time = expected['ratio'] * calibration
+        if seconds > expected_time * time_tolerance + TIME_SLACK:
+            regressions.append(f"startup/{stage}: time {seconds:.4f}s > baseline {expected_time:.4f}s "
+                               f"({expected['ratio']:.2f} x calibration)")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--start-method', default=None, help='forkserver, spawn або fork (BACKTEST_START_METHOD)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--time-tolerance', type=float, default=1.5, help='допустиме сповільнення, разів')
+    args = parser.parse_args(argv)
+
+    results, heavy, calibration = measure_startup(args.repeat, args.workers, args.start_method)
+    print(f'  {"calibration":<26}{calibration:>10.4f}s')
+    for stage, seconds in results.items():
+        print(f'  {stage:<26}{seconds:>10.4f}s{seconds / calibration:>10.2f}x')
+
+    failures = [f'bot imports heavy modules: {", ".join(sorted(heavy))}'] if heavy else []
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    if args.update_baseline:
+        baseline['startup'] = {stage: {'ratio': round(seconds / calibration, 4)} for stage, seconds in results.items()}
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2)
+            file.write('\n')
+        print(f'Baseline written to {args.baseline}')
+    elif 'startup' not in baseline:
+        print(f'No startup baseline at {args.baseline}, run with --update-baseline')
+    else:
+        failures += compare(results, baseline, calibration, args.time_tolerance)
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
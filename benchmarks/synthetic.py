@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+BAR_INTERVAL = pd.Timedelta(hours=1)
+
+
+def synthetic_ohlcv(n_bars: int,
+                    start: str = '2023-01-01',
+                    volatility: float = 0.006,
+                    start_price: float = 20000.0,
+                    seed: int = 0) -> DataFrame:
+    """Детермінований ряд 1h свічок: геометричне блукання з тінями, ціни округлені як у Binance"""
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0.0, volatility, n_bars)))
+    open_ = np.r_[start_price, close[:-1]]
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, volatility / 3, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, volatility / 3, n_bars)))
+    frame = DataFrame({'open': open_.round(2),
+                       'high': high.round(2),
+                       'low': low.round(2),
+                       'close': close.round(2),
+                       'volume': rng.uniform(10, 100, n_bars).round(4)},
+                      index=pd.date_range(start, periods=n_bars, freq=BAR_INTERVAL, name='timestamp'))
+    return frame
+
+
+def synthetic_frames(start_date: str,
+                     end_date: str,
+                     volatility: float = 0.006,
+                     seed: int = 0) -> tuple[DataFrame, DataFrame]:
+    """(df_indicators, df_strategy) як у Controller._fetch_historical_data: 2 тижні до старту та період тестування"""
+    start = pd.Timestamp(start_date) - pd.Timedelta(weeks=2)
+    n_bars = int((pd.Timestamp(end_date) - start) / BAR_INTERVAL)
+    frame = synthetic_ohlcv(n_bars, str(start), volatility, seed=seed)
+    return frame[frame.index < start_date], frame[frame.index >= start_date]
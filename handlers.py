@@ -1,19 +1,53 @@
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, FSInputFile
 from aiogram3_calendar import simple_cal_callback, SimpleCalendar
 from loader import dp, bot
 from aiogram.types import Message
-from utils.keyboards import date_picking_kb, get_stat_kb
+from utils.keyboards import date_picking_kb, get_stat_kb, timeframe_kb, basket_kb
 from utils.fsm import TestParamsState
-from utils.handlers_utils import test_strategy, buffer_to_bytes
-from binance.exceptions import BinanceAPIException
+from utils.handlers_utils import (test_strategy, test_basket, test_monte_carlo, top_symbols, get_plot, get_basket_plot,
+                                  get_orders_file, cancel_backtests, kline_loader, scheduler, metrics, result_cache,
+                                  BASKET_MAX_SYMBOLS)
+from utils.job_control import JobCancelledError, JobTimeoutError
+from utils.metrics import METRICS_PORT
+from utils.worker_pool import QueueFullError, ChatLimitError
+from utils.kline_loader import ExchangeAPIError, ExchangeRequestError, ExchangeUnavailableError
+from utils.grid_config import TIMEFRAMES
+from utils.indicators import NotEnoughBarsError
+from utils.ledger import LEDGER_DIR
+from utils.plotting import CHART_DIR
 from datetime import datetime
+from html import escape
+import asyncio
+import logging
+import re
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+@dp.startup()
+async def on_startup():
+    """Прибирання файлів, що лишились від попереднього запуску, прогрів пулу процесів та запуск ендпоінту метрик"""
+    await asyncio.to_thread(result_cache.sweep, CHART_DIR, LEDGER_DIR)
+    await scheduler.start()
+    if METRICS_PORT:
+        await metrics.serve()
+
+
+@dp.shutdown()
+async def on_shutdown():
+    """Закриття HTTP-сесії завантажувача свічок, ендпоінту метрик та пулу процесів"""
+    await kline_loader.close()
+    await metrics.close()
+    scheduler.shutdown()
 
 
 @dp.message(Command(commands=['start']))
 async def cmd_start(message: Message, state: FSMContext):
-    """Обробка команди start"""
+    """Обробка команди start, незавершені тестування чату скасовуються"""
+    cancel_backtests(message.chat.id)
     await state.clear()
     await message.reply('Привіт! Я бот для тестування spot grid trading. Почнімо?', reply_markup=date_picking_kb)
 
@@ -61,7 +95,8 @@ async def process_picking_end_date(call: CallbackQuery, callback_data: dict, sta
             await state.set_state(TestParamsState.end_date)
         else:
             await call.message.answer(
-                f'Кінцева дата: {date.strftime(date_format)}.Вкажіть депозит (мін 100) в $. Приклад: 100, 200, 1000, ...')
+                f'Кінцева дата: {date.strftime(date_format)}.Вкажіть депозит (мін 100) в $. '
+                f'Приклад: 100, 200, 1000, ...')
             await state.update_data(end_date=date.strftime(date_format))
             await state.set_state(TestParamsState.deposit)
 
@@ -76,43 +111,251 @@ async def process_picking_deposit(message: Message, state: FSMContext):
         await state.set_state(TestParamsState.deposit)
         return
     await state.update_data(deposit=deposit)
-    await message.answer(f'Ваш депозит: {deposit} .Вкажіть монету. Приклад: BTC, ETH, MATIC, ...')
+    await message.answer(f'Ваш депозит: {deposit} .Виберіть таймфрейм свічок для тестування:',
+                         reply_markup=timeframe_kb)
+    await state.set_state(TestParamsState.timeframe)
+
+
+@dp.callback_query(lambda call: call.data.startswith('timeframe:'), TestParamsState.timeframe)
+async def process_picking_timeframe(call: CallbackQuery, state: FSMContext):
+    """Вибір таймфрейму симуляції"""
+    timeframe = call.data.split(':', 1)[1]
+    if timeframe not in TIMEFRAMES:
+        # підроблені або застарілі callback_data не доходять до симуляції
+        await call.answer('Невідомий таймфрейм. Виберіть один із запропонованих.', show_alert=True)
+        return
+    await call.answer()
+    await state.update_data(timeframe=timeframe)
+    await call.message.answer(f'Таймфрейм: {timeframe}. Вкажіть монету. Приклад: BTC, ETH, MATIC, ...\n'
+                              f'Для тестування кошика вкажіть кілька монет через кому (BTC, ETH, SOL) '
+                              f'або top N - N пар з найбільшим обсягом за добу (до {BASKET_MAX_SYMBOLS}).')
     await state.set_state(TestParamsState.symbol)
 
 
 @dp.message(TestParamsState.symbol)
 async def process_picking_symbol(message: Message, state: FSMContext):
     """Логіка після вказання монети"""
-    if message.text.upper() == 'USDT':
+    coins = [coin for coin in re.split(r'[\s,;]+', message.text.upper()) if coin]
+    if re.fullmatch(r'TOP\s*\d+', message.text.strip().upper()) or len(coins) > 1:
+        await process_basket(message, state)
+    elif message.text.upper() == 'USDT':
         await message.answer(f'Ця пара недоступна, введіть іншу: ')
     else:
         symbol = message.text.upper() + 'USDT'
         data = await state.get_data()
-        if 'orders' in data:
-            data.pop('orders')
+        for key in ('orders', 'chart', 'symbol', 'basket_charts'):
+            data.pop(key, None)
         await message.answer(f'Ваша торгова пара: {symbol}. Розпочинаю тестування, це може зайняти деякий час...')
+        status_message = None
+
+        async def report_status(text: str):
+            nonlocal status_message
+            if status_message is None:
+                status_message = await message.answer(text)
+            else:
+                await status_message.edit_text(text)
+
+        async def report_position(position: int):
+            if position:
+                await report_status(f'Ваш запит у черзі, позиція: {position}')
+            elif status_message is not None:
+                await report_status('Черга дійшла, тестування розпочато...')
+
+        async def report_progress(done: int, total: int):
+            await report_status(f'Тестування: {done * 100 // total}% ({done}/{total} свічок). Скасувати - /start')
+
         try:
-            data = await test_strategy(**data, symbol=symbol)
+            data = await test_strategy(**data, symbol=symbol, chat_id=message.chat.id, on_position=report_position,
+                                       on_progress=report_progress)
             results = '\n'.join(f'{k}: {str(v)}' for k, v in data[0].items())
-            plot = data[1]
-            plot = buffer_to_bytes(plot, 'plot')
+            chart_path = data[1]
             orders = data[2]
-            await bot.send_photo(message.chat.id,
-                                 plot,
-                                 caption=f'Готово! Ось результати торгівлі: \n{results}.\n'
-                                         'Зверніть увагу, що це тестові дані і комісія за ордери не враховується. ',
+            await message.answer(f'Готово! Ось результати торгівлі: \n{results}.\n'
+                                 'Зверніть увагу, що це тестові дані і комісія за ордери не враховується. ',
                                  reply_markup=get_stat_kb)
-            await state.update_data(orders=orders)
+            await state.update_data(orders=orders, chart=chart_path, symbol=symbol)
             await state.set_state(TestParamsState.orders)
-        except BinanceAPIException:
+        except (ExchangeUnavailableError, ExchangeRequestError):
+            await message.answer(f'Біржа зараз недоступна. Спробуйте трохи пізніше.')
+        except ExchangeAPIError:
             await message.answer(f'Схоже ви вказали невірну торгову пару. Спробуйте ще раз: ')
             await state.set_state(TestParamsState.symbol)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            await message.answer(f'Не вдалося отримати свічки з біржі. Спробуйте трохи пізніше.')
+        except ChatLimitError:
+            await message.answer(f'Ваше попереднє тестування ще виконується, дочекайтесь результату.')
+        except QueueFullError:
+            await message.answer(f'Зараз забагато запитів на тестування. Спробуйте трохи пізніше.')
+        except JobTimeoutError:
+            await message.answer(f'Тестування не вклалось у ліміт часу. Спробуйте коротший діапазон або більший '
+                                 f'таймфрейм: ')
+        except JobCancelledError:
+            await message.answer(f'Тестування скасовано.')
+        except NotEnoughBarsError:
+            await message.answer(f'Замало свічок до дати старту для розрахунку індикаторів. '
+                                 f'Виберіть пізнішу дату старту або менший таймфрейм.')
+        except Exception:
+            logger.exception('Backtest of %s failed', symbol)
+            await message.answer(f'Під час тестування сталася помилка. Спробуйте ще раз пізніше.')
 
 
-@dp.callback_query(lambda call: call.data == 'get_stat', TestParamsState.orders)
-async def process_start_test(call: CallbackQuery, state: FSMContext):
-    """Отримання статистики ордерів"""
+async def process_basket(message: Message, state: FSMContext):
+    """Тестування кошика пар: список монет або top N за обсягом"""
+    top = re.fullmatch(r'TOP\s*(\d+)', message.text.strip().upper())
+    if top:
+        try:
+            symbols = await top_symbols(int(top.group(1)))
+        except (ExchangeAPIError, ExchangeRequestError, aiohttp.ClientError, asyncio.TimeoutError):
+            await message.answer(f'Не вдалося отримати список пар з біржі. Спробуйте трохи пізніше.')
+            return
+    else:
+        coins = [coin for coin in re.split(r'[\s,;]+', message.text.upper()) if coin and coin != 'USDT']
+        symbols = list(dict.fromkeys(coin + 'USDT' for coin in coins))
+    if not symbols or len(symbols) > BASKET_MAX_SYMBOLS:
+        await message.answer(f'Кошик має містити від 1 до {BASKET_MAX_SYMBOLS} пар, спробуйте ще раз: ')
+        return
+    data = await state.get_data()
+    for key in ('orders', 'chart', 'symbol', 'basket_charts'):
+        data.pop(key, None)
+    await message.answer(f'Кошик з {len(symbols)} пар: {", ".join(symbols)}. '
+                         'Розпочинаю тестування, це може зайняти деякий час...')
+    try:
+        ranked, failures = await test_basket(**data, symbols=symbols, chat_id=message.chat.id)
+    except ChatLimitError:
+        await message.answer(f'Ваше попереднє тестування ще виконується, дочекайтесь результату.')
+        return
+    except QueueFullError:
+        await message.answer(f'Зараз забагато запитів на тестування. Спробуйте трохи пізніше.')
+        return
+    except JobCancelledError:
+        await message.answer(f'Тестування кошика скасовано.')
+        return
+    except Exception:
+        logger.exception('Basket backtest of %s failed', ', '.join(symbols))
+        await message.answer(f'Під час тестування сталася помилка. Спробуйте ще раз пізніше.')
+        return
+    rows = [f'{"#":>2} {"Пара":<12}{"P/L %":>9}{"Угод":>6}{"DD %":>8}']
+    rows += [f'{i:>2} {symbol:<12}{analysis["Profit/Loss (%)"]:>9.2f}{analysis["Total Trades"]:>6}'
+             f'{analysis["Max drawdown (%)"]:>8.2f}' for i, (symbol, analysis, _) in enumerate(ranked, 1)]
+    text = f'Готово! Рейтинг пар за прибутком:\n<pre>{escape(chr(10).join(rows))}</pre>'
+    if failures:
+        labels = {ExchangeAPIError: 'невірна торгова пара', ExchangeUnavailableError: 'біржа недоступна',
+                  ExchangeRequestError: 'біржа недоступна', JobTimeoutError: 'ліміт часу',
+                  NotEnoughBarsError: 'замало історії'}
+        reasons = {symbol: labels.get(type(error), type(error).__name__) for symbol, error in failures.items()}
+        text += '\nНе вдалося протестувати: ' + escape(', '.join(f'{s} ({r})' for s, r in reasons.items()))
+    text += '\nЗверніть увагу, що це тестові дані і комісія за ордери не враховується.'
+    await message.answer(text, reply_markup=basket_kb if ranked else None)
+    if ranked:
+        await state.update_data(basket_charts={symbol: chart_path for symbol, _, chart_path in ranked})
+        await state.set_state(TestParamsState.basket)
+
+
+@dp.callback_query(lambda call: call.data in ('get_stat', 'get_stat_csv'), TestParamsState.orders)
+async def process_get_stat(call: CallbackQuery, state: FSMContext):
+    """Отримання статистики ордерів, журнал форматується лише тут"""
     await call.answer()
-    file = (await state.get_data())['orders']
-    file = buffer_to_bytes(file, 'orders.txt')
+    ledger_path = (await state.get_data())['orders']
+    try:
+        file = await get_orders_file(ledger_path, 'csv' if call.data == 'get_stat_csv' else 'text')
+    except FileNotFoundError:
+        await call.message.answer(f'Дані цього тестування вже недоступні, запустіть тестування ще раз.')
+        return
     await bot.send_document(call.message.chat.id, file)
+
+
+@dp.callback_query(lambda call: call.data == 'get_plot', TestParamsState.orders)
+async def process_get_plot(call: CallbackQuery, state: FSMContext):
+    """Графік торгівлі, малюється лише на запит"""
+    await call.answer()
+    chart_path = (await state.get_data())['chart']
+    try:
+        image_path = await get_plot(chart_path, call.message.chat.id)
+    except FileNotFoundError:
+        await call.message.answer(f'Дані цього тестування вже недоступні, запустіть тестування ще раз.')
+        return
+    except ChatLimitError:
+        await call.message.answer(f'Графік вже малюється, дочекайтесь результату.')
+        return
+    except QueueFullError:
+        await call.message.answer(f'Зараз забагато запитів. Спробуйте трохи пізніше.')
+        return
+    except JobCancelledError:
+        return
+    await bot.send_photo(call.message.chat.id, FSInputFile(image_path, filename='plot.png'))
+
+
+@dp.callback_query(lambda call: call.data == 'get_monte_carlo', TestParamsState.orders)
+async def process_get_monte_carlo(call: CallbackQuery, state: FSMContext):
+    """Стійкість сітки методом Монте-Карло: розподіли P/L та просідання на бутстреп-шляхах ціни"""
+    await call.answer()
+    data = await state.get_data()
+    for key in ('orders', 'chart', 'basket_charts'):
+        data.pop(key, None)
+    if 'symbol' not in data:
+        await call.message.answer(f'Дані цього тестування вже недоступні, запустіть тестування ще раз.')
+        return
+    status_message = await call.message.answer('Монте-Карло: генерую шляхи ціни...')
+
+    async def report_progress(done: int, total: int):
+        await status_message.edit_text(f'Монте-Карло: {done * 100 // total}%. Скасувати - /start')
+
+    try:
+        summary = await test_monte_carlo(**data, chat_id=call.message.chat.id, on_progress=report_progress)
+    except (ExchangeUnavailableError, ExchangeRequestError):
+        await call.message.answer(f'Біржа зараз недоступна. Спробуйте трохи пізніше.')
+        return
+    except (ExchangeAPIError, aiohttp.ClientError, asyncio.TimeoutError):
+        await call.message.answer(f'Не вдалося отримати свічки з біржі. Спробуйте трохи пізніше.')
+        return
+    except ChatLimitError:
+        await call.message.answer(f'Ваше попереднє тестування ще виконується, дочекайтесь результату.')
+        return
+    except QueueFullError:
+        await call.message.answer(f'Зараз забагато запитів. Спробуйте трохи пізніше.')
+        return
+    except JobTimeoutError:
+        await call.message.answer(f'Монте-Карло не вклалось у ліміт часу. Спробуйте коротший діапазон або більший '
+                                  f'таймфрейм.')
+        return
+    except JobCancelledError:
+        return
+    except NotEnoughBarsError:
+        await call.message.answer(f'Замало свічок до дати старту для розрахунку індикаторів. '
+                                  f'Виберіть пізнішу дату старту або менший таймфрейм.')
+        return
+    except Exception:
+        logger.exception('Monte Carlo of %s failed', data['symbol'])
+        await call.message.answer(f'Під час тестування сталася помилка. Спробуйте ще раз пізніше.')
+        return
+    rows = [f'{"":<10}' + ''.join(f'{"p" + str(p):>8}' for p in summary['percentiles'])]
+    for name, label in (('Profit/Loss (%)', 'P/L %'), ('Max drawdown (%)', 'DD %'), ('Total Trades', 'Угод')):
+        rows.append(f'{label:<10}' + ''.join(f'{value:>8.1f}' for value in summary[name]))
+    await call.message.answer(
+        f'Монте-Карло: {summary["paths"]} шляхів по {summary["bars"]} свічок '
+        f'(блоки по {summary["block_bars"]} свічок з історії):\n<pre>{escape(chr(10).join(rows))}</pre>\n'
+        f'Середній P/L: {summary["mean_profit"]}%\n'
+        f'Ймовірність збитку: {summary["loss_probability"]:.1%}\n'
+        f'Ймовірність стоп-лосу: {summary["stop_loss_probability"]:.1%}\n'
+        f'Ймовірність тейк-профіту: {summary["take_profit_probability"]:.1%}')
+
+
+@dp.callback_query(lambda call: call.data == 'get_basket_plot', TestParamsState.basket)
+async def process_get_basket_plot(call: CallbackQuery, state: FSMContext):
+    """Спільний графік дохідності пар кошика, малюється лише на запит"""
+    await call.answer()
+    chart_paths = (await state.get_data())['basket_charts']
+    try:
+        image_path = await get_basket_plot(chart_paths, call.message.chat.id)
+    except FileNotFoundError:
+        await call.message.answer(f'Дані цього тестування вже недоступні, запустіть тестування ще раз.')
+        return
+    except ChatLimitError:
+        await call.message.answer(f'Графік вже малюється, дочекайтесь результату.')
+        return
+    except QueueFullError:
+        await call.message.answer(f'Зараз забагато запитів. Спробуйте трохи пізніше.')
+        return
+    except JobCancelledError:
+        return
+    await bot.send_photo(call.message.chat.id, FSInputFile(image_path, filename='basket.png'))
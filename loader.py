@@ -2,6 +2,7 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 import os
 from dotenv import load_dotenv
+from utils.fsm_storage import create_storage
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 if os.path.exists(dotenv_path):
@@ -9,4 +10,4 @@ if os.path.exists(dotenv_path):
 
 API_TOKEN = os.getenv("TELEGRAM_API_TOKEN")
 bot = Bot(API_TOKEN, parse_mode=ParseMode.HTML)
-dp = Dispatcher()
+dp = Dispatcher(storage=create_storage())
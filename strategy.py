@@ -1,14 +1,25 @@
 import datetime
-import io
+from typing import Callable
 import backtrader as bt
+import numpy as np
 import pandas as pd
 import backtrader.feeds as btfeeds
 from binance.client import Client
 from pandas import DataFrame
 from backtrader.feeds import PandasData
-from statistics import fmean
 from backtrader.order import Order
-from utils.strategy_utils import IndicatorCalculation, CustomAnalyzer, MyBuySell
+from utils.strategy_utils import CustomAnalyzer, MyBuySell
+from utils.indicators import compute_indicators, IndicatorState, INDICATORS_PERIOD
+from utils.grid_engine import simulate_grid, grid_analysis, PROGRESS_EVERY
+from utils.sweep import sweep_parameter_sets, run_sweep
+from utils.monte_carlo import relative_candles, run_monte_carlo, summarize
+from utils.kline_cache import KlineCache, Klines, klines_to_array, OHLCV_COLUMNS
+from utils.plotting import ChartData, fill_marks
+from utils.metrics import StageTimer
+from utils.grid_config import (KLINES_INTERVAL, KLINES_BASE_INTERVAL, TIMEFRAMES, GRID_PARAMS, interval_to_ms,
+                               data_range_ms)
+from utils.ledger import TradeLedger, remove_ledger, EVENT_PLACED, EVENT_REPLACED, EVENT_CANCELED, SIDE_BUY, \
+    SIDE_SELL
 
 
 class GridStrategy(bt.Strategy):
@@ -19,7 +30,10 @@ class GridStrategy(bt.Strategy):
         ('atr_values', None),
         ('deposit', 0),
         ('weeks', 0),
-        ('log_buffer', None)
+        ('ledger', None),
+        ('recenters', None),
+        ('on_progress', None),
+        *GRID_PARAMS.items()
     )
 
     def __init__(self):
@@ -28,37 +42,73 @@ class GridStrategy(bt.Strategy):
         self.atr_values = self.params.atr_values
         self.deposit = self.params.deposit
         self.weeks_n = self.params.weeks
-        self.levels = None
+        self.buy_levels = []
+        self.sell_levels = []
         self.stop_loss = 0
         self.take_profit = 0
         self.stop_or_take_hit = False
         self.position_size = 0
         self.quantity_per_order = 0
-        self.orders = set()
+        self.sell_order_levels = {}
+        self.grid_armed = False
         self.grid_num = 0
         self.orders_executed = 0
-        self.log_buffer = self.params.log_buffer
+        self.ledger = self.params.ledger
+        self.recenters = self.params.recenters or {}
 
-    def log(self, message):
-        self.log_buffer.write((message + '\n').encode('utf-8'))
+    def record(self, event: int, side: int, level: int, price: float, size: float) -> None:
+        """Запис ордера сітки в журнал на поточному барі"""
+        if self.ledger is not None:
+            self.ledger.record(len(self) - 1, event, side, level, price, size)
 
     def nextstart(self):
         lower_bound, upper_bound = self._calculate_range()
-        self.levels = list(zip(*self._calculate_grid_levels(lower_bound, upper_bound)))
+        self.buy_levels, self.sell_levels = self._calculate_grid_levels(lower_bound, upper_bound,
+                                                                        self.p.step_percentage,
+                                                                        self.p.profit_percentage)
         self.position_size = self.deposit / self.grid_num
 
+    def _place_level(self, level: int, size: float) -> None:
+        """Bracket з buy та sell StopLimit ордерів на рівні сітки; sell запам'ятовується за ref"""
+        buy_order = self.buy(price=self.buy_levels[level], size=size, exectype=bt.Order.StopLimit, transmit=False)
+        buy_order.addinfo(level=level)
+        sell_order = self.sell(price=self.sell_levels[level], size=buy_order.size, exectype=bt.Order.StopLimit,
+                               parent=buy_order)
+        self.sell_order_levels[sell_order.ref] = level
+
+    def _recenter(self, buy_levels: list[float], sell_levels: list[float], stop_loss: float,
+                  take_profit: float) -> None:
+        """Перецентрування сітки (walk-forward).
+
+        Невиконані покупки скасовуються разом з їх sell; продажі вже куплених лотів лишаються на своїх цінах,
+        але після виконання не перевиставляються. Нова сітка виставляється в цьому ж next.
+        """
+        for order in self.broker.get_orders_open():
+            if order.isbuy() and 'level' in order.info:
+                self.cancel(order)
+                self.record(EVENT_CANCELED, SIDE_BUY, order.info.level, order.price, order.size)
+        self.sell_order_levels = dict.fromkeys(self.sell_order_levels)
+        self.buy_levels, self.sell_levels = buy_levels, sell_levels
+        self.grid_num = len(buy_levels)
+        self.stop_loss, self.take_profit = stop_loss, take_profit
+        self.position_size = self.deposit / self.grid_num
+        self.grid_armed = False
+        self.stop_or_take_hit = False
+
     def next(self):
+        if self.p.on_progress is not None and not (len(self) - 1) % PROGRESS_EVERY:
+            self.p.on_progress(len(self) - 1, self.data.buflen())
         data = self.data[0]
-        if not self.stop_or_take_hit:
+        if len(self) - 1 in self.recenters:
+            self._recenter(*self.recenters[len(self) - 1])
+        if not self.grid_armed and not self.stop_or_take_hit:
+            # сітка виставляється один раз, далі рівні відновлюються лише в notify_order
             self.quantity_per_order = self.position_size / data
-            for buy_price, sell_price in self.levels:
-                if buy_price not in self.orders:
-                    buy_order = self.buy(price=buy_price, size=self.quantity_per_order, exectype=bt.Order.StopLimit,
-                                         transmit=False)
-                    self.sell(price=sell_price, size=buy_order.size, exectype=bt.Order.StopLimit, parent=buy_order)
-                    self.orders.add(buy_price)
-                    self.log(f"New buy order at {buy_price} for {self.quantity_per_order} units.")
-                    self.log(f"New sell order at {sell_price} for {self.quantity_per_order} units.")
+            for level in range(self.grid_num):
+                self._place_level(level, self.quantity_per_order)
+                self.record(EVENT_PLACED, SIDE_BUY, level, self.buy_levels[level], self.quantity_per_order)
+                self.record(EVENT_PLACED, SIDE_SELL, level, self.sell_levels[level], self.quantity_per_order)
+            self.grid_armed = True
         if data <= self.stop_loss or data >= self.take_profit:
             self.close()
             for order in self.broker.get_orders_open():
@@ -66,91 +116,173 @@ class GridStrategy(bt.Strategy):
             self.stop_or_take_hit = True
 
     def notify_order(self, order: Order) -> None:
-        if order.status == order.Completed and order.issell() and not self.stop_or_take_hit:
-            buy_price, sell_price = next((b, s) for b, s in self.levels if s == order.price)
-            new_buy_order = self.buy(price=buy_price, size=order.size, exectype=bt.Order.StopLimit,
-                                     transmit=False)
-            self.sell(price=sell_price,
-                      size=new_buy_order.size, exectype=bt.Order.StopLimit, parent=new_buy_order)
-            self.orders_executed += 1
-            self.log(
-                f"Buy order at {buy_price} executed. New buy order placed at {buy_price} for {-order.size} units.",
-            )
-            self.log(
-                f"New sell order placed at {sell_price} for {order.size} units.")
+        if not order.issell() or order.status not in (order.Completed, order.Canceled, order.Margin, order.Rejected):
+            return
+        if order.ref not in self.sell_order_levels:
+            return
+        level = self.sell_order_levels.pop(order.ref)
+        if order.status != order.Completed or self.stop_or_take_hit:
+            return
+        self.orders_executed += 1
+        # рівні старої сітки та продажі на барі перецентрування не перевиставляються
+        if level is not None and len(self) - 1 not in self.recenters:
+            self._place_level(level, -order.size)
+            self.record(EVENT_REPLACED, SIDE_BUY, level, self.buy_levels[level], -order.size)
+            self.record(EVENT_REPLACED, SIDE_SELL, level, self.sell_levels[level], -order.size)
 
     def _calculate_range(self) -> tuple[float, float]:
         """Розрахунок діапазону стратегії"""
-        current_rsi = fmean(self.rsi_values)
-        _, bb_top, bb_bot = self.bollinger_bands_values[-1]
-        current_atr = self.atr_values[-1]
-        data = self.data.close[0]
-        STOP_PERCENT = 0.03
-        TAKE_PERCENT = 0.06
-        lower_bound = data - 2 * current_atr
-        upper_bound = data + 2 * current_atr
-
-        if current_rsi < 30:
+        lower_bound, upper_bound, self.stop_loss, self.take_profit = self.calculate_range(
+            self.data.close[0], self.rsi_values, self.bollinger_bands_values, self.atr_values, self.weeks_n,
+            stop_percent=self.p.stop_percent,
+            take_percent=self.p.take_percent,
+            atr_multiplier=self.p.atr_multiplier,
+            rsi_atr_multiplier=self.p.rsi_atr_multiplier,
+            rsi_lower=self.p.rsi_lower,
+            rsi_upper=self.p.rsi_upper)
+        return lower_bound, upper_bound
+
+    @staticmethod
+    def calculate_range(data: float,
+                        rsi_values,
+                        bollinger_bands_values,
+                        atr_values,
+                        weeks_n: int,
+                        stop_percent: float = GRID_PARAMS['stop_percent'],
+                        take_percent: float = GRID_PARAMS['take_percent'],
+                        atr_multiplier: float = GRID_PARAMS['atr_multiplier'],
+                        rsi_atr_multiplier: float = GRID_PARAMS['rsi_atr_multiplier'],
+                        rsi_lower: float = GRID_PARAMS['rsi_lower'],
+                        rsi_upper: float = GRID_PARAMS['rsi_upper']) -> tuple[float, float, float, float]:
+        """Розрахунок діапазону, стоп-лосу та тейк-профіту від ціни закриття першого бару.
+
+        Діапазон - atr_multiplier ATR в обидва боки; при перепроданості/перекупленості по RSI
+        очікуваний бік розвороту розширюється на rsi_atr_multiplier ATR, інший - на 1 ATR.
+        """
+        current_rsi = float(np.mean(rsi_values))
+        _, bb_top, bb_bot = map(float, bollinger_bands_values[-1])
+        current_atr = float(atr_values[-1])
+        data = float(data)
+        lower_bound = data - atr_multiplier * current_atr
+        upper_bound = data + atr_multiplier * current_atr
+
+        if current_rsi < rsi_lower:
             lower_bound -= current_atr
-            upper_bound += 2 * current_atr
-        elif current_rsi > 70:
-            lower_bound -= 2 * current_atr
+            upper_bound += rsi_atr_multiplier * current_atr
+        elif current_rsi > rsi_upper:
+            lower_bound -= rsi_atr_multiplier * current_atr
             upper_bound += current_atr
 
         distance_to_top = bb_top - data
         distance_to_bot = data - bb_bot
 
-        multiplier = 1 + 0.01 * self.weeks_n
+        multiplier = 1 + 0.01 * weeks_n
         lower_bound -= distance_to_bot * 0.5
         upper_bound += distance_to_top * 0.5
 
         upper_bound *= multiplier
         lower_bound /= multiplier
 
-        self.stop_loss = lower_bound * (1 - STOP_PERCENT)
-        self.take_profit = upper_bound * (1 + TAKE_PERCENT)
-        return lower_bound, upper_bound
+        stop_loss = lower_bound * (1 - stop_percent)
+        take_profit = upper_bound * (1 + take_percent)
+        return lower_bound, upper_bound, stop_loss, take_profit
 
     def _calculate_grid_levels(self,
                                lower_bound: float,
                                upper_bound: float,
-                               step_percentage: float = 0.02,
-                               profit_percentage: float = 0.03) -> tuple[list[float], list[float]]:
+                               step_percentage: float = GRID_PARAMS['step_percentage'],
+                               profit_percentage: float = GRID_PARAMS['profit_percentage']
+                               ) -> tuple[list[float], list[float]]:
         """Розрахунок рівнів сітки"""
+        buy_levels, sell_levels = self.calculate_grid_levels(lower_bound, upper_bound,
+                                                             step_percentage, profit_percentage)
+        self.grid_num = len(buy_levels)
+        return buy_levels, sell_levels
+
+    @staticmethod
+    def calculate_grid_levels(lower_bound: float,
+                              upper_bound: float,
+                              step_percentage: float = GRID_PARAMS['step_percentage'],
+                              profit_percentage: float = GRID_PARAMS['profit_percentage']
+                              ) -> tuple[list[float], list[float]]:
+        """Рівні купівлі та продажу сітки"""
         range_width = upper_bound - lower_bound
         step = range_width * step_percentage
         num_levels = int(range_width / step)
 
         buy_levels = [lower_bound + i * step for i in range(num_levels)]
         sell_levels = [price * (1 + profit_percentage) for price in buy_levels]
-        self.grid_num = len(buy_levels)
         return buy_levels, sell_levels
 
-    def get_log(self):
-        return self.log_buffer
+    @classmethod
+    def grid_from_params(cls,
+                         data: float,
+                         rsi_values,
+                         bollinger_bands_values,
+                         atr_values,
+                         weeks_n: int,
+                         grid_params: dict) -> tuple[list[float], list[float], float, float]:
+        """Рівні купівлі/продажу, стоп-лос і тейк-профіт для набору параметрів GRID_PARAMS"""
+        params = {**GRID_PARAMS, **grid_params}
+        lower_bound, upper_bound, stop_loss, take_profit = cls.calculate_range(
+            data, rsi_values, bollinger_bands_values, atr_values, weeks_n,
+            stop_percent=params['stop_percent'],
+            take_percent=params['take_percent'],
+            atr_multiplier=params['atr_multiplier'],
+            rsi_atr_multiplier=params['rsi_atr_multiplier'],
+            rsi_lower=params['rsi_lower'],
+            rsi_upper=params['rsi_upper'])
+        buy_levels, sell_levels = cls.calculate_grid_levels(lower_bound, upper_bound,
+                                                            params['step_percentage'], params['profit_percentage'])
+        return buy_levels, sell_levels, stop_loss, take_profit
+
+    def get_ledger(self):
+        return self.ledger
 
 
 class Controller:
     """Контролер для управління процесом бектестування."""
-    def __init__(self, start_date: str, end_date: str, symbol: str, deposit: int, api_key, secret_key):
+    def __init__(self, start_date: str, end_date: str, symbol: str, deposit: int, api_key, secret_key,
+                 grid_params: dict | None = None, frames: tuple[DataFrame, DataFrame] | None = None,
+                 interval: str = KLINES_INTERVAL, recenter_days: int | None = None):
+        """frames - готові (df_indicators, df_strategy) замість завантаження з Binance (офлайн прогони, бенчмарки);
+        interval - таймфрейм симуляції з TIMEFRAMES або базовий 1m;
+        recenter_days - walk-forward: сітка перераховується від ковзних індикаторів кожні recenter_days днів.
+        """
+        if interval not in (*TIMEFRAMES, KLINES_BASE_INTERVAL):
+            raise ValueError(f'Unknown interval: {interval}')
+        if recenter_days is not None and recenter_days < 1:
+            raise ValueError(f'recenter_days must be positive: {recenter_days}')
+        unknown_params = set(grid_params or {}) - set(GRID_PARAMS)
+        if unknown_params:
+            raise ValueError(f'Unknown grid params: {", ".join(sorted(unknown_params))}')
+        self.grid_params = {**GRID_PARAMS, **(grid_params or {})}
+        self.timer = StageTimer()
+        self.stats: dict[str, int] = {}
         self.api_key = api_key
         self.api_secret = secret_key
         self.start_date = start_date
         self.end_date = end_date
         self.symbol = symbol
         self.deposit = deposit
-        self.data_indicators, self.data_strategy = self._prepare_test_data()
+        self.interval = interval
+        self.recenter_days = recenter_days
+        with self.timer.stage('load_data'):
+            self.df_indicators, self.data_strategy = self._prepare_test_data(frames)
 
-    def _prepare_test_data(self) -> tuple[PandasData, PandasData]:
+    def _prepare_test_data(self, frames: tuple[DataFrame, DataFrame] | None = None) -> tuple[DataFrame, PandasData]:
         """Підготовка даних"""
-        df_indicators, df_strategy = self._fetch_historical_data(self.api_key,
-                                                                self.api_secret,
-                                                                self.symbol,
-                                                                self.start_date,
-                                                                self.end_date)
-        data_indicators = self._dataframe_to_backtrader(df_indicators)
+        if frames is not None:
+            df_indicators, df_strategy = frames
+        else:
+            df_indicators, df_strategy = self._fetch_historical_data(self.api_key,
+                                                                    self.api_secret,
+                                                                    self.symbol,
+                                                                    self.start_date,
+                                                                    self.end_date,
+                                                                    self.interval)
         data_strategy = self._dataframe_to_backtrader(df_strategy)
-        return data_indicators, data_strategy
+        return df_indicators, data_strategy
 
     def _calculate_range_weeks(self) -> int:
         """Розрахунок кількісті тижнів в діапазоні"""
@@ -160,29 +292,88 @@ class Controller:
         weeks_difference = days_difference // 7
         return max(1, weeks_difference)
 
+    def _grid_weeks(self) -> int:
+        """Горизонт сітки в тижнях: весь діапазон, або одне вікно walk-forward"""
+        if self.recenter_days:
+            return max(1, self.recenter_days // 7)
+        return self._calculate_range_weeks()
+
+    def _recenter_schedule(self) -> dict[int, tuple[list[float], list[float], float, float]]:
+        """Сітки walk-forward за індексом бару перецентрування.
+
+        Індикатори дораховуються інкрементально вікно за вікном (IndicatorState), тож увесь розклад коштує один
+        прохід по барах; середній RSI береться за ковзне вікно тієї ж довжини, що й розігрів.
+        """
+        if not self.recenter_days:
+            return {}
+        df_strategy = self.data_strategy.p.dataname
+        timestamps = self._strategy_timestamps()
+        step_ms = self.recenter_days * 24 * 60 * 60 * 1000
+        boundaries = np.arange(timestamps[0] + step_ms, timestamps[-1] + 1, step_ms) if len(timestamps) else []
+        # бар 0 - розрахунок початкової сітки, бар 1 - її виставлення
+        bars = [bar for bar in np.unique(np.searchsorted(timestamps, boundaries)).tolist() if 1 < bar < len(timestamps)]
+        if not bars:
+            return {}
+        warm_up = len(self.df_indicators)
+        high, low, close = (np.r_[self.df_indicators[column].to_numpy(), df_strategy[column].to_numpy()]
+                            for column in ('high', 'low', 'close'))
+        rsi_history = np.empty(len(close))
+        rsi_window = max(1, warm_up - INDICATORS_PERIOD)
+        state = IndicatorState()
+        schedule = {}
+        done = 0
+        for bar in bars:
+            end = warm_up + bar + 1
+            rsi_values, bb_values, atr_values = state.update(high[done:end], low[done:end], close[done:end])
+            rsi_history[done:end] = rsi_values
+            done = end
+            schedule[bar] = GridStrategy.grid_from_params(close[end - 1], rsi_history[end - rsi_window:end],
+                                                          bb_values, atr_values, self._grid_weeks(), self.grid_params)
+        return schedule
+
+    data_range_ms = staticmethod(data_range_ms)
+
     @staticmethod
     def _fetch_historical_data(api_key: str,
                               api_secret: str,
                               symbol: str,
                               start_date: str,
-                              end_date: str) -> tuple[DataFrame, DataFrame]:
-        """Взяття історичних данних і приведення їх до потрібної форми"""
-        indicators_start_date = (pd.to_datetime(start_date) - pd.Timedelta(weeks=2)).strftime('%Y-%m-%d')
-        client = Client(api_key, api_secret)
-        klines_combined = client.get_historical_klines(symbol, Client.KLINE_INTERVAL_1HOUR, indicators_start_date,
-                                                       end_date)
-
-        df_combined = pd.DataFrame(klines_combined, columns=['timestamp', 'open', 'high',
-                                                             'low', 'close', 'volume',
-                                                             'close_time', 'quote_asset_volume', 'number_of_trades',
-                                                             'taker_buy_base', 'taker_buy_quote', 'ignore'])
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df_combined[col] = pd.to_numeric(df_combined[col])
-        df_combined['timestamp'] = pd.to_datetime(df_combined['timestamp'], unit='ms')
-        df_combined.set_index('timestamp', inplace=True)
-        df_indicators = df_combined[df_combined.index < start_date]
-        df_strategy = df_combined[df_combined.index >= start_date]
-        return df_indicators, df_strategy
+                              end_date: str,
+                              interval: str = KLINES_INTERVAL) -> tuple[DataFrame, DataFrame]:
+        """Взяття історичних данних (з локального кешу, докачуючи відсутнє) і приведення їх до потрібної форми.
+
+        З Binance береться лише базова 1m серія, бари interval агрегуються з неї локально.
+        """
+        indicators_start_ms, end_ms = Controller.data_range_ms(start_date, end_date, interval)
+
+        def fetch(fetch_start_ms: int, fetch_end_ms: int):
+            client = Client(api_key, api_secret)
+            return klines_to_array(client.get_historical_klines(symbol, KLINES_BASE_INTERVAL,
+                                                                fetch_start_ms, fetch_end_ms))
+
+        base_interval_ms = interval_to_ms(KLINES_BASE_INTERVAL)
+        if interval == KLINES_BASE_INTERVAL:
+            klines_combined = KlineCache().get_or_fetch(symbol, interval, indicators_start_ms, end_ms,
+                                                        base_interval_ms, fetch)
+        else:
+            klines_combined = KlineCache().get_or_resample(symbol, interval, indicators_start_ms, end_ms,
+                                                           interval_to_ms(interval),
+                                                           KLINES_BASE_INTERVAL, base_interval_ms, fetch)
+        return Controller._klines_to_frames(klines_combined, start_date)
+
+    @staticmethod
+    def _klines_to_frames(klines: Klines, start_date: str) -> tuple[DataFrame, DataFrame]:
+        """Колонки свічок -> (df_indicators, df_strategy), розділені за індексом першого бару start_date.
+
+        OHLCV не копіюються: обидва фрейми - подання одного блоку над масивом кешу (лише для читання),
+        індекс - час відкриття int64, переглянутий як datetime64[ms].
+        """
+        timestamps = np.asarray(klines.timestamps)
+        split = int(np.searchsorted(timestamps, np.datetime64(start_date, 'ms').astype(np.int64)))
+        df_combined = pd.DataFrame(np.asarray(klines.ohlcv).T, columns=list(OHLCV_COLUMNS),
+                                   index=pd.DatetimeIndex(timestamps.view('datetime64[ms]'), name='timestamp'),
+                                   copy=False)
+        return df_combined.iloc[:split], df_combined.iloc[split:]
 
     @staticmethod
     def _dataframe_to_backtrader(dataframe: DataFrame) -> PandasData:
@@ -198,15 +389,10 @@ class Controller:
         return datafeed
 
     def _compute_indicators(self) -> None:
-        """Запуск cerebro для розрахунку індикаторів"""
-        cerebro = bt.Cerebro()
-        cerebro.adddata(self.data_indicators)
-        cerebro.addstrategy(IndicatorCalculation)
-        results = cerebro.run()
-        strategy_instance = results[0]
-        self.rsi_values = strategy_instance.get_rsi_values()
-        self.bb_v = strategy_instance.get_bollinger_bands_values()
-        self.atr_v = strategy_instance.get_atr_values()
+        """Векторний розрахунок індикаторів на даних до старту тестування"""
+        self.rsi_values, self.bb_v, self.atr_v = compute_indicators(self.df_indicators['high'].to_numpy(),
+                                                                    self.df_indicators['low'].to_numpy(),
+                                                                    self.df_indicators['close'].to_numpy())
 
     @staticmethod
     def _calculate_drawdown(analyzer):
@@ -215,40 +401,26 @@ class Controller:
         return {'Max drawdown (%)': max_dd,
                 'Max drawdown ($)': max_md}
 
-    @staticmethod
-    def _saveplots(cerebro, numfigs=1, iplot=True, start=None, end=None,
-                  width=16, height=9, dpi=300, tight=True, use=None, file_path='', **kwargs):
+    def _strategy_timestamps(self) -> np.ndarray:
+        """Час відкриття барів тестування в мс"""
+        return self.data_strategy.p.dataname.index.to_numpy().astype('datetime64[ms]').astype(np.int64)
 
-        from backtrader import plot
-        if cerebro.p.oldsync:
-            plotter = plot.Plot_OldSync(**kwargs)
-        else:
-            plotter = plot.Plot(**kwargs)
-
-        figs = []
-        for stratlist in cerebro.runstrats:
-            for si, strat in enumerate(stratlist):
-                rfig = plotter.plot(strat, figid=si * 100,
-                                    numfigs=numfigs, iplot=iplot,
-                                    start=start, end=end, use=use)
-                figs.append(rfig)
-
-        # for fig in figs:
-        #     for f in fig:
-        #         f.savefig(file_path, bbox_inches='tight')
-        # return figs
-        images_bytes = []
-        for fig in figs:
-            for f in fig:
-                buf = io.BytesIO()
-                f.savefig(buf, format='png', bbox_inches='tight')
-                images_bytes.append(buf)
-        return images_bytes[-1]
-
-    def _run_strategy(self) -> tuple[dict[str, float], io.BytesIO, io.BytesIO]:
+    def _chart_data(self, values, buys, sells) -> ChartData:
+        """Дані для графіку, який малюється окремо і лише на запит"""
+        df_strategy = self.data_strategy.p.dataname
+        n = len(df_strategy)
+        # буфери ліній backtrader бувають попередньо розширені, тому обрізаються до кількості барів
+        return ChartData(self._strategy_timestamps(),
+                         df_strategy[['open', 'high', 'low', 'close']].to_numpy().T,
+                         np.asarray(buys, dtype=np.float64)[:n],
+                         np.asarray(sells, dtype=np.float64)[:n],
+                         np.asarray(values, dtype=np.float64)[:n])
+
+    def _run_strategy(self,
+                      ledger: TradeLedger,
+                      on_progress: Callable[[int, int], None] | None = None) -> tuple[dict[str, float], ChartData]:
         """Запуск основної стратегії"""
-        order_buff = io.BytesIO()
-        weeks_n = self._calculate_range_weeks()
+        weeks_n = self._grid_weeks()
         cerebro = bt.Cerebro(stdstats=False)
         cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_stats")
         cerebro.addanalyzer(bt.analyzers.DrawDown, _name="dd")
@@ -260,19 +432,129 @@ class Controller:
                             atr_values=self.atr_v,
                             deposit=self.deposit,
                             weeks=weeks_n,
-                            log_buffer=order_buff)
+                            ledger=ledger,
+                            recenters=self._recenter_schedule(),
+                            on_progress=on_progress,
+                            **self.grid_params)
         cerebro.addobserver(MyBuySell, bardist=0)
         cerebro.addobserver(bt.observers.Broker)
         cerebro.broker.setcash(self.deposit)
         results = cerebro.run()[0]
+        self.stats['grid_levels'] = results.grid_num
         analysis = results.analyzers.customanalyzer.get_analysis()
         drawdown_info = results.analyzers.dd.get_analysis()
         analysis.update(self._calculate_drawdown(drawdown_info))
-        plot_buff = self._saveplots(cerebro, file_path='plot.png', style='candlestick')
-        return analysis, plot_buff, order_buff
+        chart = self._chart_data(results.observers.broker.lines.value.array,
+                                 results.observers.mybuysell.lines.buy.array,
+                                 results.observers.mybuysell.lines.sell.array)
+        return analysis, chart
+
+    def _run_fast_strategy(self,
+                           ledger: TradeLedger,
+                           on_progress: Callable[[int, int], None] | None = None) -> tuple[dict[str, float], ChartData]:
+        """Запуск основної стратегії на швидкому симуляторі сітки"""
+        fills = []
+        df_strategy = self.data_strategy.p.dataname
+        buy_levels, sell_levels, stop_loss, take_profit = GridStrategy.grid_from_params(
+            df_strategy['close'].iloc[0], self.rsi_values, self.bb_v, self.atr_v, self._grid_weeks(),
+            self.grid_params)
+        self.stats['grid_levels'] = len(buy_levels)
+        values, orders_executed = simulate_grid(df_strategy['open'].to_numpy(),
+                                                df_strategy['high'].to_numpy(),
+                                                df_strategy['low'].to_numpy(),
+                                                df_strategy['close'].to_numpy(),
+                                                buy_levels,
+                                                sell_levels,
+                                                stop_loss,
+                                                take_profit,
+                                                self.deposit,
+                                                ledger=ledger,
+                                                fills=fills,
+                                                recenters=self._recenter_schedule(),
+                                                on_progress=on_progress)
+        chart = self._chart_data(values, *fill_marks(len(values), fills))
+        return grid_analysis(values, self.deposit, orders_executed), chart
+
+    def run(self,
+            engine: str = 'backtrader',
+            on_progress: Callable[[int, int], None] | None = None) -> tuple[dict[str, float], ChartData, str]:
+        """Запуск роботи індикаторів та основної стратегії.
+
+        engine: 'backtrader' - повний прогін cerebro, 'fast' - швидкий симулятор сітки.
+        Графік не малюється: повертаються дані для render_chart. Ордери пишуться в журнал у тимчасовому файлі,
+        повертається шлях до нього (див. utils.ledger.format_ledger).
+        Тривалості етапів записуються в self.timer, кількість барів, рівнів сітки та ордерів - в self.stats.
+        on_progress(оброблено барів, всього) викликається під час симуляції (див. utils.job_control.checkpoint).
+        """
+        if engine not in ('backtrader', 'fast'):
+            raise ValueError(f'Unknown engine: {engine}')
+        with self.timer.stage('indicators'):
+            self._compute_indicators()
+        ledger = TradeLedger(self._strategy_timestamps())
+        try:
+            with ledger, self.timer.stage('strategy'):
+                if engine == 'fast':
+                    analysis, chart = self._run_fast_strategy(ledger, on_progress)
+                else:
+                    analysis, chart = self._run_strategy(ledger, on_progress)
+        except BaseException:
+            remove_ledger(ledger.path)
+            raise
+        self.stats.update(bars=len(self.data_strategy.p.dataname), orders=analysis['Total Trades'])
+        return analysis, chart, ledger.path
+
+    def sweep(self,
+              param_grid: dict[str, list],
+              n_random: int | None = None,
+              max_workers: int | None = None,
+              seed: int = 0) -> DataFrame:
+        """Перебір параметрів сітки на всіх ядрах швидким симулятором.
+
+        param_grid - значення для кожного з GRID_PARAMS; n_random - кількість випадкових комбінацій
+        замість повного перебору. Дані та індикатори рахуються один раз і передаються воркерам лише при старті.
+        Повертає таблицю результатів, відсортовану за прибутком.
+        """
+        unknown_params = set(param_grid) - set(GRID_PARAMS)
+        if unknown_params:
+            raise ValueError(f'Unknown grid params: {", ".join(sorted(unknown_params))}')
+        if self.recenter_days:
+            raise ValueError('Sweep does not support walk-forward (recenter_days)')
+        self._compute_indicators()
+        df_strategy = self.data_strategy.p.dataname
+        parameter_sets = sweep_parameter_sets(param_grid, n_random, seed)
+        results = run_sweep(parameter_sets,
+                            df_strategy[['open', 'high', 'low', 'close']].to_numpy().T,
+                            self.rsi_values, self.bb_v, self.atr_v,
+                            self.deposit, self._calculate_range_weeks(), max_workers)
+        table = DataFrame([{**{**self.grid_params, **params}, **analysis}
+                           for params, analysis in zip(parameter_sets, results)])
+        return table.sort_values('Profit/Loss (%)', ascending=False, ignore_index=True)
+
+    def monte_carlo(self,
+                    n_paths: int = 1000,
+                    block_bars: int = 24,
+                    seed: int = 0,
+                    on_progress: Callable[[int, int], None] | None = None) -> dict:
+        """Перевірка стійкості сітки методом Монте-Карло без cerebro.
 
-    def run(self) -> tuple[dict[str, float], io.BytesIO, io.BytesIO]:
-        """Запуск роботи індикаторів та основної стратегії"""
+        З усіх завантажених свічок (індикаторне вікно та період тестування) блочним бутстрепом генерується
+        n_paths шляхів довжиною з період тестування, сітка від першого бару симулюється на всіх шляхах
+        одним векторним прогоном (див. utils.grid_engine.simulate_grid_paths).
+        Повертає перцентилі P/L та просідання і ймовірності збитку, stop_loss і take_profit
+        (utils.monte_carlo.summarize).
+        """
+        if self.recenter_days:
+            raise ValueError('Monte Carlo does not support walk-forward (recenter_days)')
+        if n_paths < 1 or block_bars < 1:
+            raise ValueError(f'n_paths and block_bars must be positive: {n_paths}, {block_bars}')
         self._compute_indicators()
-        data = self._run_strategy()
-        return data
+        df_strategy = self.data_strategy.p.dataname
+        columns = ['open', 'high', 'low', 'close']
+        history = np.concatenate([self.df_indicators[columns].to_numpy(), df_strategy[columns].to_numpy()]).T
+        buy_levels, sell_levels, stop_loss, take_profit = GridStrategy.grid_from_params(
+            df_strategy['close'].iloc[0], self.rsi_values, self.bb_v, self.atr_v, self._calculate_range_weeks(),
+            self.grid_params)
+        results = run_monte_carlo(relative_candles(*history), tuple(df_strategy[columns].iloc[0]), len(df_strategy),
+                                  buy_levels, sell_levels, stop_loss, take_profit, self.deposit,
+                                  n_paths, block_bars, seed, on_progress)
+        return {**summarize(results, self.deposit), 'bars': len(df_strategy), 'block_bars': block_bars}
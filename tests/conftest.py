@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Модулі проєкту (strategy, utils, benchmarks) імпортуються з кореня репозиторію
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: порівняння швидкодії з benchmarks/baseline.json '
+                                       '(пропустити: -m "not benchmark")')
@@ -0,0 +1,15 @@
+"""Регресії швидкодії та пам'яті етапів бектесту відносно benchmarks/baseline.json (як python -m benchmarks.pipeline)."""
+import json
+import pytest
+from benchmarks.pipeline import BASELINE_PATH, compare, run_case
+
+pytestmark = pytest.mark.benchmark
+
+
+# 2y не входить: на ньому прогін займає хвилини, його перевіряє лише python -m benchmarks.pipeline
+@pytest.mark.parametrize('case', ['1w', '3m'])
+def test_pipeline_stages_within_baseline(case):
+    with open(BASELINE_PATH) as file:
+        baseline = json.load(file)
+    results = {case: run_case(case, repeat=2, volatility=0.006, seed=0)}
+    assert compare(results, baseline, time_tolerance=1.5, memory_tolerance=1.25) == []
@@ -0,0 +1,114 @@
+"""Паритет швидкого симулятора сітки з backtrader та пакетного симулятора з покроковим."""
+import numpy as np
+import pytest
+import utils.grid_engine as grid_engine
+from benchmarks.synthetic import synthetic_frames, synthetic_ohlcv
+from strategy import Controller, GridStrategy
+from utils.grid_engine import simulate_grid, simulate_grid_paths, grid_analysis
+from utils.ledger import read_ledger, remove_ledger, EVENT_CANCELED
+
+START_DATE, END_DATE = '2023-01-01', '2023-02-01'
+# Сітка зміщена вгору від ціни старту, продажі не досягаються: покупки упираються у кеш (margin)
+MARGIN_PARAMS = {'rsi_lower': 100, 'rsi_atr_multiplier': 6, 'profit_percentage': 1.0, 'take_percent': 5.0,
+                 'stop_percent': 0.5}
+
+
+@pytest.fixture
+def margin_rejections(monkeypatch) -> list[int]:
+    """Лічильник покупок, відхилених швидким симулятором через нестачу кешу"""
+    rejections = [0]
+    execute_cash = grid_engine._execute_cash
+
+    def counting(*args):
+        cash, enough_cash = execute_cash(*args)
+        rejections[0] += not enough_cash
+        return cash, enough_cash
+
+    monkeypatch.setattr(grid_engine, '_execute_cash', counting)
+    return rejections
+
+
+def run_both(frames, grid_params: dict | None = None, recenter_days: int | None = None) -> dict:
+    """Прогін обох рушіїв на однакових даних: результат, графік та журнал кожного"""
+    runs = {}
+    for engine in ('backtrader', 'fast'):
+        controller = Controller(START_DATE, END_DATE, 'SYNTHETIC', 1000, None, None, grid_params=grid_params,
+                                frames=frames, recenter_days=recenter_days)
+        analysis, chart, ledger_path = controller.run(engine)
+        try:
+            runs[engine] = analysis, chart, read_ledger(ledger_path), controller
+        finally:
+            remove_ledger(ledger_path)
+    return runs
+
+
+def assert_parity(runs: dict) -> None:
+    (analysis, chart, ledger, _), (fast_analysis, fast_chart, fast_ledger, _) = runs['backtrader'], runs['fast']
+    assert analysis.keys() == fast_analysis.keys()
+    for key, value in analysis.items():
+        assert fast_analysis[key] == pytest.approx(value, abs=1e-6), key
+    assert np.array_equal(ledger, fast_ledger)
+    np.testing.assert_allclose(fast_chart.values, chart.values, rtol=1e-9)
+    np.testing.assert_array_equal(np.isnan(fast_chart.buys), np.isnan(chart.buys))
+    np.testing.assert_array_equal(np.isnan(fast_chart.sells), np.isnan(chart.sells))
+
+
+def grid_limits(frames, controller: Controller) -> tuple[float, float]:
+    _, _, stop_loss, take_profit = GridStrategy.grid_from_params(
+        frames[1]['close'].iloc[0], controller.rsi_values, controller.bb_v, controller.atr_v,
+        controller._grid_weeks(), controller.grid_params)
+    return stop_loss, take_profit
+
+
+@pytest.mark.parametrize('volatility, seed', [(0.004, 0), (0.01, 1), (0.02, 0)])
+def test_fast_engine_matches_backtrader(volatility, seed):
+    frames = synthetic_frames(START_DATE, END_DATE, volatility, seed)
+    runs = run_both(frames)
+    assert runs['fast'][0]['Total Trades'] > 0
+    assert_parity(runs)
+
+
+def test_fast_engine_matches_backtrader_on_stop_and_take():
+    frames = synthetic_frames(START_DATE, END_DATE, 0.02, 0)
+    runs = run_both(frames)
+    stop_loss, take_profit = grid_limits(frames, runs['fast'][3])
+    close = frames[1]['close'].to_numpy()
+    assert (close <= stop_loss).any() and (close >= take_profit).any()
+    assert_parity(runs)
+
+
+def test_fast_engine_matches_backtrader_on_margin(margin_rejections):
+    frames = synthetic_frames(START_DATE, END_DATE, 0.02, 0)
+    runs = run_both(frames, grid_params=MARGIN_PARAMS)
+    assert margin_rejections[0] > 0
+    assert_parity(runs)
+
+
+@pytest.mark.parametrize('recenter_days', [3, 7])
+def test_fast_engine_matches_backtrader_with_recentering(recenter_days):
+    frames = synthetic_frames(START_DATE, END_DATE, 0.01, 2)
+    runs = run_both(frames, recenter_days=recenter_days)
+    assert len(runs['fast'][3]._recenter_schedule()) > 1
+    assert (runs['fast'][2]['event'] == EVENT_CANCELED).any()
+    assert_parity(runs)
+
+
+@pytest.mark.parametrize('grid_n, spread, stop, take', [(20, 0.1, 0.8, 1.2),
+                                                        (40, 0.05, 0.9, 1.1),
+                                                        (30, 0.02, 0.0, 1e9)])
+def test_simulate_grid_paths_matches_simulate_grid(grid_n, spread, stop, take):
+    frames = [synthetic_ohlcv(600, volatility=0.006, seed=seed) for seed in range(40)]
+    open_, high, low, close = (np.stack([frame[column].to_numpy() for frame in frames], axis=1)
+                               for column in ('open', 'high', 'low', 'close'))
+    base = 20000
+    # верхні рівні вище ціни старту, тож частина покупок упирається у кеш
+    buy_levels = list(np.linspace(base * (1 - spread), base * (1 + spread * 1.5), grid_n))
+    sell_levels = [price * 1.02 for price in buy_levels]
+    batch = simulate_grid_paths(open_, high, low, close, buy_levels, sell_levels, base * stop, base * take, 1000)
+    for path in range(len(frames)):
+        values, orders_executed = simulate_grid(open_[:, path], high[:, path], low[:, path], close[:, path],
+                                                buy_levels, sell_levels, base * stop, base * take, 1000)
+        analysis = grid_analysis(values, 1000, orders_executed)
+        assert batch['final_value'][path] == pytest.approx(values[-1], abs=1e-6)
+        assert batch['orders_executed'][path] == orders_executed
+        assert round(batch['max_drawdown'][path], 2) == pytest.approx(analysis['Max drawdown (%)'], abs=0.011)
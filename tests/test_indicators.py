@@ -0,0 +1,62 @@
+"""Паритет векторних індикаторів з backtrader та дорахунку IndicatorState з повним перерахунком."""
+import backtrader as bt
+import numpy as np
+import pytest
+from backtrader.feeds import PandasData
+from benchmarks.synthetic import synthetic_ohlcv
+from utils.indicators import INDICATORS_PERIOD, IndicatorState, compute_indicators, rsi, bollinger_bands, atr
+
+
+class BacktraderIndicators(bt.Strategy):
+    """RSI, Bollinger Bands та ATR вбудованими індикаторами backtrader на кожному барі"""
+    def __init__(self):
+        self.rsi = bt.indicators.RSI(self.data.close, period=INDICATORS_PERIOD)
+        self.bollinger_bands = bt.indicators.BollingerBands(self.data.close, period=INDICATORS_PERIOD)
+        self.atr = bt.indicators.ATR(self.data, period=INDICATORS_PERIOD)
+        self.rsi_values, self.bb_values, self.atr_values = [], [], []
+
+    def next(self):
+        self.rsi_values.append(self.rsi[0])
+        self.bb_values.append((self.bollinger_bands.mid[0], self.bollinger_bands.top[0],
+                               self.bollinger_bands.bot[0]))
+        self.atr_values.append(self.atr[0])
+
+
+def backtrader_indicators(frame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(PandasData(dataname=frame, datetime=-1, open=-1, high=-1, low=-1, close=-1, volume=-1,
+                               openinterest=-1))
+    cerebro.addstrategy(BacktraderIndicators)
+    strategy = cerebro.run()[0]
+    return np.array(strategy.rsi_values), np.array(strategy.bb_values), np.array(strategy.atr_values)
+
+
+@pytest.mark.parametrize('n_bars, volatility, seed', [(336, 0.006, 0), (5000, 0.01, 3), (15, 0.006, 1)])
+def test_compute_indicators_matches_backtrader(n_bars, volatility, seed):
+    frame = synthetic_ohlcv(n_bars, volatility=volatility, seed=seed)
+    expected_rsi, expected_bb, expected_atr = backtrader_indicators(frame)
+    rsi_values, bb_values, atr_values = compute_indicators(frame['high'].to_numpy(), frame['low'].to_numpy(),
+                                                           frame['close'].to_numpy())
+    assert len(rsi_values) == len(expected_rsi) == n_bars - INDICATORS_PERIOD
+    np.testing.assert_allclose(rsi_values, expected_rsi, rtol=0, atol=1e-6)
+    np.testing.assert_allclose(bb_values.reshape(-1, 3), expected_bb.reshape(-1, 3), rtol=1e-9)
+    np.testing.assert_allclose(atr_values, expected_atr, rtol=1e-9)
+
+
+@pytest.mark.parametrize('cuts', [(0, 300, 301, 301, 777, 2000, 4999, 5000), (0, 15, 16, 5000)])
+def test_indicator_state_matches_full_recompute(cuts):
+    rng = np.random.default_rng(1)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, cuts[-1])))
+    high, low = close * 1.01, close * 0.99
+    state = IndicatorState()
+    parts = [state.update(high[start:end], low[start:end], close[start:end]) for start, end in zip(cuts, cuts[1:])]
+    for full, incremental in zip((rsi(close), bollinger_bands(close), atr(high, low, close)), zip(*parts)):
+        incremental = np.concatenate(incremental)
+        assert incremental.shape == full.shape
+        np.testing.assert_array_equal(np.isnan(incremental), np.isnan(full))
+        np.testing.assert_allclose(incremental, full, rtol=1e-9, equal_nan=True)
+
+
+def test_indicator_state_first_update_needs_full_window():
+    with pytest.raises(ValueError):
+        IndicatorState().update(np.ones(INDICATORS_PERIOD), np.ones(INDICATORS_PERIOD), np.ones(INDICATORS_PERIOD))
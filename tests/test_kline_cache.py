@@ -0,0 +1,190 @@
+"""Кеш свічок: відсутні діапазони, паралельні записи, агрегація похідних таймфреймів та прогін Controller на ньому."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+import strategy
+import utils.kline_cache as kline_cache
+from strategy import Controller
+from utils.grid_config import WARM_UP_BARS, data_range_ms, interval_to_ms
+from utils.indicators import INDICATORS_PERIOD, NotEnoughBarsError
+from utils.kline_cache import KlineCache, Klines
+from utils.ledger import remove_ledger
+from utils.resample import resample_ohlcv
+
+MINUTE_MS = 60_000
+HOUR_MS = 3_600_000
+DAY_MS = 86_400_000
+START_MS = 1_672_531_200_000  # 2023-01-01
+
+
+def base_klines(start_ms: int, end_ms: int) -> Klines:
+    """Детерміновані 1m свічки з відкриттям в [start_ms, end_ms]"""
+    timestamps = np.arange(start_ms, end_ms + 1, MINUTE_MS, dtype=np.int64)
+    minutes = (timestamps - START_MS) // MINUTE_MS
+    close, open_ = (100 + 10 * np.sin(minute / 700) + 3 * np.sin(minute / 37) for minute in (minutes, minutes - 1))
+    return Klines(timestamps, np.vstack((open_, np.maximum(open_, close) + 0.5, np.minimum(open_, close) - 0.5,
+                                         close, np.ones(len(timestamps)))))
+
+
+def assert_klines_equal(actual: Klines, expected: Klines) -> None:
+    assert actual.timestamps.dtype == np.int64
+    np.testing.assert_array_equal(actual.timestamps, expected.timestamps)
+    np.testing.assert_array_equal(actual.ohlcv, expected.ohlcv)
+
+
+class BaseFetcher:
+    """fetch для кешу: 1m свічки, що вже закрились на момент now_ms, із записом запитаних діапазонів"""
+    def __init__(self, now_ms: int):
+        self.now_ms = now_ms
+        self.calls: list[tuple[int, int]] = []
+
+    def __call__(self, start_ms: int, end_ms: int) -> np.ndarray:
+        self.calls.append((start_ms, end_ms))
+        return base_klines(start_ms, min(end_ms, self.now_ms - MINUTE_MS))
+
+
+@pytest.fixture
+def now(monkeypatch) -> list[int]:
+    """Керований поточний час для закритих свічок кешу"""
+    clock = [START_MS + 30 * DAY_MS]
+    last_closed_open = kline_cache.last_closed_open
+    monkeypatch.setattr(kline_cache, 'last_closed_open',
+                        lambda interval_ms, now_ms=None: last_closed_open(interval_ms, clock[0]))
+    return clock
+
+
+def test_missing_ranges_empty_cache_is_capped_at_last_closed_candle(tmp_path, now):
+    now[0] = START_MS + 10 * HOUR_MS + 30 * MINUTE_MS
+    ranges = KlineCache(str(tmp_path)).missing_ranges('BTCUSDT', '1h', START_MS, START_MS + DAY_MS, HOUR_MS)
+    assert ranges == [(START_MS, START_MS + 9 * HOUR_MS)]
+
+
+def test_missing_ranges_head_and_tail_are_aligned_to_cached_edges(tmp_path, now):
+    cache = KlineCache(str(tmp_path))
+    # невирівняні межі в метаданих: покриття - свічки з відкриттям від START + 2m до START + 10m
+    cache.store('BTCUSDT', '1m', START_MS + 90_000, START_MS + 10 * MINUTE_MS + 30_000,
+                base_klines(START_MS + 2 * MINUTE_MS, START_MS + 10 * MINUTE_MS))
+    ranges = cache.missing_ranges('BTCUSDT', '1m', START_MS, START_MS + 20 * MINUTE_MS, MINUTE_MS)
+    assert ranges == [(START_MS, START_MS + MINUTE_MS), (START_MS + 11 * MINUTE_MS, START_MS + 20 * MINUTE_MS)]
+    assert cache.missing_ranges('BTCUSDT', '1m', START_MS + 3 * MINUTE_MS, START_MS + 9 * MINUTE_MS,
+                                MINUTE_MS) == []
+
+
+def test_get_or_fetch_fills_gaps_without_refetching(tmp_path, now):
+    cache, fetch = KlineCache(str(tmp_path)), BaseFetcher(now[0])
+    cache.get_or_fetch('BTCUSDT', '1m', START_MS + HOUR_MS, START_MS + 2 * HOUR_MS, MINUTE_MS, fetch)
+    klines = cache.get_or_fetch('BTCUSDT', '1m', START_MS, START_MS + 3 * HOUR_MS, MINUTE_MS, fetch)
+    assert fetch.calls == [(START_MS + HOUR_MS, START_MS + 2 * HOUR_MS),
+                           (START_MS, START_MS + HOUR_MS - MINUTE_MS),
+                           (START_MS + 2 * HOUR_MS + MINUTE_MS, START_MS + 3 * HOUR_MS)]
+    assert_klines_equal(klines, base_klines(START_MS, START_MS + 3 * HOUR_MS))
+
+
+def test_concurrent_stores_keep_every_range(tmp_path):
+    cache = KlineCache(str(tmp_path))
+    ranges = [(START_MS + i * HOUR_MS, START_MS + (i + 1) * HOUR_MS - MINUTE_MS) for i in range(16)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda bounds: cache.store('BTCUSDT', '1m', *bounds, base_klines(*bounds)), ranges))
+    assert_klines_equal(cache.select('BTCUSDT', '1m', START_MS, START_MS + 16 * HOUR_MS),
+                        base_klines(START_MS, START_MS + 16 * HOUR_MS - MINUTE_MS))
+    meta = cache._read_meta('BTCUSDT', '1m')
+    assert (meta['start'], meta['end']) == (START_MS, START_MS + 16 * HOUR_MS - MINUTE_MS)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.npy')) == sorted(
+        (meta['timestamps'], meta['ohlcv']))
+
+
+def test_store_and_discard_remove_unreferenced_files(tmp_path):
+    cache = KlineCache(str(tmp_path))
+    for name in ('BTCUSDT_1m.dead.ohlcv.npy', 'BTCUSDT_1m.json.beef.tmp', 'ETHUSDT_1m.dead.ohlcv.npy'):
+        (tmp_path / name).write_bytes(b'')
+    cache.store('BTCUSDT', '1m', START_MS, START_MS + HOUR_MS, base_klines(START_MS, START_MS + HOUR_MS))
+    assert not (tmp_path / 'BTCUSDT_1m.dead.ohlcv.npy').exists()
+    assert not (tmp_path / 'BTCUSDT_1m.json.beef.tmp').exists()
+    cache.discard('BTCUSDT', '1m')
+    assert cache.read('BTCUSDT', '1m') is None
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.npy')] == ['ETHUSDT_1m.dead.ohlcv.npy']
+
+
+def test_get_or_resample_matches_pandas_aggregation(tmp_path, now):
+    cache, fetch = KlineCache(str(tmp_path)), BaseFetcher(now[0])
+    bars = cache.get_or_resample('BTCUSDT', '4h', START_MS + HOUR_MS, START_MS + 3 * DAY_MS, 4 * HOUR_MS,
+                                 '1m', MINUTE_MS, fetch)
+    base = base_klines(START_MS, START_MS + 3 * DAY_MS + 4 * HOUR_MS - MINUTE_MS)
+    frame = pd.DataFrame(base.ohlcv.T, columns=['open', 'high', 'low', 'close', 'volume'],
+                         index=pd.to_datetime(base.timestamps, unit='ms'))
+    expected = frame.resample('4h').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+                                         'volume': 'sum'})
+    np.testing.assert_array_equal(bars.timestamps, expected.index.values.astype('datetime64[ms]').astype(np.int64))
+    np.testing.assert_allclose(bars.ohlcv, expected.to_numpy().T)
+    assert (bars.ohlcv[4] == 240).all()
+
+
+def test_get_or_resample_stores_only_closed_bars(tmp_path, now):
+    cache = KlineCache(str(tmp_path))
+    now[0] = START_MS + 3 * HOUR_MS + 30 * MINUTE_MS
+    bars = cache.get_or_resample('BTCUSDT', '1h', START_MS, START_MS + 5 * HOUR_MS, HOUR_MS, '1m', MINUTE_MS,
+                                 BaseFetcher(now[0]))
+    np.testing.assert_array_equal(bars.timestamps, START_MS + HOUR_MS * np.arange(3))
+    assert (bars.ohlcv[4] == 60).all()
+    # після закриття години бар дораховується з повних хвилин, а не з частини, що була на момент запиту
+    now[0] = START_MS + 4 * HOUR_MS + 5 * MINUTE_MS
+    fetch = BaseFetcher(now[0])
+    bars = cache.get_or_resample('BTCUSDT', '1h', START_MS, START_MS + 5 * HOUR_MS, HOUR_MS, '1m', MINUTE_MS, fetch)
+    np.testing.assert_array_equal(bars.timestamps, START_MS + HOUR_MS * np.arange(4))
+    assert (bars.ohlcv[4] == 60).all()
+    assert fetch.calls == [(START_MS + 3 * HOUR_MS, START_MS + 4 * HOUR_MS - MINUTE_MS)]
+
+
+def test_data_range_covers_indicator_warm_up_on_every_timeframe():
+    for interval in ('5m', '1h', '4h', '1d'):
+        start_ms, _ = data_range_ms('2023-03-01', '2023-04-01', interval)
+        assert (1_677_628_800_000 - start_ms) // interval_to_ms(interval) >= WARM_UP_BARS
+
+
+@pytest.fixture
+def daily_controller(tmp_path, now, monkeypatch):
+    """Controller на 1d, агрегованому з 1m свічок фейкового клієнта Binance через кеш у tmp_path"""
+    now[0] = START_MS + 120 * DAY_MS
+    fetch = BaseFetcher(now[0])
+
+    class FakeClient:
+        def __init__(self, *args):
+            pass
+
+        def get_historical_klines(self, symbol, interval, start_ms, end_ms):
+            klines = fetch(start_ms, end_ms)
+            return [[open_ms, *map(str, row), open_ms + MINUTE_MS - 1]
+                    for open_ms, row in zip(klines.timestamps.tolist(), klines.ohlcv.T.tolist())]
+
+    monkeypatch.setattr(strategy, 'Client', FakeClient)
+    monkeypatch.setattr(strategy, 'KlineCache', lambda: KlineCache(str(tmp_path)))
+    return lambda start_date, end_date: Controller(start_date, end_date, 'BTCUSDT', 1000, None, None, interval='1d')
+
+
+def test_daily_timeframe_runs_on_both_engines(daily_controller):
+    results = {}
+    for engine in ('backtrader', 'fast'):
+        controller = daily_controller('2023-02-01', '2023-04-01')
+        assert len(controller.df_indicators) >= WARM_UP_BARS
+        assert len(controller.data_strategy.p.dataname) == 60
+        analysis, _, ledger_path = controller.run(engine)
+        remove_ledger(ledger_path)
+        results[engine] = analysis
+    for key, value in results['backtrader'].items():
+        assert results['fast'][key] == pytest.approx(value, abs=1e-6), key
+
+
+def test_too_short_warm_up_raises_not_enough_bars(daily_controller):
+    controller = daily_controller('2023-02-01', '2023-04-01')
+    controller.df_indicators = controller.df_indicators.iloc[-INDICATORS_PERIOD:]
+    with pytest.raises(NotEnoughBarsError):
+        controller.run('fast')
+
+
+def test_resample_skips_empty_buckets():
+    klines = base_klines(START_MS, START_MS + 10 * MINUTE_MS)[[0, 1, 9, 10]]
+    timestamps, ohlcv = resample_ohlcv(klines.timestamps, klines.ohlcv, 5 * MINUTE_MS)
+    np.testing.assert_array_equal(timestamps, [START_MS, START_MS + 5 * MINUTE_MS, START_MS + 10 * MINUTE_MS])
+    np.testing.assert_array_equal(ohlcv[4], [2, 1, 1])
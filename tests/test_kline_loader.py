@@ -0,0 +1,153 @@
+"""AsyncKlineLoader проти локального сервера, що відповідає як /api/v3/klines Binance."""
+import asyncio
+import numpy as np
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from utils.kline_cache import KlineCache
+from utils.kline_loader import (AsyncKlineLoader, ExchangeAPIError, ExchangeUnavailableError, EXCHANGE_MAX_RETRIES,
+                                KLINES_PAGE_LIMIT)
+
+MINUTE_MS = 60_000
+START_MS = 1_672_531_200_000  # 2023-01-01
+
+
+def kline(open_ms: int) -> list:
+    """Детермінована 1m свічка у форматі відповіді Binance"""
+    price = 100 + (open_ms - START_MS) // MINUTE_MS % 50
+    return [open_ms, f'{price:.2f}', f'{price + 1:.2f}', f'{price - 1:.2f}', f'{price + 0.5:.2f}', '10.0',
+            open_ms + MINUTE_MS - 1, '0', 1, '0', '0', '0']
+
+
+class KlineServer:
+    """Локальна заміна біржі: сторінки до limit свічок, перші throttled запитів - 429 з Retry-After,
+    пара DOWNUSDT - 503"""
+    def __init__(self, throttled: int = 0, missing: tuple[int, ...] = (), retry_after: str = '0'):
+        self.throttled = throttled
+        self.retry_after = retry_after
+        self.missing = set(missing)
+        self.requests: list[tuple[int, int, int]] = []
+        self.app = web.Application()
+        self.app.router.add_get('/api/v3/klines', self.klines)
+
+    async def klines(self, request: web.Request) -> web.Response:
+        if self.throttled:
+            self.throttled -= 1
+            return web.json_response({'code': -1003, 'msg': 'Too many requests.'}, status=429,
+                                     headers={'Retry-After': self.retry_after})
+        query = request.query
+        if query['symbol'] == 'DOWNUSDT':
+            return web.Response(text='Service Unavailable', status=503)
+        if query['symbol'] != 'BTCUSDT':
+            return web.json_response({'code': -1121, 'msg': 'Invalid symbol.'}, status=400)
+        start_ms, end_ms, limit = int(query['startTime']), int(query['endTime']), int(query['limit'])
+        self.requests.append((start_ms, end_ms, limit))
+        first = -(-start_ms // MINUTE_MS) * MINUTE_MS
+        return web.json_response([kline(open_ms) for open_ms in range(first, end_ms + 1, MINUTE_MS)
+                                  if open_ms not in self.missing][:limit])
+
+
+async def run_loader(server: KlineServer, cache_dir: str, scenario) -> object:
+    async with TestServer(server.app) as test_server:
+        loader = AsyncKlineLoader(base_url=str(test_server.make_url('')), cache=KlineCache(cache_dir))
+        try:
+            return await scenario(loader)
+        finally:
+            await loader.close()
+
+
+def test_fetch_range_paginates_over_page_limit(tmp_path):
+    server = KlineServer()
+    end_ms = START_MS + (2 * KLINES_PAGE_LIMIT + 499) * MINUTE_MS
+    klines = asyncio.run(run_loader(server, str(tmp_path),
+                                    lambda loader: loader.fetch_range('BTCUSDT', '1m', START_MS, end_ms)))
+    assert len(server.requests) == 3
+    assert all(limit == KLINES_PAGE_LIMIT for _, _, limit in server.requests)
+    assert klines.timestamps.dtype == np.int64
+    np.testing.assert_array_equal(klines.timestamps, np.arange(START_MS, end_ms + 1, MINUTE_MS))
+    expected = np.array([kline(open_ms)[1:6] for open_ms in range(START_MS, end_ms + 1, MINUTE_MS)], dtype=float)
+    np.testing.assert_array_equal(klines.ohlcv, expected.T)
+
+
+def test_fetch_range_drops_candles_missing_on_exchange(tmp_path):
+    missing = (START_MS, START_MS + 999 * MINUTE_MS, START_MS + 1000 * MINUTE_MS, START_MS + 1500 * MINUTE_MS)
+    server = KlineServer(missing=missing)
+    end_ms = START_MS + 1499 * MINUTE_MS
+    klines = asyncio.run(run_loader(server, str(tmp_path),
+                                    lambda loader: loader.fetch_range('BTCUSDT', '1m', START_MS, end_ms)))
+    expected = [open_ms for open_ms in range(START_MS, end_ms + 1, MINUTE_MS) if open_ms not in missing]
+    np.testing.assert_array_equal(klines.timestamps, expected)
+    np.testing.assert_array_equal(klines.ohlcv[3], [float(kline(open_ms)[4]) for open_ms in expected])
+
+
+def test_prefetch_fills_cache_once(tmp_path):
+    server = KlineServer()
+    end_ms = START_MS + (KLINES_PAGE_LIMIT + 10) * MINUTE_MS
+
+    async def scenario(loader):
+        await loader.prefetch('BTCUSDT', '1m', START_MS, end_ms)
+        requests = len(server.requests)
+        await loader.prefetch('BTCUSDT', '1m', START_MS + MINUTE_MS, end_ms)
+        return requests
+
+    assert asyncio.run(run_loader(server, str(tmp_path), scenario)) == 2
+    assert len(server.requests) == 2
+    cached = KlineCache(str(tmp_path)).select('BTCUSDT', '1m', START_MS, end_ms)
+    np.testing.assert_array_equal(cached.timestamps, np.arange(START_MS, end_ms + 1, MINUTE_MS))
+
+
+def test_overlapping_prefetches_download_each_candle_once(tmp_path):
+    server = KlineServer()
+
+    async def scenario(loader):
+        await asyncio.gather(loader.prefetch('BTCUSDT', '1m', START_MS, START_MS + 1500 * MINUTE_MS),
+                             loader.prefetch('BTCUSDT', '1m', START_MS + 500 * MINUTE_MS, START_MS + 2500 * MINUTE_MS))
+
+    asyncio.run(run_loader(server, str(tmp_path), scenario))
+    requested = sorted((start, end) for start, end, _ in server.requests)
+    assert all(end < next_start for (_, end), (next_start, _) in zip(requested, requested[1:]))
+    assert (requested[0][0], requested[-1][1]) == (START_MS, START_MS + 2500 * MINUTE_MS)
+
+
+def test_rate_limited_requests_are_retried_after_retry_after(tmp_path):
+    server = KlineServer(throttled=3)
+    end_ms = START_MS + 99 * MINUTE_MS
+    klines = asyncio.run(run_loader(server, str(tmp_path),
+                                    lambda loader: loader.fetch_range('BTCUSDT', '1m', START_MS, end_ms)))
+    assert server.throttled == 0
+    assert len(klines) == 100
+
+
+def test_rate_limit_retries_are_capped(tmp_path):
+    server = KlineServer(throttled=100)
+    with pytest.raises(ExchangeUnavailableError) as error:
+        asyncio.run(run_loader(server, str(tmp_path),
+                               lambda loader: loader.fetch_range('BTCUSDT', '1m', START_MS, START_MS + MINUTE_MS)))
+    assert server.throttled == 100 - (EXCHANGE_MAX_RETRIES + 1)
+    assert (error.value.status_code, error.value.code) == (429, -1003)
+
+
+def test_retry_after_over_wait_budget_is_not_waited(tmp_path):
+    server = KlineServer(throttled=100, retry_after='3600')
+    with pytest.raises(ExchangeUnavailableError):
+        asyncio.run(asyncio.wait_for(run_loader(server, str(tmp_path), lambda loader: loader.fetch_range(
+            'BTCUSDT', '1m', START_MS, START_MS + MINUTE_MS)), timeout=10))
+    assert server.throttled == 99
+
+
+def test_server_error_raises_exchange_unavailable(tmp_path):
+    server = KlineServer()
+    with pytest.raises(ExchangeUnavailableError) as error:
+        asyncio.run(run_loader(server, str(tmp_path),
+                               lambda loader: loader.prefetch('DOWNUSDT', '1m', START_MS, START_MS + MINUTE_MS)))
+    assert error.value.status_code == 503
+
+
+def test_invalid_symbol_raises_exchange_api_error(tmp_path):
+    server = KlineServer()
+    with pytest.raises(ExchangeAPIError) as error:
+        asyncio.run(run_loader(server, str(tmp_path),
+                               lambda loader: loader.prefetch('XXXUSDT', '1m', START_MS, START_MS + MINUTE_MS)))
+    assert not isinstance(error.value, ExchangeUnavailableError)
+    assert (error.value.status_code, error.value.code) == (400, -1121)
+    assert 'Invalid symbol' in str(error.value)
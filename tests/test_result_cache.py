@@ -0,0 +1,29 @@
+"""Кеш результатів: прибирання файлів графіків і журналів, що лишились від попереднього запуску бота."""
+import os
+import time
+from utils.result_cache import ResultCache
+
+
+def touch(path, age: float) -> str:
+    path.write_bytes(b'')
+    os.utime(path, (time.time() - age, time.time() - age))
+    return str(path)
+
+
+def test_sweep_removes_only_stale_unreferenced_files(tmp_path):
+    charts, ledgers = tmp_path / 'charts', tmp_path / 'ledgers'
+    charts.mkdir()
+    ledgers.mkdir()
+    cache = ResultCache(ttl=60, cache_dir=str(tmp_path / 'results'))
+    stale = [touch(charts / 'old.chart.npy', 120), touch(charts / 'old.chart.npy.150.png', 120),
+             touch(ledgers / 'old.ledger', 120)]
+    fresh = [touch(charts / 'new.chart.npy', 10), touch(ledgers / 'new.ledger', 10)]
+    cached = cache.put('key', ({}, touch(charts / 'cached.chart.npy', 120), touch(ledgers / 'cached.ledger', 120)))
+    cache.sweep(str(charts), str(ledgers), str(tmp_path / 'missing'))
+    assert not any(os.path.exists(path) for path in stale)
+    assert all(os.path.exists(path) for path in fresh)
+    assert all(os.path.exists(path) for path in cached[1:])
+    # після перезапуску записи читаються з диску і їхні файли теж не прибираються
+    restarted = ResultCache(ttl=60, cache_dir=str(tmp_path / 'results'))
+    restarted.sweep(os.path.dirname(cached[1]))
+    assert restarted.get('key') == cached
@@ -0,0 +1,22 @@
+"""Холодний старт: процес бота не імпортує важкі залежності, імпорт і старт воркерів не повільніші за baseline."""
+import json
+import pytest
+from benchmarks.startup import BASELINE_PATH, BOT_IMPORT_PROBE, HEAVY_MODULES, compare, measure_startup, probe
+
+# Кількість воркерів, з якою записано розділ startup у baseline
+BASELINE_WORKERS = 4
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_bot_process_does_not_import_heavy_modules():
+    heavy = probe(BOT_IMPORT_PROBE, None)['heavy']
+    assert not heavy, f'bot imports {", ".join(heavy)}; keep {", ".join(HEAVY_MODULES)} in the workers'
+
+
+def test_startup_times_within_baseline():
+    with open(BASELINE_PATH) as file:
+        baseline = json.load(file)
+    results, heavy, calibration = measure_startup(repeat=2, workers=BASELINE_WORKERS)
+    assert not heavy
+    assert compare(results, baseline, calibration, time_tolerance=1.5) == []
@@ -0,0 +1,83 @@
+"""Задачі, що виконуються в процесах-воркерах.
+
+Модуль легкий для імпорту: процес бота посилається на ці функції при постановці задач, а важкі залежності
+імпортуються лише всередині них (у воркерах вони вже завантажені, див. utils.worker_pool.WORKER_PRELOAD).
+"""
+import time
+from utils.grid_config import KLINES_INTERVAL
+from utils.job_control import checkpoint
+from utils.kline_loader import ExchangeAPIError, ExchangeRequestError
+from utils.metrics import profiled
+from utils.plotting import render_basket_file, render_chart_file
+
+
+def run_backtest(start_date: str,
+                 end_date: str,
+                 symbol: str,
+                 deposit: int,
+                 api_key: str,
+                 secret_key: str,
+                 timeframe: str = KLINES_INTERVAL) -> tuple[dict[str, float], str, str, dict]:
+    """Підготовка даних (з локального кешу) та бектест всередині процесу-воркера.
+
+    Повертає результат, шляхи до файлів графіку та журналу ордерів і метрики прогону (етапи, бари, рівні сітки,
+    ордери) - назад передаються лише шляхи, розмір IPC не залежить від довжини діапазону.
+    Помилки біржі повертаються як ExchangeAPIError (5xx - ExchangeUnavailableError) та ExchangeRequestError,
+    щоб процесу бота не потрібен був python-binance.
+    Прогрес симуляції пишеться в таблицю керування планувальника; скасована задача переривається на checkpoint.
+    """
+    from binance.exceptions import BinanceAPIException, BinanceRequestException
+    from strategy import Controller
+
+    with profiled(f'{symbol}_{start_date}_{end_date}'):
+        try:
+            controller = Controller(start_date, end_date, symbol, deposit, api_key, secret_key, interval=timeframe)
+        except BinanceAPIException as error:
+            raise ExchangeAPIError.for_status(error.status_code, error.code, error.message) from None
+        except BinanceRequestException as error:
+            raise ExchangeRequestError(error.message) from None
+        checkpoint()
+        analysis, chart, ledger_path = controller.run(on_progress=checkpoint)
+        chart_path = chart.save()
+    return analysis, chart_path, ledger_path, {'stages': controller.timer.durations, **controller.stats}
+
+
+def run_monte_carlo_backtest(start_date: str,
+                             end_date: str,
+                             symbol: str,
+                             deposit: int,
+                             api_key: str,
+                             secret_key: str,
+                             timeframe: str,
+                             n_paths: int,
+                             block_bars: int) -> dict:
+    """Перевірка стійкості сітки методом Монте-Карло в процесі-воркері (Controller.monte_carlo).
+
+    Повертається лише зведення розподілів, тож IPC не залежить від кількості шляхів.
+    """
+    from binance.exceptions import BinanceAPIException, BinanceRequestException
+    from strategy import Controller
+
+    with profiled(f'{symbol}_{start_date}_{end_date}_monte_carlo'):
+        try:
+            controller = Controller(start_date, end_date, symbol, deposit, api_key, secret_key, interval=timeframe)
+        except BinanceAPIException as error:
+            raise ExchangeAPIError.for_status(error.status_code, error.code, error.message) from None
+        except BinanceRequestException as error:
+            raise ExchangeRequestError(error.message) from None
+        checkpoint()
+        return controller.monte_carlo(n_paths, block_bars, on_progress=checkpoint)
+
+
+def render_plot(chart_path: str, dpi: int) -> tuple[str, float]:
+    """Малювання графіку в процесі-воркері, повертає шлях до PNG та тривалість"""
+    started = time.perf_counter()
+    image_path = render_chart_file(chart_path, dpi)
+    return image_path, time.perf_counter() - started
+
+
+def render_basket_plot(chart_paths: dict[str, str], dpi: int) -> tuple[str, float]:
+    """Малювання графіку кошика в процесі-воркері, повертає шлях до PNG та тривалість"""
+    started = time.perf_counter()
+    image_path = render_basket_file(chart_paths, dpi)
+    return image_path, time.perf_counter() - started
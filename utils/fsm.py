@@ -5,5 +5,7 @@ class TestParamsState(StatesGroup):
     start_date = State()
     end_date = State()
     deposit = State()
+    timeframe = State()
     symbol = State()
     orders = State()
+    basket = State()
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+FSM_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'fsm')
+# Поля, більші за ліміт (в байтах json), та bytes зберігаються окремими файлами поруч з базою
+FSM_INLINE_LIMIT = 4096
+_BLOB = '__blob__'
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM сховище в SQLite: стан і дрібні поля в рядку бази, великі поля - файлами в blobs/.
+
+    Записи без оновлень довше ttl та найстаріші понад max_records видаляються разом з файлами,
+    тож пам'ять бота не залежить від кількості користувачів, а стан переживає перезапуск.
+    Запити - короткі операції за первинним ключем у WAL-режимі, тому виконуються прямо в циклі подій.
+    """
+    def __init__(self, directory: str = FSM_DIR, ttl: float = 7 * 86400, max_records: int = 100_000,
+                 inline_limit: int = FSM_INLINE_LIMIT, evict_interval: float = 60):
+        self.blob_dir = os.path.join(directory, 'blobs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_records = max_records
+        self.inline_limit = inline_limit
+        self.evict_interval = evict_interval
+        self.db = sqlite3.connect(os.path.join(directory, 'fsm.sqlite3'), isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, '
+                        'updated_at REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at)')
+        self.evicted_at = 0.0
+        self.evict()
+        self._remove_orphan_blobs()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f'{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ""}:{key.destiny}'
+
+    def _row(self, key: str) -> tuple[str | None, str] | None:
+        return self.db.execute('SELECT state, data FROM fsm WHERE key = ?', (key,)).fetchone()
+
+    def _write(self, key: str, state: str | None, data: str) -> None:
+        if state is None and data == '{}':
+            self.db.execute('DELETE FROM fsm WHERE key = ?', (key,))
+        else:
+            self.db.execute('INSERT OR REPLACE INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)',
+                            (key, state, data, time.time()))
+        if time.time() - self.evicted_at > self.evict_interval:
+            self.evict()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        row = self._row(self._key(key))
+        self._write(self._key(key), state.state if isinstance(state, State) else state, row[1] if row else '{}')
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = self._row(self._key(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        row = self._row(storage_key)
+        previous = self._blob_names(row[1]) if row else set()
+        stored = {field: self._pack(storage_key, field, value) for field, value in data.items()}
+        self._write(storage_key, row[0] if row else None, json.dumps(stored))
+        for name in previous - self._blob_names(stored):
+            self._remove_blob(name)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        row = self._row(self._key(key))
+        if row is None:
+            return {}
+        return {field: self._unpack(value) for field, value in json.loads(row[1]).items()}
+
+    async def close(self) -> None:
+        self.db.close()
+
+    def _pack(self, storage_key: str, field: str, value: Any) -> Any:
+        """Значення поля для рядка бази: саме значення або посилання на файл"""
+        is_bytes = isinstance(value, (bytes, bytearray))
+        payload = bytes(value) if is_bytes else json.dumps(value).encode('utf-8')
+        if not is_bytes and len(payload) <= self.inline_limit:
+            return value
+        name = hashlib.sha256(f'{storage_key}:{field}'.encode('utf-8')).hexdigest()
+        tmp_path = os.path.join(self.blob_dir, f'{name}.tmp')
+        with open(tmp_path, 'wb') as file:
+            file.write(payload)
+        os.replace(tmp_path, os.path.join(self.blob_dir, name))
+        return {_BLOB: name, 'bytes': is_bytes}
+
+    def _unpack(self, value: Any) -> Any:
+        if not isinstance(value, dict) or _BLOB not in value:
+            return value
+        try:
+            with open(os.path.join(self.blob_dir, value[_BLOB]), 'rb') as file:
+                payload = file.read()
+        except FileNotFoundError:
+            return None
+        return payload if value['bytes'] else json.loads(payload)
+
+    @staticmethod
+    def _blob_names(data: str | dict) -> set[str]:
+        if isinstance(data, str):
+            if _BLOB not in data:
+                return set()
+            data = json.loads(data)
+        return {value[_BLOB] for value in data.values() if isinstance(value, dict) and _BLOB in value}
+
+    def _remove_blob(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.blob_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> int:
+        """Видалення прострочених записів та найстаріших понад max_records, повертає кількість видалених"""
+        self.evicted_at = time.time()
+        expires_before = self.evicted_at - self.ttl
+        expired = self.db.execute('SELECT key, data FROM fsm WHERE updated_at < ?', (expires_before,)).fetchall()
+        excess = self.db.execute('SELECT COUNT(*) FROM fsm').fetchone()[0] - len(expired) - self.max_records
+        if excess > 0:
+            expired += self.db.execute('SELECT key, data FROM fsm WHERE updated_at >= ? ORDER BY updated_at LIMIT ?',
+                                       (expires_before, excess)).fetchall()
+        if not expired:
+            return 0
+        self.db.executemany('DELETE FROM fsm WHERE key = ?', ((key,) for key, _ in expired))
+        for _, data in expired:
+            for name in self._blob_names(data):
+                self._remove_blob(name)
+        return len(expired)
+
+    def _remove_orphan_blobs(self) -> None:
+        """Файли, на які не посилається жоден запис (обрив між записом файлу та бази)"""
+        referenced = set()
+        for (data,) in self.db.execute("SELECT data FROM fsm WHERE data LIKE ?", (f'%{_BLOB}%',)):
+            referenced |= self._blob_names(data)
+        for name in os.listdir(self.blob_dir):
+            if name not in referenced:
+                self._remove_blob(name)
+
+
+def create_storage(url: str | None = None) -> BaseStorage:
+    """FSM сховище за FSM_STORAGE: memory, sqlite (за замовчуванням, каталог FSM_DIR) або redis://...
+
+    Для Redis потрібен пакет redis (необов'язкова залежність).
+    """
+    url = url or os.getenv('FSM_STORAGE', 'sqlite')
+    ttl = int(os.getenv('FSM_TTL', 7 * 86400))
+    if url == 'memory':
+        from aiogram.fsm.storage.memory import MemoryStorage
+        return MemoryStorage()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(url, state_ttl=ttl, data_ttl=ttl)
+    if url == 'sqlite':
+        return SQLiteStorage(os.getenv('FSM_DIR', FSM_DIR), ttl=ttl,
+                             max_records=int(os.getenv('FSM_MAX_RECORDS', 100_000)))
+    raise ValueError(f'Unknown FSM storage: {url}')
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+from utils.indicators import INDICATORS_PERIOD
+
+# Таймфрейм за замовчуванням; всі таймфрейми агрегуються локально з однієї базової 1m серії
+KLINES_INTERVAL = '1h'
+KLINES_BASE_INTERVAL = '1m'
+TIMEFRAMES = ('5m', '15m', '1h', '4h', '1d')
+# Параметри діапазону та сітки, які можна змінювати і перебирати в Controller.sweep
+GRID_PARAMS = {
+    'step_percentage': 0.02,
+    'profit_percentage': 0.03,
+    'stop_percent': 0.03,
+    'take_percent': 0.06,
+    'atr_multiplier': 2,
+    'rsi_atr_multiplier': 2,
+    'rsi_lower': 30,
+    'rsi_upper': 70,
+}
+# Розігрів індикаторів перед стартом тестування: 2 тижні, але не менше WARM_UP_BARS барів таймфрейму
+WARM_UP = timedelta(weeks=2)
+WARM_UP_BARS = INDICATORS_PERIOD + 1
+
+_UNIT_MS = {'m': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 604_800_000}
+
+
+def interval_to_ms(interval: str) -> int:
+    """Тривалість таймфрейму Binance (1m, 4h, 1d, ...) в мс"""
+    try:
+        return int(interval[:-1]) * _UNIT_MS[interval[-1]]
+    except (KeyError, ValueError):
+        raise ValueError(f'Unknown interval: {interval}') from None
+
+
+def _date_ms(date: str) -> int:
+    moment = datetime.fromisoformat(date)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def data_range_ms(start_date: str, end_date: str, interval: str = KLINES_INTERVAL) -> tuple[int, int]:
+    """Діапазон свічок (в мс) разом з розігрівом індикаторів: 2 тижні або WARM_UP_BARS барів interval"""
+    warm_up_ms = max(int(WARM_UP.total_seconds() * 1000), WARM_UP_BARS * interval_to_ms(interval))
+    return _date_ms(start_date) - warm_up_ms, _date_ms(end_date)
+
+
+def base_range_ms(start_date: str, end_date: str, interval: str = KLINES_INTERVAL) -> tuple[int, int]:
+    """Діапазон базових 1m свічок, з яких агрегуються бари interval для data_range_ms"""
+    indicators_start_ms, end_ms = data_range_ms(start_date, end_date, interval)
+    return indicators_start_ms, end_ms + interval_to_ms(interval) - interval_to_ms(KLINES_BASE_INTERVAL)
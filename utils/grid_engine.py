@@ -0,0 +1,471 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable
+import numpy as np
+from utils.ledger import TradeLedger, EVENT_PLACED, EVENT_REPLACED, EVENT_CANCELED, SIDE_BUY, SIDE_SELL
+
+# Період (в барах) виклику on_progress: прогрес задачі та перевірка її скасування
+PROGRESS_EVERY = 500
+
+
+class _Position:
+    """Позиція з середньою ціною, як backtrader.Position"""
+    __slots__ = ('size', 'price')
+
+    def __init__(self, size: float = 0.0, price: float = 0.0):
+        self.size = size
+        self.price = price
+
+    def clone(self) -> '_Position':
+        return _Position(self.size, self.price)
+
+    def update(self, size: float, price: float) -> tuple[float, float]:
+        """Оновлення позиції, повертає (opened, closed)"""
+        oldsize = self.size
+        self.size += size
+        if not self.size:
+            self.price = 0.0
+            return 0.0, size
+        if not oldsize:
+            self.price = price
+            return size, 0.0
+        if (oldsize > 0) == (size > 0):
+            self.price = (self.price * oldsize + size * price) / self.size
+            return size, 0.0
+        if (oldsize > 0) == (self.size > 0):
+            return 0.0, size
+        self.price = price
+        return self.size, -oldsize
+
+
+def _execute_cash(cash: float, position: _Position, size: float, price: float) -> tuple[float, bool]:
+    """Зміна кешу від виконання (stocklike, shortcash, без комісії) як у BackBroker._execute.
+
+    Повертає новий кеш і чи вистачило кешу на відкриту частину.
+    """
+    price_orig = position.price
+    opened, closed = position.update(size, price)
+    if closed:
+        cash += -closed * price_orig + -closed * (price - price_orig)
+    if opened:
+        cash -= opened * price
+        return cash, cash >= 0.0
+    return cash, True
+
+
+class _Order:
+    __slots__ = ('seq', 'is_buy', 'is_market', 'price', 'size', 'level', 'triggered', 'parent', 'child', 'rejected')
+
+    def __init__(self, is_buy: bool, price: float, size: float, level: int = -1, is_market: bool = False,
+                 parent: '_Order | None' = None):
+        self.seq = -1
+        self.is_buy = is_buy
+        self.is_market = is_market
+        self.price = price
+        self.size = size
+        self.level = level
+        self.triggered = False
+        self.parent = parent
+        self.child = None
+        self.rejected = False
+
+
+def _try_fill(order: _Order, popen: float, phigh: float, plow: float) -> float | None:
+    """Ціна виконання StopLimit (plimit == price) або Market ордера на барі; None - не виконано"""
+    if order.is_market:
+        return popen
+    price = order.price
+    if order.is_buy:
+        if order.triggered:
+            if price >= popen:
+                return popen
+            return price if price >= plow else None
+        if popen >= price:
+            order.triggered = True
+            if price >= popen:
+                return popen
+            return price if price >= plow else None
+        if phigh >= price:
+            order.triggered = True
+            return price
+        return None
+    if order.triggered:
+        if price <= popen:
+            return popen
+        return price if price <= phigh else None
+    if popen <= price:
+        order.triggered = True
+        if price <= popen:
+            return popen
+        return price if price <= phigh else None
+    if plow <= price:
+        order.triggered = True
+        return price
+    return None
+
+
+def simulate_grid(open_: np.ndarray,
+                  high: np.ndarray,
+                  low: np.ndarray,
+                  close: np.ndarray,
+                  buy_levels: list[float],
+                  sell_levels: list[float],
+                  stop_loss: float,
+                  take_profit: float,
+                  deposit: float,
+                  ledger: TradeLedger | None = None,
+                  fills: list[tuple[int, bool, float]] | None = None,
+                  recenters: dict[int, tuple[list[float], list[float], float, float]] | None = None,
+                  on_progress: Callable[[int, int], None] | None = None
+                  ) -> tuple[np.ndarray, int]:
+    """Подієва симуляція GridStrategy з тією ж логікою виконання, що й BackBroker backtrader.
+
+    Ордери тримаються в чотирьох відсортованих за ціною книгах (buy/sell, triggered чи ні),
+    тому бар без перетину жодного рівня коштує O(1). Повертає вартість портфеля на кожному барі
+    та кількість виконаних продажів сітки; ордери сітки пишуться в ledger,
+    виконання (бар, покупка, ціна) дописуються в fills, якщо переданий.
+    recenters - нові (buy_levels, sell_levels, stop_loss, take_profit) за індексом бару для walk-forward,
+    міграція ордерів як у GridStrategy._recenter.
+    on_progress(оброблено барів, всього) викликається кожні PROGRESS_EVERY барів і може перервати прогін винятком.
+    """
+    recenters = recenters or {}
+    open_, high, low, close = (np.asarray(values, dtype=np.float64).tolist() for values in (open_, high, low, close))
+    n = len(close)
+    values = np.empty(n)
+    cash = float(deposit)
+    position = _Position()
+    grid_num = len(buy_levels)
+    position_size = deposit / grid_num if grid_num else 0.0
+    # книги: відсортовані (price, seq), ордер за seq
+    buy_untriggered: list[tuple[float, int]] = []
+    buy_triggered: list[tuple[float, int]] = []
+    sell_untriggered: list[tuple[float, int]] = []
+    sell_triggered: list[tuple[float, int]] = []
+    pending: dict[int, _Order] = {}
+    markets: list[_Order] = []
+    submitted: list[_Order] = []
+    to_activate: list[_Order] = []
+    next_seq = 0
+    orders_executed = 0
+    stop_or_take_hit = False
+    grid_armed = False
+
+    def book_of(order: _Order) -> list[tuple[float, int]]:
+        if order.is_buy:
+            return buy_triggered if order.triggered else buy_untriggered
+        return sell_triggered if order.triggered else sell_untriggered
+
+    def submit_bracket(level: int, size: float) -> None:
+        buy_order = _Order(True, buy_levels[level], size, level)
+        sell_order = _Order(False, sell_levels[level], size, level, parent=buy_order)
+        buy_order.child = sell_order
+        submitted.append(buy_order)
+        submitted.append(sell_order)
+
+    for t in range(n):
+        if on_progress is not None and not t % PROGRESS_EVERY:
+            on_progress(t, n)
+        popen, phigh, plow, pclose = open_[t], high[t], low[t], close[t]
+
+        # BackBroker.next: активація дочірніх ордерів, перевірка кешу поданих ордерів
+        for order in to_activate:
+            insort(sell_untriggered, (order.price, order.seq))
+        to_activate.clear()
+        if submitted:
+            check_cash = cash
+            check_position = position.clone()
+            for order in submitted:
+                if order.parent is not None and order.parent.rejected:
+                    order.rejected = True
+                    continue
+                check_cash, _ = _execute_cash(check_cash, check_position,
+                                              order.size if order.is_buy else -order.size,
+                                              pclose if order.is_market else order.price)
+                if check_cash < 0.0:
+                    order.rejected = True
+                    continue
+                order.seq = next_seq
+                next_seq += 1
+                pending[order.seq] = order
+                if order.is_market:
+                    markets.append(order)
+                elif order.is_buy:
+                    insort(buy_untriggered, (order.price, order.seq))
+            submitted.clear()
+
+        acting = [order.seq for order in markets]
+        if buy_untriggered and buy_untriggered[0][0] <= phigh:
+            acting.extend(seq for _, seq in buy_untriggered[:bisect_right(buy_untriggered, (phigh, next_seq))])
+        if buy_triggered and buy_triggered[-1][0] >= plow:
+            acting.extend(seq for _, seq in buy_triggered[bisect_left(buy_triggered, (plow, -1)):])
+        if sell_untriggered and sell_untriggered[-1][0] >= plow:
+            acting.extend(seq for _, seq in sell_untriggered[bisect_left(sell_untriggered, (plow, -1)):])
+        if sell_triggered and sell_triggered[0][0] <= phigh:
+            acting.extend(seq for _, seq in sell_triggered[:bisect_right(sell_triggered, (phigh, next_seq))])
+
+        completed_sells = []
+        if acting:
+            acting.sort()
+            for seq in acting:
+                order = pending[seq]
+                if order.is_market:
+                    markets.remove(order)
+                    book = None
+                else:
+                    book = book_of(order)
+                    del book[bisect_left(book, (order.price, seq))]
+                price = _try_fill(order, popen, phigh, plow)
+                if price is None:
+                    insort(book_of(order), (order.price, seq))
+                    continue
+                del pending[seq]
+                if order.is_buy:
+                    new_cash, enough_cash = _execute_cash(cash, position.clone(), order.size, price)
+                    if not enough_cash:
+                        # margin: батьківський ордер та його sell скасовуються
+                        if order.child is not None:
+                            del pending[order.child.seq]
+                        continue
+                    position.update(order.size, price)
+                    cash = new_cash
+                    if order.child is not None:
+                        to_activate.append(order.child)
+                else:
+                    cash, _ = _execute_cash(cash, position, -order.size, price)
+                    completed_sells.append(order)
+                if fills is not None:
+                    fills.append((t, order.is_buy, price))
+
+        values[t] = cash + position.size * pclose
+
+        # GridStrategy.notify_order
+        for order in completed_sells:
+            if stop_or_take_hit or order.is_market:
+                continue
+            orders_executed += 1
+            if order.level is not None and t not in recenters:
+                submit_bracket(order.level, order.size)
+                if ledger is not None:
+                    ledger.record(t, EVENT_REPLACED, SIDE_BUY, order.level, buy_levels[order.level], order.size)
+                    ledger.record(t, EVENT_REPLACED, SIDE_SELL, order.level, sell_levels[order.level], order.size)
+
+        # GridStrategy.nextstart / next
+        if t == 0:
+            continue
+        if t in recenters:
+            for seq in sorted(seq for seq, order in pending.items() if order.is_buy and not order.is_market):
+                order = pending.pop(seq)
+                book = book_of(order)
+                del book[bisect_left(book, (order.price, seq))]
+                if order.child is not None:
+                    pending.pop(order.child.seq, None)
+                if ledger is not None:
+                    ledger.record(t, EVENT_CANCELED, SIDE_BUY, order.level, order.price, order.size)
+            for order in pending.values():
+                if not order.is_market:
+                    order.level = None
+            buy_levels, sell_levels, stop_loss, take_profit = recenters[t]
+            grid_num = len(buy_levels)
+            position_size = deposit / grid_num
+            grid_armed = False
+            stop_or_take_hit = False
+        if not stop_or_take_hit and not grid_armed:
+            grid_armed = True
+            quantity_per_order = position_size / pclose
+            for level in range(grid_num):
+                submit_bracket(level, quantity_per_order)
+                if ledger is not None:
+                    ledger.record(t, EVENT_PLACED, SIDE_BUY, level, buy_levels[level], quantity_per_order)
+                    ledger.record(t, EVENT_PLACED, SIDE_SELL, level, sell_levels[level], quantity_per_order)
+        if pclose <= stop_loss or pclose >= take_profit:
+            if position.size:
+                # close() закриває і залишок позиції від похибки float, в т.ч. від'ємний
+                submitted.append(_Order(position.size < 0, pclose, abs(position.size), is_market=True))
+            for book in (buy_untriggered, buy_triggered, sell_untriggered, sell_triggered, markets, to_activate):
+                book.clear()
+            pending.clear()
+            stop_or_take_hit = True
+    return values, orders_executed
+
+
+def _group_ranks(paths: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Номер кожного елемента в порядку keys серед елементів того самого шляху"""
+    order = np.lexsort((keys, paths))
+    sorted_paths = paths[order]
+    starts = np.flatnonzero(np.r_[True, sorted_paths[1:] != sorted_paths[:-1]])
+    ranks = np.empty(len(paths), dtype=np.int64)
+    ranks[order] = np.arange(len(paths)) - np.repeat(starts, np.diff(np.r_[starts, len(paths)]))
+    return ranks
+
+
+def simulate_grid_paths(open_: np.ndarray,
+                        high: np.ndarray,
+                        low: np.ndarray,
+                        close: np.ndarray,
+                        buy_levels: list[float],
+                        sell_levels: list[float],
+                        stop_loss: float,
+                        take_profit: float,
+                        deposit: float,
+                        on_progress: Callable[[int, int], None] | None = None) -> dict[str, np.ndarray]:
+    """Пакетна версія simulate_grid: одна сітка одночасно на багатьох цінових шляхах.
+
+    open_/high/low/close - масиви (бари, шляхи). Ордери всіх рівнів на всіх шляхах - масиви (шляхи, рівні):
+    ціна активного ордера (nan - ордера немає), напрям та triggered; цикл іде лише по барах, а виконання
+    та подання ордерів обробляються як розріджені списки індексів. Виконання StopLimit, перевиставлення,
+    stop/take та close() такі самі, як у simulate_grid (без walk-forward); шляхи, де на барі може
+    не вистачити кешу, проходять ордери по черзі, як BackBroker.
+    Повертає по кожному шляху: final_value, max_drawdown (%), max_moneydown, orders_executed, stop_hit, take_hit.
+    """
+    n, paths = close.shape
+    levels = len(buy_levels)
+    buy_levels = np.asarray(buy_levels, dtype=np.float64)
+    sell_levels = np.asarray(sell_levels, dtype=np.float64)
+    price = np.full((paths, levels), np.nan)
+    is_buy = np.zeros((paths, levels), dtype=bool)
+    triggered = np.zeros((paths, levels), dtype=bool)
+    # порядок подання ордерів: seq покупки, seq її продажу на 1 більший
+    seq = np.zeros((paths, levels), dtype=np.int64)
+    size = np.zeros((paths, levels))
+    cash = np.full(paths, float(deposit))
+    position = np.zeros(paths)
+    # close() після stop/take: > 0 - продаж, < 0 - купівля, виконується за open наступного бару
+    market = np.zeros(paths)
+    stop_or_take_hit = np.zeros(paths, dtype=bool)
+    stop_hit = np.zeros(paths, dtype=bool)
+    take_hit = np.zeros(paths, dtype=bool)
+    orders_executed = np.zeros(paths, dtype=np.int64)
+    peak = np.full(paths, -np.inf)
+    max_drawdown = np.zeros(paths)
+    max_moneydown = np.zeros(paths)
+    position_size = deposit / levels if levels else 0.0
+    value = cash.copy()
+    # подані bracket-ордери (шлях, рівень, ключ черги подання), приймаються брокером на наступному барі
+    sub_paths = sub_levels = sub_keys = np.empty(0, dtype=np.int64)
+
+    for t in range(n):
+        if on_progress is not None and not t % PROGRESS_EVERY:
+            on_progress(t, n)
+        popen, phigh, plow, pclose = open_[t], high[t], low[t], close[t]
+
+        # BackBroker.next: перевірка кешу поданих ордерів у порядку подання, close() - останнім
+        if len(sub_paths) or market.any():
+            ranks = _group_ranks(sub_paths, sub_keys)
+            check_cash = cash - np.bincount(sub_paths, size[sub_paths, sub_levels] * buy_levels[sub_levels], paths)
+            in_order = (check_cash < 0.0) | (market < 0.0)
+            for path in np.flatnonzero(in_order & ((np.bincount(sub_paths, minlength=paths) > 0) | (market != 0.0))):
+                rows = np.flatnonzero(sub_paths == path)
+                check_cash = cash[path]
+                for i in rows[np.argsort(ranks[rows])]:
+                    level = sub_levels[i]
+                    check_cash -= size[path, level] * buy_levels[level]
+                    if check_cash < 0.0:
+                        ranks[i] = -1
+                        continue
+                    check_cash += size[path, level] * sell_levels[level]
+                if market[path] and check_cash + market[path] * pclose[path] < 0.0:
+                    market[path] = 0.0
+            accepted = ranks >= 0
+            paths_, levels_ = sub_paths[accepted], sub_levels[accepted]
+            price[paths_, levels_] = buy_levels[levels_]
+            is_buy[paths_, levels_] = True
+            triggered[paths_, levels_] = False
+            seq[paths_, levels_] = 2 * (t * (levels + 1) + ranks[accepted])
+            sub_paths = sub_levels = sub_keys = np.empty(0, dtype=np.int64)
+
+        # виконання StopLimit ордерів (_try_fill)
+        below_high = price <= phigh[:, None]
+        above_low = price >= plow[:, None]
+        fill = np.where(is_buy, above_low & (triggered | below_high), below_high & (triggered | above_low))
+        fill_paths, fill_levels = np.nonzero(fill)
+        was_triggered = triggered[fill_paths, fill_levels]
+        triggered |= np.where(is_buy, below_high, above_low)
+        fill_price = price[fill_paths, fill_levels]
+        fill_buy = is_buy[fill_paths, fill_levels]
+        fill_open = popen[fill_paths]
+        gap = was_triggered & np.where(fill_buy, fill_price >= fill_open, fill_price <= fill_open)
+        fill_price = np.where(gap, fill_open, fill_price)
+        fill_size = size[fill_paths, fill_levels]
+        cost = np.bincount(fill_paths[fill_buy], (fill_size * fill_price)[fill_buy], paths)
+        filled = np.ones(len(fill_paths), dtype=bool)
+        for path in np.flatnonzero(cash - cost < 0.0):
+            # margin: покупка без кешу скасовує bracket, решта ордерів шляху виконується по черзі
+            rows = np.flatnonzero(fill_paths == path)
+            check_cash = cash[path]
+            for i in rows[np.argsort(seq[path, fill_levels[rows]] + ~fill_buy[rows])]:
+                if fill_buy[i]:
+                    if check_cash - fill_size[i] * fill_price[i] < 0.0:
+                        filled[i] = False
+                        continue
+                    check_cash -= fill_size[i] * fill_price[i]
+                else:
+                    check_cash += fill_size[i] * fill_price[i]
+        margin = ~filled
+        price[fill_paths[margin], fill_levels[margin]] = np.nan
+        fill_paths, fill_levels, fill_buy = fill_paths[filled], fill_levels[filled], fill_buy[filled]
+        fill_size, fill_price = fill_size[filled], fill_price[filled]
+        direction = np.where(fill_buy, 1.0, -1.0)
+        cash -= np.bincount(fill_paths, direction * fill_size * fill_price, paths)
+        position += np.bincount(fill_paths, direction * fill_size, paths)
+        closing = market != 0.0
+        if closing.any():
+            cash[closing] += market[closing] * popen[closing]
+            position[closing] -= market[closing]
+            market[closing] = 0.0
+        bought_paths, bought_levels = fill_paths[fill_buy], fill_levels[fill_buy]
+        price[bought_paths, bought_levels] = sell_levels[bought_levels]
+        is_buy[bought_paths, bought_levels] = False
+        triggered[bought_paths, bought_levels] = False
+
+        value = cash + position * pclose
+        np.maximum(peak, value, out=peak)
+        np.maximum(max_moneydown, peak - value, out=max_moneydown)
+        np.maximum(max_drawdown, 100.0 * (peak - value) / peak, out=max_drawdown)
+
+        # GridStrategy.notify_order: продані рівні перевиставляються, поки не спрацював stop/take
+        sold_paths, sold_levels = fill_paths[~fill_buy], fill_levels[~fill_buy]
+        price[sold_paths, sold_levels] = np.nan
+        replace = ~stop_or_take_hit[sold_paths]
+        sub_paths, sub_levels = sold_paths[replace], sold_levels[replace]
+        sub_keys = seq[sub_paths, sub_levels] + 1
+        orders_executed += np.bincount(sub_paths, minlength=paths)
+
+        # GridStrategy.nextstart / next
+        if t == 0:
+            continue
+        if t == 1 and levels:
+            sub_paths, sub_levels = np.divmod(np.arange(paths * levels), levels)
+            sub_keys = sub_levels.copy()
+            size[:] = (position_size / pclose)[:, None]
+        hit = (pclose <= stop_loss) | (pclose >= take_profit)
+        if hit.any():
+            first = hit & ~stop_or_take_hit
+            stop_hit |= first & (pclose <= stop_loss)
+            take_hit |= first & (pclose > stop_loss)
+            market[hit] = position[hit]
+            price[hit] = np.nan
+            stop_or_take_hit |= hit
+    return {'final_value': value,
+            'max_drawdown': max_drawdown,
+            'max_moneydown': max_moneydown,
+            'orders_executed': orders_executed,
+            'stop_hit': stop_hit,
+            'take_hit': take_hit}
+
+
+def grid_analysis(values: np.ndarray, deposit: float, orders_executed: int) -> dict[str, float | int]:
+    """Ті самі метрики, що CustomAnalyzer та DrawDown аналізатор"""
+    final_value = float(values[-1]) if len(values) else float(deposit)
+    analysis = {
+        "Profit/Loss (%)": 100 * (final_value - deposit) / deposit,
+        "Profit/Loss ($)": final_value - deposit,
+        "Total Trades": orders_executed
+    }
+    max_drawdown, max_moneydown = 0.0, 0.0
+    if len(values):
+        peak = np.maximum.accumulate(values)
+        moneydown = peak - values
+        max_moneydown = max(0.0, float(moneydown.max()))
+        max_drawdown = max(0.0, float((100.0 * moneydown / peak).max()))
+    analysis.update({'Max drawdown (%)': round(max_drawdown, 2),
+                     'Max drawdown ($)': round(max_moneydown, 2)})
+    return analysis
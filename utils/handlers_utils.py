@@ -1,26 +1,228 @@
-from concurrent.futures import ProcessPoolExecutor
 import asyncio
 import os
-import io
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
 from aiogram.types import BufferedInputFile
-from strategy import Controller
+from utils.backtest_jobs import run_backtest, run_monte_carlo_backtest, render_plot, render_basket_plot
+from utils.grid_config import KLINES_INTERVAL, KLINES_BASE_INTERVAL, GRID_PARAMS, base_range_ms, \
+    interval_to_ms
+from utils.job_control import JobCancelledError
+from utils.kline_loader import AsyncKlineLoader
+from utils.ledger import format_ledger
+from utils.metrics import Metrics
+from utils.plotting import PLOT_DPI
+from utils.result_cache import ResultCache, RESULT_CACHE_DIR, result_key
+from utils.worker_pool import BacktestScheduler
+
+kline_loader = AsyncKlineLoader()
+metrics = Metrics()
+scheduler = BacktestScheduler(max_workers=int(os.getenv('BACKTEST_WORKERS', 0)) or None,
+                              max_queue=int(os.getenv('BACKTEST_QUEUE_SIZE', 100)),
+                              per_chat_limit=int(os.getenv('BACKTEST_CHAT_LIMIT', 1)),
+                              metrics=metrics)
+metrics.gauge('backtest_queue_length', lambda: scheduler.queued)
+metrics.gauge('backtest_running_jobs', lambda: scheduler.running)
+result_cache = ResultCache(cache_dir=RESULT_CACHE_DIR)
+BASKET_MAX_SYMBOLS = int(os.getenv('BASKET_MAX_SYMBOLS', 50))
+MONTE_CARLO_PATHS = int(os.getenv('MONTE_CARLO_PATHS', 1000))
+MONTE_CARLO_BLOCK_HOURS = int(os.getenv('MONTE_CARLO_BLOCK_HOURS', 24))
+
+
+@dataclass
+class _Waiter:
+    """Чат, що чекає результат бектесту, та його колбеки"""
+    chat_id: int
+    on_position: Callable[[int], Awaitable[None]] | None = None
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None
+    cancelled: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+# Чати, що чекають однакові бектести, за ключем кешу результатів: одна задача в пулі на всіх
+_waiters: dict[str, list[_Waiter]] = {}
+
+
+async def _notify_waiters(key: str, callback: str, *args: int) -> None:
+    """Позиція в черзі або прогрес спільної задачі - кожному чату, що її чекає"""
+    callbacks = [getattr(waiter, callback) for waiter in _waiters.get(key, ())]
+    await asyncio.gather(*(callback(*args) for callback in callbacks if callback is not None))
+
+
+async def _backtest(start_date: str,
+                    end_date: str,
+                    symbol: str,
+                    deposit: int,
+                    chat_id: int,
+                    timeframe: str,
+                    on_position: Callable[[int], Awaitable[None]] | None = None,
+                    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+                    reserved: bool = False,
+                    epoch: int | None = None) -> tuple[dict[str, float], str, str]:
+    """Бектест однієї пари: кеш результатів, докачування свічок та задача в пулі процесів.
+
+    Однакові запити різних чатів чекають одну задачу, кожен чат отримує власні позицію та прогрес.
+    Кожен чат займає місце у своєму ліміті (для кошика - reserved, місце вже зайняте).
+    cancel_backtests(chat_id) відпускає лише цей чат; задача скасовується, коли її не чекає жоден чат.
+    epoch - scheduler.epoch(chat_id) на початку запиту кошика: /start до старту бектесту скасовує і його.
+    """
+    if epoch is not None and epoch != scheduler.epoch(chat_id):
+        raise JobCancelledError(0)
+    API_KEY = os.getenv("API_KEY")
+    SECRET_KEY = os.getenv("SECRET_KEY")
+    key = result_key(symbol=symbol, start_date=start_date, end_date=end_date, deposit=deposit,
+                     interval=timeframe, engine='backtrader', grid_params=GRID_PARAMS)
+    result = result_cache.get(key)
+    if result is not None:
+        return result
+
+    async def compute():
+        job = {'symbol': symbol, 'start_date': start_date, 'end_date': end_date, 'timeframe': timeframe,
+               'chat_id': chat_id}
+        started = time.perf_counter()
+        try:
+            await kline_loader.prefetch(symbol, KLINES_BASE_INTERVAL,
+                                        *base_range_ms(start_date, end_date, timeframe))
+            job['stages'] = {'download': time.perf_counter() - started}
+            analysis, chart_path, ledger_path, run_metrics = await scheduler.submit(
+                chat_id, run_backtest, start_date, end_date, symbol, deposit, API_KEY, SECRET_KEY, timeframe,
+                on_position=lambda position: _notify_waiters(key, 'on_position', position),
+                on_progress=lambda done, total: _notify_waiters(key, 'on_progress', done, total),
+                reserved=True, shared=True)
+        except Exception as error:
+            metrics.record_job({**job, 'status': 'error', 'error': type(error).__name__})
+            raise
+        job['stages'].update(run_metrics.pop('stages'))
+        metrics.record_job({**job, **run_metrics, 'status': 'ok', 'total': time.perf_counter() - started})
+        return analysis, chart_path, ledger_path
+
+    waiter = _Waiter(chat_id, on_position, on_progress)
+    with nullcontext() if reserved else scheduler.reserve(chat_id, 1):
+        waiters = _waiters.setdefault(key, [])
+        waiters.append(waiter)
+        run = asyncio.ensure_future(result_cache.get_or_run(key, compute))
+        cancelled = asyncio.ensure_future(waiter.cancelled.wait())
+        try:
+            await asyncio.wait((run, cancelled), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+            run.cancel()
+            waiters.remove(waiter)
+            if not waiters:
+                del _waiters[key]
+                result_cache.cancel(key)
+    if not run.done():
+        raise JobCancelledError(0)
+    return run.result()
 
 
 async def test_strategy(start_date: str,
                         end_date: str,
                         symbol: str,
-                        deposit: int) -> tuple[dict[str, float], io.BytesIO, io.BytesIO]:
-    """Запуск CPU-bound задачі в процесі"""
-    API_KEY = os.getenv("API_KEY")
-    SECRET_KEY = os.getenv("SECRET_KEY")
-    loop = asyncio.get_running_loop()
-    controller = Controller(start_date, end_date, symbol, deposit, API_KEY, SECRET_KEY)
-    with ProcessPoolExecutor() as executor:
-        data = await loop.run_in_executor(executor, controller.run)
-    return data
+                        deposit: int,
+                        chat_id: int,
+                        timeframe: str = KLINES_INTERVAL,
+                        on_position: Callable[[int], Awaitable[None]] | None = None,
+                        on_progress: Callable[[int, int], Awaitable[None]] | None = None
+                        ) -> tuple[dict[str, float], str, str]:
+    """Асинхронне завантаження свічок та запуск CPU-bound задачі в спільному пулі процесів.
+
+    Однакові запити беруться з кешу результатів, а одночасні - чекають одну спільну задачу.
+    Задача переривається з JobCancelledError після cancel_backtests(chat_id), з JobTimeoutError - після ліміту часу.
+    """
+    return await _backtest(start_date, end_date, symbol, deposit, chat_id, timeframe, on_position, on_progress)
+
+
+async def test_basket(start_date: str,
+                      end_date: str,
+                      symbols: list[str],
+                      deposit: int,
+                      chat_id: int,
+                      timeframe: str = KLINES_INTERVAL
+                      ) -> tuple[list[tuple[str, dict[str, float], str]], dict[str, BaseException]]:
+    """Бектест кошика пар одним запитом: свічки качаються конкурентно, бектести йдуть паралельно в пулі.
+
+    Кошик займає одне місце в ліміті чату. Помилка окремої пари (напр. невірна пара) не зупиняє решту.
+    Повертає (пара, результат, шлях до графіку), відсортовані за прибутком, та помилки по парах;
+    скасування кошика (cancel_backtests) - JobCancelledError.
+    """
+    if not symbols or len(symbols) > BASKET_MAX_SYMBOLS:
+        raise ValueError(f'Basket must contain 1..{BASKET_MAX_SYMBOLS} symbols')
+    epoch = scheduler.epoch(chat_id)
+    with scheduler.reserve(chat_id, len(symbols)):
+        outcomes = await asyncio.gather(*(_backtest(start_date, end_date, symbol, deposit, chat_id, timeframe,
+                                                    reserved=True, epoch=epoch) for symbol in symbols),
+                                        return_exceptions=True)
+    if epoch != scheduler.epoch(chat_id):
+        raise JobCancelledError(0)
+    ranked, failures = [], {}
+    for symbol, outcome in zip(symbols, outcomes):
+        if isinstance(outcome, Exception):
+            failures[symbol] = outcome
+        else:
+            ranked.append((symbol, outcome[0], outcome[1]))
+    ranked.sort(key=lambda row: row[1]['Profit/Loss (%)'], reverse=True)
+    return ranked, failures
+
+
+async def test_monte_carlo(start_date: str,
+                          end_date: str,
+                          symbol: str,
+                          deposit: int,
+                          chat_id: int,
+                          timeframe: str = KLINES_INTERVAL,
+                          on_progress: Callable[[int, int], Awaitable[None]] | None = None) -> dict:
+    """Монте-Карло для вже протестованої пари: MONTE_CARLO_PATHS шляхів з блоків по MONTE_CARLO_BLOCK_HOURS годин.
+
+    Свічки беруться з локального кешу, задача йде в спільний пул з тими ж лімітами та скасуванням, що й бектест.
+    """
+    epoch = scheduler.epoch(chat_id)
+    await kline_loader.prefetch(symbol, KLINES_BASE_INTERVAL, *base_range_ms(start_date, end_date, timeframe))
+    block_bars = max(1, MONTE_CARLO_BLOCK_HOURS * 3_600_000 // interval_to_ms(timeframe))
+    return await scheduler.submit(chat_id, run_monte_carlo_backtest, start_date, end_date, symbol, deposit,
+                                  os.getenv("API_KEY"), os.getenv("SECRET_KEY"), timeframe, MONTE_CARLO_PATHS,
+                                  block_bars, on_progress=on_progress, epoch=epoch)
+
+
+def cancel_backtests(chat_id: int) -> int:
+    """Скасування всіх бектестів та малювань чату, повертає кількість перерваних задач.
+
+    Спільний з іншими чатами бектест продовжується для них, цей чат лише перестає його чекати.
+    """
+    waiting = [waiter for waiters in _waiters.values() for waiter in waiters
+               if waiter.chat_id == chat_id and not waiter.cancelled.is_set()]
+    for waiter in waiting:
+        waiter.cancelled.set()
+    return len(waiting) + scheduler.cancel_chat(chat_id)
+
+
+async def top_symbols(n: int) -> list[str]:
+    """n пар до USDT з найбільшим обсягом за добу"""
+    return await kline_loader.top_symbols(min(n, BASKET_MAX_SYMBOLS))
+
+
+async def get_plot(chart_path: str, chat_id: int, dpi: int = PLOT_DPI) -> str:
+    """Шлях до PNG графіку: вже намальований файл, або малювання в пулі процесів при першому запиті"""
+    if not os.path.exists(chart_path):
+        raise FileNotFoundError(chart_path)
+    image_path = f'{chart_path}.{dpi}.png'
+    if not os.path.exists(image_path):
+        image_path, seconds = await scheduler.submit(chat_id, render_plot, chart_path, dpi)
+        metrics.observe('render', seconds)
+    return image_path
+
+
+async def get_basket_plot(chart_paths: dict[str, str], chat_id: int, dpi: int = PLOT_DPI) -> str:
+    """Шлях до PNG графіку кошика з доступних графіків пар"""
+    chart_paths = {symbol: path for symbol, path in chart_paths.items() if os.path.exists(path)}
+    if not chart_paths:
+        raise FileNotFoundError('basket')
+    image_path, seconds = await scheduler.submit(chat_id, render_basket_plot, chart_paths, dpi)
+    metrics.observe('render', seconds)
+    return image_path
 
 
-def buffer_to_bytes(fileio: io.BytesIO, filename):
-    fileio.seek(0)
-    file = BufferedInputFile(fileio.read(), filename=filename)
-    return file
+async def get_orders_file(ledger_path: str, fmt: str = 'text') -> BufferedInputFile:
+    """Форматування журналу ордерів у файл для відправки (поза циклом подій)"""
+    content = await asyncio.to_thread(format_ledger, ledger_path, fmt)
+    return BufferedInputFile(content, filename='orders.csv' if fmt == 'csv' else 'orders.txt')
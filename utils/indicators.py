@@ -0,0 +1,151 @@
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+INDICATORS_PERIOD = 14
+BB_DEVFACTOR = 2.0
+_SMOOTHING_BLOCK = 64
+
+
+class NotEnoughBarsError(ValueError):
+    """Барів до старту тестування замало, щоб індикатори визначились."""
+
+
+def simple_moving_average(values: np.ndarray, period: int) -> np.ndarray:
+    """SMA; перші period - 1 значень - nan"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= period:
+        result[period - 1:] = sliding_window_view(values, period).mean(axis=1)
+    return result
+
+
+@lru_cache(maxsize=8)
+def _smoothing_kernel(alpha: float, block: int) -> tuple[np.ndarray, np.ndarray]:
+    """Матриця згладжування блоку та множники перенесення попереднього значення"""
+    decay = 1.0 - alpha
+    lags = np.subtract.outer(np.arange(block), np.arange(block))
+    kernel = np.where(lags >= 0, alpha * decay ** np.maximum(lags, 0), 0.0)
+    return kernel, decay ** np.arange(1, block + 1)
+
+
+def _exponential_smoothing(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """Рекурсія y = y * (1 - alpha) + x * alpha, порахована блоками через матричне множення"""
+    block = _SMOOTHING_BLOCK
+    kernel, carry = _smoothing_kernel(alpha, block)
+    n_blocks = -(-len(values) // block)
+    padded = np.zeros(n_blocks * block)
+    padded[:len(values)] = values
+    result = padded.reshape(n_blocks, block) @ kernel.T
+    prev = initial
+    for row in result:
+        row += prev * carry
+        prev = row[-1]
+    return result.ravel()[:len(values)]
+
+
+def smoothed_moving_average(values: np.ndarray, period: int) -> np.ndarray:
+    """Згладжена ковзна середня Уайлдера (SMMA), з SMA першого вікна як початковим значенням, як у backtrader"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= period:
+        result[period - 1] = values[:period].mean()
+        result[period:] = _exponential_smoothing(values[period:], 1.0 / period, result[period - 1])
+    return result
+
+
+def rsi(close: np.ndarray, period: int = INDICATORS_PERIOD) -> np.ndarray:
+    """RSI з SMMA підйомів та спадів"""
+    result = np.full(len(close), np.nan)
+    if len(close) > period:
+        change = np.diff(close)
+        maup = smoothed_moving_average(np.maximum(change, 0.0), period)
+        madown = smoothed_moving_average(np.maximum(-change, 0.0), period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[1:] = 100.0 - 100.0 / (1.0 + maup / madown)
+    return result
+
+
+def bollinger_bands(close: np.ndarray,
+                    period: int = INDICATORS_PERIOD,
+                    devfactor: float = BB_DEVFACTOR) -> np.ndarray:
+    """Полоси Боллінджера, колонки (mid, top, bot)"""
+    mid = simple_moving_average(close, period)
+    variance = simple_moving_average(close * close, period) - mid * mid
+    stddev = np.sqrt(np.maximum(variance, 0.0))
+    return np.column_stack((mid, mid + devfactor * stddev, mid - devfactor * stddev))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = INDICATORS_PERIOD) -> np.ndarray:
+    """ATR: SMMA від true range"""
+    result = np.full(len(close), np.nan)
+    if len(close) > period:
+        prev_close = close[:-1]
+        true_range = np.maximum(high[1:], prev_close) - np.minimum(low[1:], prev_close)
+        result[1:] = smoothed_moving_average(true_range, period)
+    return result
+
+
+def compute_indicators(high: np.ndarray,
+                       low: np.ndarray,
+                       close: np.ndarray,
+                       period: int = INDICATORS_PERIOD) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """RSI, Bollinger Bands та ATR за один прохід по масивах.
+
+    Значення обрізані з бару, з якого всі три індикатори визначені (як next() в backtrader);
+    якщо барів не більше period, жодне значення не визначене - NotEnoughBarsError.
+    """
+    high, low, close = (np.asarray(values, dtype=np.float64) for values in (high, low, close))
+    if len(close) <= period:
+        raise NotEnoughBarsError(f'Indicators need more than {period} bars, got {len(close)}')
+    return (rsi(close, period)[period:],
+            bollinger_bands(close, period)[period:],
+            atr(high, low, close, period)[period:])
+
+
+class IndicatorState:
+    """Стан RSI, Bollinger Bands та ATR для дорахунку на нових барах без перерахунку всієї історії.
+
+    Перший update має містити щонайменше period + 1 барів; далі кожен update коштує O(нових барів),
+    а значення збігаються з compute_indicators на всій серії.
+    """
+    def __init__(self, period: int = INDICATORS_PERIOD, devfactor: float = BB_DEVFACTOR):
+        self.period = period
+        self.devfactor = devfactor
+        self.maup = self.madown = self.atr = None
+        self.closes = np.empty(0)
+
+    def update(self, high: np.ndarray, low: np.ndarray, close: np.ndarray
+               ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """RSI, BB (mid, top, bot) та ATR для нових барів; до визначеності індикатора - nan"""
+        high, low, close = (np.asarray(values, dtype=np.float64) for values in (high, low, close))
+        period = self.period
+        if self.atr is None:
+            if len(close) <= period:
+                raise NotEnoughBarsError(f'First update needs more than {period} bars')
+            change = np.diff(close)
+            maup = smoothed_moving_average(np.maximum(change, 0.0), period)
+            madown = smoothed_moving_average(np.maximum(-change, 0.0), period)
+            rsi_values = rsi(close, period)
+            bb_values = bollinger_bands(close, period, self.devfactor)
+            atr_values = atr(high, low, close, period)
+            self.maup, self.madown, self.atr = maup[-1], madown[-1], atr_values[-1]
+            self.closes = close[-period:].copy()
+            return rsi_values, bb_values, atr_values
+
+        prev_close = np.r_[self.closes[-1], close[:-1]]
+        change = close - prev_close
+        alpha = 1.0 / period
+        maup = _exponential_smoothing(np.maximum(change, 0.0), alpha, self.maup)
+        madown = _exponential_smoothing(np.maximum(-change, 0.0), alpha, self.madown)
+        true_range = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+        atr_values = _exponential_smoothing(true_range, alpha, self.atr)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi_values = 100.0 - 100.0 / (1.0 + maup / madown)
+        window = np.r_[self.closes, close]
+        mid = simple_moving_average(window, period)[period:]
+        variance = simple_moving_average(window * window, period)[period:] - mid * mid
+        stddev = np.sqrt(np.maximum(variance, 0.0))
+        bb_values = np.column_stack((mid, mid + self.devfactor * stddev, mid - self.devfactor * stddev))
+        if len(close):
+            self.maup, self.madown, self.atr = maup[-1], madown[-1], atr_values[-1]
+            self.closes = window[-period:]
+        return rsi_values, bb_values, atr_values
@@ -0,0 +1,67 @@
+"""Керування задачами у воркерах: скасування, дедлайн та прогрес через спільну таблицю.
+
+Планувальник (utils.worker_pool) тримає по рядку на кожен воркер: id задачі, прапорець скасування,
+оброблені та всього бари, дедлайн (time.time()). Воркер підключається до таблиці один раз в ініціалізаторі пулу,
+а стратегія періодично викликає checkpoint - він записує прогрес і перериває задачу, якщо її скасовано
+або вийшов час, тож воркер звільняється одразу, а не після завершення прогону.
+"""
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from utils.shared_arrays import SharedSpec, attach_arrays, share_arrays
+
+# Колонки рядка таблиці
+JOB_ID, CANCELLED, DONE, TOTAL, DEADLINE = range(5)
+
+
+class JobCancelledError(Exception):
+    """Задачу скасовано."""
+
+
+class JobTimeoutError(JobCancelledError):
+    """Задача не завершилась до дедлайну."""
+
+
+# Стан процесу-воркера: таблиця підключається в ініціалізаторі пулу, рядок задається на час задачі
+_worker: dict = {'table': None, 'slot': None}
+
+
+def create_table(slots: int) -> tuple[shared_memory.SharedMemory, SharedSpec, np.ndarray]:
+    """Таблиця керування на slots одночасних задач у спільній пам'яті: блок, опис для воркерів та подання.
+
+    Перед release_arrays(block) подання треба відпустити.
+    """
+    block, spec = share_arrays({'jobs': np.zeros((slots, 5))})
+    return block, spec, np.ndarray((slots, 5), np.float64, buffer=block.buf)
+
+
+def attach_table(spec: SharedSpec) -> None:
+    """Підключення воркера до таблиці керування (ініціалізатор пулу)"""
+    block, arrays = attach_arrays(spec, writable=True)
+    _worker.update(block=block, table=arrays['jobs'])
+
+
+def run_job(slot: int, fn, *args):
+    """Виконання задачі у воркері з прив'язкою checkpoint до рядка slot"""
+    _worker['slot'] = slot
+    try:
+        checkpoint()
+        return fn(*args)
+    finally:
+        _worker['slot'] = None
+
+
+def checkpoint(done: int = 0, total: int = 0) -> None:
+    """Запис прогресу поточної задачі; JobCancelledError/JobTimeoutError, якщо її скасовано або вийшов дедлайн.
+
+    Поза задачею планувальника (прямий виклик, бенчмарки) нічого не робить.
+    """
+    if _worker['slot'] is None or _worker['table'] is None:
+        return
+    row = _worker['table'][_worker['slot']]
+    if total:
+        row[DONE], row[TOTAL] = done, total
+    if row[CANCELLED]:
+        raise JobCancelledError(int(row[JOB_ID]))
+    if time.time() > row[DEADLINE]:
+        raise JobTimeoutError(int(row[JOB_ID]))
@@ -1,4 +1,5 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.grid_config import TIMEFRAMES
 
 date_picking_kb = InlineKeyboardMarkup(
     inline_keyboard=[
@@ -11,7 +12,28 @@ date_picking_kb = InlineKeyboardMarkup(
 get_stat_kb = InlineKeyboardMarkup(
     inline_keyboard=[
         [
+            InlineKeyboardButton(text='Графік', callback_data='get_plot'),
             InlineKeyboardButton(text='Отримати дані торгівлі', callback_data='get_stat'),
+            InlineKeyboardButton(text='CSV', callback_data='get_stat_csv'),
+        ],
+        [
+            InlineKeyboardButton(text='Монте-Карло', callback_data='get_monte_carlo'),
+        ],
+    ]
+)
+
+basket_kb = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(text='Графік кошика', callback_data='get_basket_plot'),
         ],
     ]
-)
\ No newline at end of file
+)
+
+timeframe_kb = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(text=timeframe, callback_data=f'timeframe:{timeframe}') for timeframe in TIMEFRAMES
+        ],
+    ]
+)
@@ -0,0 +1,215 @@
+import fcntl
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+import numpy as np
+from utils.resample import resample_ohlcv
+
+KLINE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+OHLCV_COLUMNS = KLINE_COLUMNS[1:]
+CACHE_DIR = os.getenv('KLINES_CACHE_DIR',
+                      os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'klines'))
+
+
+@dataclass
+class Klines:
+    """Свічки в колонках: час відкриття (int64, мс) та OHLCV (float64, форма (5, n)).
+
+    Індексація - по свічках: зріз дає view без копіювання, маска чи масив індексів - копію.
+    """
+    timestamps: np.ndarray
+    ohlcv: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index) -> 'Klines':
+        return Klines(self.timestamps[index], self.ohlcv[:, index])
+
+    @classmethod
+    def empty(cls, size: int = 0) -> 'Klines':
+        return cls(np.empty(size, dtype=np.int64), np.empty((len(OHLCV_COLUMNS), size), dtype=np.float64))
+
+    @classmethod
+    def concatenate(cls, parts: Iterable['Klines']) -> 'Klines':
+        parts = list(parts)
+        return cls(np.concatenate([part.timestamps for part in parts]),
+                   np.concatenate([part.ohlcv for part in parts], axis=1))
+
+
+def last_closed_open(interval_ms: int, now_ms: int | None = None) -> int:
+    """Час відкриття останньої свічки interval_ms, яка вже повністю закрилась"""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    return (now_ms // interval_ms - 1) * interval_ms
+
+
+def klines_to_array(klines: list[list]) -> Klines:
+    """Розбір сирих свічок біржі одразу в колонки Klines.
+
+    Кожна колонка декодується напряму у свій масив, решта полів свічки (close_time, quote_asset_volume, ...)
+    не читається.
+    """
+    parsed = Klines.empty(len(klines))
+    parsed.timestamps[:] = np.fromiter((kline[0] for kline in klines), np.int64, len(klines))
+    for column, values in enumerate(parsed.ohlcv, 1):
+        values[:] = np.fromiter((kline[column] for kline in klines), np.float64, len(klines))
+    return parsed
+
+
+class KlineCache:
+    """Локальний колонковий кеш свічок з ключем (symbol, interval).
+
+    Кожна пара зберігається як два .npy масиви (час відкриття int64 та OHLCV (5, n) float64), які читаються
+    через memory-map, та json-файл з покритим діапазоном. Запит докачує лише відсутні голову та хвіст діапазону.
+    Запис (читання - злиття - заміна файлів) виконується під файловим локом пари, тож паралельні записи потоків
+    і процесів-воркерів не втрачають діапазони один одного.
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _meta_path(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.cache_dir, f'{symbol}_{interval}.json')
+
+    @contextmanager
+    def _locked(self, symbol: str, interval: str) -> Iterator[None]:
+        """Ексклюзивний лок запису пари (symbol, interval) між потоками та процесами"""
+        with open(os.path.join(self.cache_dir, f'{symbol}_{interval}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self, symbol: str, interval: str) -> dict | None:
+        try:
+            with open(self._meta_path(symbol, interval)) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def read(self, symbol: str, interval: str) -> tuple[dict, Klines] | None:
+        """Читання покриття та даних з диску без копіювання"""
+        for _ in range(3):
+            meta = self._read_meta(symbol, interval)
+            if meta is None:
+                return None
+            try:
+                return meta, Klines(*(np.load(os.path.join(self.cache_dir, meta[column]), mmap_mode='r')
+                                      for column in ('timestamps', 'ohlcv')))
+            except FileNotFoundError:
+                # файл щойно замінив інший процес, перечитуємо метадані
+                continue
+        return None
+
+    def missing_ranges(self, symbol: str, interval: str, start_ms: int, end_ms: int,
+                       interval_ms: int) -> list[tuple[int, int]]:
+        """Діапазони, яких бракує в кеші"""
+        # незакриту поточну свічку не кешуємо: останнє відкриття - свічка, що вже закрилась
+        end_ms = min(end_ms, last_closed_open(interval_ms))
+        meta = self._read_meta(symbol, interval)
+        if meta is None:
+            ranges = [(start_ms, end_ms)]
+        else:
+            # покриття має лишатися суцільним, тому докачуємо до самого краю кешу;
+            # межі вирівнюються на відкриття свічок, навіть якщо в метаданих збережено невирівняний край
+            ranges = []
+            if start_ms < meta['start']:
+                ranges.append((start_ms, -(-meta['start'] // interval_ms) * interval_ms - interval_ms))
+            if end_ms > meta['end']:
+                ranges.append((meta['end'] // interval_ms * interval_ms + interval_ms, end_ms))
+        return [(start, end) for start, end in ranges if start <= end]
+
+    def store(self, symbol: str, interval: str, start_ms: int, end_ms: int, klines: Klines) -> None:
+        """Злиття нових свічок з кешем та атомарний запис на диск; свічка з тим самим часом замінюється новою"""
+        with self._locked(symbol, interval):
+            cached = self.read(symbol, interval)
+            if cached is not None:
+                meta, data = cached
+                klines = Klines.concatenate([klines, data])
+                start_ms, end_ms = min(start_ms, meta['start']), max(end_ms, meta['end'])
+            _, unique_idx = np.unique(klines.timestamps, return_index=True)
+            klines = klines[unique_idx]
+            stem = f'{symbol}_{interval}.{uuid.uuid4().hex}'
+            files = {'timestamps': f'{stem}.timestamps.npy', 'ohlcv': f'{stem}.ohlcv.npy'}
+            np.save(os.path.join(self.cache_dir, files['timestamps']), klines.timestamps)
+            np.save(os.path.join(self.cache_dir, files['ohlcv']), klines.ohlcv)
+            meta_path = self._meta_path(symbol, interval)
+            tmp_meta_path = f'{meta_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_meta_path, 'w') as file:
+                json.dump({'start': start_ms, 'end': end_ms, **files}, file)
+            os.replace(tmp_meta_path, meta_path)
+            self._remove_unreferenced(symbol, interval, set(files.values()))
+
+    def _remove_unreferenced(self, symbol: str, interval: str, keep: set[str]) -> None:
+        """Видалення файлів даних пари, на які не посилаються метадані (заміщені або лишені перерваним записом).
+
+        Викликається під локом пари: інших записів у процесі немає, а вже відкриті читачами memory-map
+        лишаються валідними і після видалення файлу.
+        """
+        prefix = f'{symbol}_{interval}.'
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith(('.npy', '.tmp')) and name not in keep:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def discard(self, symbol: str, interval: str) -> None:
+        """Видалення кешу (symbol, interval)"""
+        with self._locked(symbol, interval):
+            try:
+                os.remove(self._meta_path(symbol, interval))
+            except OSError:
+                pass
+            self._remove_unreferenced(symbol, interval, set())
+
+    def select(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> Klines:
+        """Свічки з кешу з відкриттям в [start_ms, end_ms] (view без копіювання)"""
+        cached = self.read(symbol, interval)
+        if cached is None:
+            return Klines.empty()
+        _, data = cached
+        lo = int(np.searchsorted(data.timestamps, start_ms, side='left'))
+        hi = int(np.searchsorted(data.timestamps, end_ms, side='right'))
+        return data[lo:hi]
+
+    def get_or_fetch(self,
+                     symbol: str,
+                     interval: str,
+                     start_ms: int,
+                     end_ms: int,
+                     interval_ms: int,
+                     fetch: Callable[[int, int], Klines]) -> Klines:
+        """Свічки з відкриттям в [start_ms, end_ms]; мережа використовується лише для відсутніх діапазонів"""
+        for fetch_start, fetch_end in self.missing_ranges(symbol, interval, start_ms, end_ms, interval_ms):
+            self.store(symbol, interval, fetch_start, fetch_end, fetch(fetch_start, fetch_end))
+        return self.select(symbol, interval, start_ms, end_ms)
+
+    def get_or_resample(self,
+                        symbol: str,
+                        interval: str,
+                        start_ms: int,
+                        end_ms: int,
+                        interval_ms: int,
+                        base_interval: str,
+                        base_interval_ms: int,
+                        fetch_base: Callable[[int, int], Klines]) -> Klines:
+        """Свічки interval, отримані агрегацією базових (1m) свічок; похідні бари теж кешуються.
+
+        З мережі докачуються лише відсутні базові свічки, тож зміна таймфрейму не потребує нового завантаження.
+        Агрегуються лише бари, що вже закрились: бар з частини хвилин незакритого періоду не потрапляє в кеш.
+        """
+        start_ms -= start_ms % interval_ms
+        closed_end_ms = last_closed_open(interval_ms)
+        for range_start, range_end in self.missing_ranges(symbol, interval, start_ms, min(end_ms, closed_end_ms),
+                                                          interval_ms):
+            base = self.get_or_fetch(symbol, base_interval, range_start, range_end + interval_ms - base_interval_ms,
+                                     base_interval_ms, fetch_base)
+            bars = Klines(*resample_ohlcv(base.timestamps, base.ohlcv, interval_ms))
+            self.store(symbol, interval, range_start, range_end, bars[bars.timestamps <= closed_end_ms])
+        return self.select(symbol, interval, start_ms, end_ms)
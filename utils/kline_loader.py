@@ -0,0 +1,180 @@
+import asyncio
+import os
+import time
+import json
+import aiohttp
+import numpy as np
+from utils.grid_config import interval_to_ms
+from utils.kline_cache import KlineCache, Klines, klines_to_array
+
+BINANCE_API_URL = os.getenv('BINANCE_API_URL', 'https://api.binance.com')
+KLINES_PAGE_LIMIT = 1000
+KLINES_REQUEST_WEIGHT = 2
+TICKER_24HR_REQUEST_WEIGHT = 80
+# Ліміт повторів запиту після 429/418 та сумарного очікування Retry-After, секунд
+EXCHANGE_MAX_RETRIES = int(os.getenv('EXCHANGE_MAX_RETRIES', 5))
+EXCHANGE_MAX_RETRY_WAIT = float(os.getenv('EXCHANGE_MAX_RETRY_WAIT', 60))
+
+
+class ExchangeAPIError(Exception):
+    """Помилка API біржі (як BinanceAPIException, але без імпорту python-binance в процесі бота)."""
+    def __init__(self, status_code: int, code: int | None, message: str):
+        super().__init__(status_code, code, message)
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+    @classmethod
+    def for_status(cls, status_code: int, code: int | None, message: str) -> 'ExchangeAPIError':
+        """5xx - збій на боці біржі (ExchangeUnavailableError), решта - помилка запиту"""
+        error_cls = ExchangeUnavailableError if status_code >= 500 else ExchangeAPIError
+        return error_cls(status_code, code, message)
+
+    @classmethod
+    def from_response(cls, status_code: int, text: str) -> 'ExchangeAPIError':
+        try:
+            body = json.loads(text)
+            return cls.for_status(status_code, body.get('code'), body.get('msg', text))
+        except (ValueError, AttributeError):
+            return cls.for_status(status_code, None, text)
+
+    def __str__(self) -> str:
+        return f'APIError(code={self.code}): {self.message}'
+
+
+class ExchangeUnavailableError(ExchangeAPIError):
+    """Біржа тимчасово недоступна: 5xx або вичерпано повтори після 429/418."""
+
+
+class ExchangeRequestError(Exception):
+    """Некоректна відповідь біржі."""
+
+
+class RateLimiter:
+    """Token bucket для бюджету ваги запитів біржі за хвилину."""
+    def __init__(self, weight_per_minute: int):
+        self.capacity = weight_per_minute
+        self.tokens = float(weight_per_minute)
+        self.rate = weight_per_minute / 60
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, weight: int) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+
+class AsyncKlineLoader:
+    """Асинхронне завантаження свічок сторінками по 1000 паралельно через одну HTTP-сесію."""
+    def __init__(self,
+                 base_url: str = BINANCE_API_URL,
+                 max_concurrency: int = 8,
+                 weight_per_minute: int = 1200,
+                 cache: KlineCache | None = None):
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(weight_per_minute)
+        self.cache = cache or KlineCache()
+        self.session: aiohttp.ClientSession | None = None
+        # лок докачування на пару (symbol, interval); пар на біржі обмежена кількість, тож локи не видаляються
+        self.prefetch_locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def _get(self, path: str, params: dict, weight: int):
+        """GET запит до біржі в межах бюджету ваги.
+
+        На 429/418 чекаємо Retry-After і повторюємо, але не більше EXCHANGE_MAX_RETRIES разів і
+        EXCHANGE_MAX_RETRY_WAIT секунд сумарно, далі - ExchangeUnavailableError.
+        """
+        waited = 0.0
+        for attempt in range(EXCHANGE_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire(weight)
+            async with self._get_session().get(f'{self.base_url}{path}', params=params) as response:
+                if response.status in (418, 429):
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                    if attempt == EXCHANGE_MAX_RETRIES or waited + retry_after > EXCHANGE_MAX_RETRY_WAIT:
+                        error = ExchangeAPIError.from_response(response.status, await response.text())
+                        raise ExchangeUnavailableError(error.status_code, error.code, error.message)
+                    waited += retry_after
+                    await asyncio.sleep(retry_after)
+                    continue
+                if not str(response.status).startswith('2'):
+                    raise ExchangeAPIError.from_response(response.status, await response.text())
+                try:
+                    return await response.json()
+                except (ValueError, aiohttp.ContentTypeError):
+                    raise ExchangeRequestError(f'Invalid Response: {await response.text()}')
+
+    async def _fetch_page(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> list[list]:
+        """Одна сторінка свічок"""
+        params = {'symbol': symbol, 'interval': interval, 'startTime': start_ms,
+                  'endTime': end_ms, 'limit': KLINES_PAGE_LIMIT}
+        return await self._get('/api/v3/klines', params, KLINES_REQUEST_WEIGHT)
+
+    async def top_symbols(self, n: int, quote: str = 'USDT') -> list[str]:
+        """n пар до quote з найбільшим обсягом торгів за 24 години"""
+        tickers = await self._get('/api/v3/ticker/24hr', {}, TICKER_24HR_REQUEST_WEIGHT)
+        tickers = [ticker for ticker in tickers
+                   if ticker['symbol'].endswith(quote) and ticker['symbol'] != quote and int(ticker['count']) > 0]
+        tickers.sort(key=lambda ticker: float(ticker['quoteVolume']), reverse=True)
+        return [ticker['symbol'] for ticker in tickers[:n]]
+
+    async def fetch_range(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> Klines:
+        """Свічки з відкриттям в [start_ms, end_ms], сторінки завантажуються конкурентно.
+
+        Кількість свічок відома з діапазону, тож колонки виділяються одразу, а кожна сторінка декодується
+        на своє місце щойно прийшла: в пам'яті одночасно лише сторінки, що зараз завантажуються.
+        """
+        interval_ms = interval_to_ms(interval)
+        page_ms = interval_ms * KLINES_PAGE_LIMIT
+        first_open = -(-start_ms // interval_ms) * interval_ms
+        klines = Klines.empty(max(0, (end_ms - first_open) // interval_ms + 1))
+        # свічок може бракувати (простій біржі, пара ще не торгувалась), такі місця потім відкидаються
+        filled = np.zeros(len(klines), dtype=bool)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_page(page_start: int) -> None:
+            async with semaphore:
+                parsed = klines_to_array(await self._fetch_page(symbol, interval, page_start,
+                                                                min(page_start + page_ms - 1, end_ms)))
+            positions = (parsed.timestamps - first_open) // interval_ms
+            inside = (positions >= 0) & (positions < len(klines))
+            positions = positions[inside]
+            klines.timestamps[positions] = parsed.timestamps[inside]
+            klines.ohlcv[:, positions] = parsed.ohlcv[:, inside]
+            filled[positions] = True
+
+        await asyncio.gather(*(fetch_page(page_start) for page_start in range(start_ms, end_ms + 1, page_ms)))
+        return klines if filled.all() else klines[filled]
+
+    async def prefetch(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> None:
+        """Докачування в локальний кеш лише відсутніх діапазонів.
+
+        Докачування однієї пари від різних чатів чи кошиків виконуються по черзі: наступне бачить уже збережене
+        попереднім і завантажує лише те, чого досі бракує, тож спільна частина діапазону не качається двічі.
+        """
+        interval_ms = interval_to_ms(interval)
+        async with self.prefetch_locks.setdefault((symbol, interval), asyncio.Lock()):
+            missing = self.cache.missing_ranges(symbol, interval, start_ms, end_ms, interval_ms)
+            fetched = await asyncio.gather(*(self.fetch_range(symbol, interval, start, end)
+                                             for start, end in missing))
+            for (start, end), klines in zip(missing, fetched):
+                await asyncio.to_thread(self.cache.store, symbol, interval, start, end, klines)
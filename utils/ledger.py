@@ -0,0 +1,93 @@
+import os
+import tempfile
+import numpy as np
+
+LEDGER_DIR = os.getenv('LEDGER_DIR', os.path.join(tempfile.gettempdir(), 'grid_ledgers'))
+LEDGER_BATCH_SIZE = 4096
+
+# Події журналу: виставлення ордера сітки, його перевиставлення після продажу на рівні
+# та скасування невиконаної покупки при перецентруванні сітки (walk-forward)
+EVENT_PLACED = 0
+EVENT_REPLACED = 1
+EVENT_CANCELED = 2
+SIDE_BUY = 0
+SIDE_SELL = 1
+
+LEDGER_DTYPE = np.dtype([('timestamp', '<i8'),
+                         ('event', 'u1'),
+                         ('side', 'u1'),
+                         ('level', '<i4'),
+                         ('price', '<f8'),
+                         ('size', '<f8')])
+
+
+class TradeLedger:
+    """Журнал ордерів з типізованих записів, що пишеться в тимчасовий файл пакетами.
+
+    Записи адресуються індексом бару, час береться з timestamps (мс). Форматування в текст - лише в format_ledger.
+    """
+    def __init__(self, timestamps: np.ndarray, ledger_dir: str = LEDGER_DIR, batch_size: int = LEDGER_BATCH_SIZE):
+        os.makedirs(ledger_dir, exist_ok=True)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.batch_size = batch_size
+        self.rows: list[tuple] = []
+        fd, self.path = tempfile.mkstemp(suffix='.ledger', dir=ledger_dir)
+        self.file = os.fdopen(fd, 'wb')
+
+    def record(self, bar: int, event: int, side: int, level: int, price: float, size: float) -> None:
+        self.rows.append((self.timestamps[bar], event, side, level, price, size))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            np.array(self.rows, dtype=LEDGER_DTYPE).tofile(self.file)
+            self.rows.clear()
+
+    def close(self) -> str:
+        """Дописування залишку та закриття файлу, повертає шлях до журналу"""
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+        return self.path
+
+    def __enter__(self) -> 'TradeLedger':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_ledger(path: str) -> np.ndarray:
+    return np.fromfile(path, dtype=LEDGER_DTYPE)
+
+
+def format_ledger(path: str, fmt: str = 'text') -> bytes:
+    """Журнал у вигляді тексту (як раніше писав GridStrategy.log) або CSV"""
+    records = read_ledger(path)
+    if fmt == 'csv':
+        lines = ['timestamp,event,side,level,price,size']
+        lines.extend(f"{np.datetime64(timestamp, 'ms')},{('placed', 'replaced', 'canceled')[event]},"
+                     f"{('buy', 'sell')[side]},{level},{price},{size}"
+                     for timestamp, event, side, level, price, size in records.tolist())
+    elif fmt == 'text':
+        templates = {(EVENT_PLACED, SIDE_BUY): 'New buy order at {price} for {size} units.',
+                     (EVENT_PLACED, SIDE_SELL): 'New sell order at {price} for {size} units.',
+                     (EVENT_REPLACED, SIDE_BUY): 'Buy order at {price} executed. '
+                                                 'New buy order placed at {price} for {size} units.',
+                     (EVENT_REPLACED, SIDE_SELL): 'New sell order placed at {price} for {size} units.',
+                     (EVENT_CANCELED, SIDE_BUY): 'Buy order at {price} for {size} units canceled, grid re-centered.'}
+        lines = [templates[event, side].format(price=price, size=size)
+                 for _, event, side, _, price, size in records.tolist()]
+    else:
+        raise ValueError(f'Unknown ledger format: {fmt}')
+    return ('\n'.join(lines) + '\n').encode('utf-8') if lines else b''
+
+
+def remove_ledger(path: str | None) -> None:
+    """Видалення файлу журналу, якщо він ще існує"""
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,123 @@
+import cProfile
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+PROFILE_MIN_SECONDS = float(os.getenv('PROFILE_MIN_SECONDS', 0))
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    """Тривалості етапів одного прогону"""
+    def __init__(self):
+        self.durations: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - started
+
+
+class Metrics:
+    """Лічильники та гістограми етапів бектестів у форматі Prometheus, плюс структурований лог кожної задачі"""
+    def __init__(self, buckets: tuple[float, ...] = STAGE_BUCKETS):
+        self.buckets = buckets
+        self.stages: dict[str, list] = {}
+        self.counters: dict[tuple[str, str], float] = {}
+        self.gauges: dict[str, Callable[[], float]] = {}
+        self.runner = None
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Тривалість етапу: кумулятивні кошики, сума та кількість"""
+        counts, total = self.stages.setdefault(stage, [[0] * (len(self.buckets) + 1), 0.0])
+        counts[bisect_left(self.buckets, seconds)] += 1
+        self.stages[stage][1] = total + seconds
+
+    def inc(self, name: str, value: float = 1, label: str = '') -> None:
+        self.counters[name, label] = self.counters.get((name, label), 0) + value
+
+    def gauge(self, name: str, read: Callable[[], float]) -> None:
+        """Показник, що зчитується в момент запиту метрик"""
+        self.gauges[name] = read
+
+    def record_job(self, job: dict) -> None:
+        """Метрики завершеної задачі бектесту: етапи, кількість барів, рівнів сітки та ордерів"""
+        for stage, seconds in job.get('stages', {}).items():
+            self.observe(stage, seconds)
+        self.inc('backtest_jobs_total', label=job.get('status', 'ok'))
+        for name in ('bars', 'grid_levels', 'orders'):
+            if name in job:
+                self.inc(f'backtest_{name}_total', job[name])
+        logger.info(json.dumps({'event': 'backtest_job', **job}, default=str))
+
+    def render(self) -> str:
+        """Текстовий формат експозиції Prometheus"""
+        lines = ['# TYPE backtest_stage_seconds histogram']
+        for stage, (counts, total) in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'backtest_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'backtest_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'backtest_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f'# TYPE {name} counter')
+            for (counter, label), value in sorted(self.counters.items()):
+                if counter == name:
+                    lines.append(f'{name}{{status="{label}"}} {value}' if label else f'{name} {value}')
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {read()}')
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+        """Локальний HTTP ендпоінт /metrics"""
+        from aiohttp import web
+
+        async def handle(_request):
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def close(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+@contextmanager
+def profiled(label: str, profile_dir: str | None = PROFILE_DIR,
+             min_seconds: float = PROFILE_MIN_SECONDS) -> Iterator[None]:
+    """cProfile прогону, якщо задано profile_dir; дамп зберігається лише для прогонів, довших за min_seconds"""
+    if not profile_dir:
+        yield
+        return
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f'{label}-{int(time.time())}.prof')
+            profiler.dump_stats(path)
+            logger.info(json.dumps({'event': 'profile_saved', 'label': label, 'seconds': elapsed, 'path': path}))
@@ -0,0 +1,82 @@
+from typing import Callable
+import numpy as np
+from utils.grid_engine import simulate_grid_paths
+
+# Скільки клітинок (бари x шляхи) генерується за раз: пам'ять на чотири ряди OHLC обмежена ~64 МБ
+MONTE_CARLO_CHUNK_CELLS = 2_000_000
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def relative_candles(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """Свічки (4, n - 1) відносно close попереднього бару: вибірка для бутстрепу"""
+    previous = np.asarray(close[:-1], dtype=np.float64)
+    return np.vstack([np.asarray(values[1:], dtype=np.float64) / previous for values in (open_, high, low, close)])
+
+
+def bootstrap_paths(candles: np.ndarray,
+                    first_bar: tuple[float, float, float, float],
+                    n_bars: int,
+                    n_paths: int,
+                    block_bars: int,
+                    rng: np.random.Generator) -> np.ndarray:
+    """Цінові шляхи (4, n_bars, n_paths) кільцевим блочним бутстрепом відносних свічок.
+
+    Перший бар - справжній бар старту тестування (від нього рахується сітка), далі шляхи складаються
+    з блоків по block_bars послідовних історичних свічок з випадковим початком; block_bars=1 - незалежні свічки.
+    """
+    samples = candles.shape[1]
+    blocks = -(-(n_bars - 1) // block_bars)
+    starts = rng.integers(0, samples, size=(blocks, 1, n_paths))
+    index = ((starts + np.arange(block_bars)[None, :, None]) % samples).reshape(blocks * block_bars, n_paths)
+    index = index[:n_bars - 1]
+    paths = np.empty((4, n_bars, n_paths))
+    paths[:, 0] = np.asarray(first_bar, dtype=np.float64)[:, None]
+    close = paths[3]
+    np.cumprod(candles[3][index], axis=0, out=close[1:])
+    close[1:] *= first_bar[3]
+    for row in range(3):
+        np.multiply(candles[row][index], close[:-1], out=paths[row, 1:])
+    return paths
+
+
+def run_monte_carlo(candles: np.ndarray,
+                    first_bar: tuple[float, float, float, float],
+                    n_bars: int,
+                    buy_levels: list[float],
+                    sell_levels: list[float],
+                    stop_loss: float,
+                    take_profit: float,
+                    deposit: float,
+                    n_paths: int,
+                    block_bars: int,
+                    seed: int = 0,
+                    on_progress: Callable[[int, int], None] | None = None) -> dict[str, np.ndarray]:
+    """Сітка на n_paths бутстреп-шляхах; шляхи генеруються та симулюються пачками по MONTE_CARLO_CHUNK_CELLS"""
+    rng = np.random.default_rng(seed)
+    chunk = max(1, min(n_paths, MONTE_CARLO_CHUNK_CELLS // max(n_bars, 1)))
+    results = []
+    for done in range(0, n_paths, chunk):
+        paths = bootstrap_paths(candles, first_bar, n_bars, min(chunk, n_paths - done), block_bars, rng)
+        chunk_progress = None
+        if on_progress is not None:
+            def chunk_progress(bar: int, _: int, done: int = done) -> None:
+                on_progress(done * n_bars + bar * min(chunk, n_paths - done), n_paths * n_bars)
+        results.append(simulate_grid_paths(*paths, buy_levels, sell_levels, stop_loss, take_profit, deposit,
+                                           on_progress=chunk_progress))
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+def summarize(results: dict[str, np.ndarray], deposit: float) -> dict:
+    """Розподіли P/L та просідання (перцентилі) і ймовірності збитку, stop_loss та take_profit"""
+    profit = 100 * (results['final_value'] - deposit) / deposit
+    return {
+        'paths': len(profit),
+        'percentiles': PERCENTILES,
+        'Profit/Loss (%)': np.percentile(profit, PERCENTILES).round(2).tolist(),
+        'Max drawdown (%)': np.percentile(results['max_drawdown'], PERCENTILES).round(2).tolist(),
+        'Total Trades': np.percentile(results['orders_executed'], PERCENTILES).round(1).tolist(),
+        'mean_profit': round(float(profit.mean()), 2),
+        'loss_probability': round(float((profit < 0).mean()), 4),
+        'stop_loss_probability': round(float(results['stop_hit'].mean()), 4),
+        'take_profit_probability': round(float(results['take_hit'].mean()), 4),
+    }
@@ -0,0 +1,178 @@
+import glob
+import hashlib
+import os
+import io
+import tempfile
+from dataclasses import dataclass
+import numpy as np
+
+PLOT_DPI = int(os.getenv('PLOT_DPI', 150))
+PLOT_WIDTH = 16
+PLOT_HEIGHT = 9
+# Пікселів на одну свічку після проріджування
+PLOT_CANDLE_PX = 4
+CHART_DIR = os.getenv('CHART_DIR', os.path.join(tempfile.gettempdir(), 'grid_charts'))
+
+
+@dataclass
+class ChartData:
+    """Дані для графіку бектесту: свічки, середні ціни покупок/продажів на барі та вартість портфеля"""
+    timestamps: np.ndarray
+    ohlc: np.ndarray
+    buys: np.ndarray
+    sells: np.ndarray
+    values: np.ndarray
+
+    def save(self, chart_dir: str = CHART_DIR) -> str:
+        """Запис у тимчасовий .npy (рядки: час, OHLC, покупки, продажі, вартість), повертає шлях"""
+        os.makedirs(chart_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.chart.npy', dir=chart_dir)
+        with os.fdopen(fd, 'wb') as file:
+            np.save(file, np.vstack((self.timestamps.astype(np.float64), self.ohlc, self.buys, self.sells,
+                                     self.values)))
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'ChartData':
+        """Відкриття збереженого графіку через memory-map, без читання файлу в пам'ять"""
+        rows = np.load(path, mmap_mode='r')
+        return cls(rows[0].astype(np.int64), rows[1:5], rows[5], rows[6], rows[7])
+
+
+def fill_marks(n: int, fills: list[tuple[int, bool, float]]) -> tuple[np.ndarray, np.ndarray]:
+    """Середня ціна виконаних покупок та продажів на кожному барі (nan - виконань не було), як BuySell обсервер"""
+    marks = []
+    for side in (True, False):
+        bars = np.array([t for t, is_buy, _ in fills if is_buy == side], dtype=np.int64)
+        prices = np.array([price for _, is_buy, price in fills if is_buy == side], dtype=np.float64)
+        counts = np.bincount(bars, minlength=n).astype(np.float64)
+        with np.errstate(invalid='ignore'):
+            marks.append(np.bincount(bars, weights=prices, minlength=n) / np.where(counts, counts, np.nan))
+    return marks[0], marks[1]
+
+
+def decimate(chart: ChartData, max_candles: int) -> ChartData:
+    """Об'єднання сусідніх барів у свічки так, щоб їх було не більше max_candles"""
+    n = len(chart.timestamps)
+    factor = -(-n // max_candles) if max_candles else 1
+    if factor <= 1:
+        return chart
+    starts = np.arange(0, n, factor)
+    ends = np.minimum(starts + factor, n) - 1
+    open_, high, low, close = chart.ohlc
+    ohlc = np.vstack((open_[starts],
+                      np.maximum.reduceat(high, starts),
+                      np.minimum.reduceat(low, starts),
+                      close[ends]))
+
+    def mean_marks(marks: np.ndarray) -> np.ndarray:
+        present = ~np.isnan(marks)
+        counts = np.add.reduceat(present.astype(np.float64), starts)
+        with np.errstate(invalid='ignore'):
+            return np.add.reduceat(np.where(present, marks, 0.0), starts) / np.where(counts, counts, np.nan)
+
+    return ChartData(chart.timestamps[starts], ohlc, mean_marks(chart.buys), mean_marks(chart.sells),
+                     chart.values[ends])
+
+
+def render_chart(chart: ChartData, dpi: int = PLOT_DPI, width: float = PLOT_WIDTH,
+                 height: float = PLOT_HEIGHT) -> bytes:
+    """PNG графіку: свічки з покупками/продажами та вартість портфеля.
+
+    Малюється без pyplot на Agg полотні, тому не потребує дисплея; кількість свічок обмежується шириною в пікселях.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.figure import Figure
+
+    chart = decimate(chart, int(width * dpi) // PLOT_CANDLE_PX)
+    dates = chart.timestamps.astype('datetime64[ms]')
+    open_, high, low, close = chart.ohlc
+    candle_width = np.median(np.diff(dates)) * 0.7 if len(dates) > 1 else np.timedelta64(1, 'h')
+    colors = np.where(close >= open_, '#26a69a', '#ef5350')
+
+    figure = Figure(figsize=(width, height), dpi=dpi)
+    FigureCanvasAgg(figure)
+    price_ax, value_ax = figure.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': (3, 1)})
+    price_ax.vlines(dates, low, high, colors=colors, linewidth=0.6)
+    price_ax.bar(dates, np.abs(close - open_), candle_width, np.minimum(open_, close), color=colors)
+    price_ax.plot(dates, chart.buys, '^', color='lime', markersize=7, markeredgecolor='black', label='buy')
+    price_ax.plot(dates, chart.sells, 'v', color='blue', markersize=7, markeredgecolor='black', label='sell')
+    price_ax.legend(loc='upper left')
+    price_ax.grid(alpha=0.3)
+    value_ax.plot(dates, chart.values, color='black', linewidth=1.0, label='value')
+    value_ax.legend(loc='upper left')
+    value_ax.grid(alpha=0.3)
+    locator = AutoDateLocator()
+    value_ax.xaxis.set_major_locator(locator)
+    value_ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    figure.tight_layout()
+    buf = io.BytesIO()
+    figure.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def render_chart_file(chart_path: str, dpi: int = PLOT_DPI) -> str:
+    """PNG для збереженого графіку поруч з ним; вже намальований файл повторно не малюється"""
+    image_path = f'{chart_path}.{dpi}.png'
+    if not os.path.exists(image_path):
+        image = render_chart(ChartData.load(chart_path), dpi)
+        tmp_path = f'{image_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(image)
+        os.replace(tmp_path, image_path)
+    return image_path
+
+
+def render_equity_curves(charts: dict[str, ChartData], dpi: int = PLOT_DPI, width: float = PLOT_WIDTH,
+                         height: float = PLOT_HEIGHT) -> bytes:
+    """PNG з дохідністю портфеля (%) кожної пари кошика на одному графіку, в легенді - в порядку charts"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(width, height), dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.subplots()
+    max_points = int(width * dpi) // PLOT_CANDLE_PX
+    for symbol, chart in charts.items():
+        if not len(chart.values):
+            continue
+        step = -(-len(chart.values) // max_points)
+        values = np.asarray(chart.values[::step])
+        ax.plot(chart.timestamps[::step].astype('datetime64[ms]'), 100 * (values / values[0] - 1),
+                linewidth=0.9, label=symbol)
+    ax.axhline(0, color='black', linewidth=0.6)
+    ax.set_ylabel('%')
+    ax.legend(loc='upper left', fontsize='small', ncol=max(1, -(-len(charts) // 20)))
+    ax.grid(alpha=0.3)
+    locator = AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    figure.tight_layout()
+    buf = io.BytesIO()
+    figure.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def render_basket_file(chart_paths: dict[str, str], dpi: int = PLOT_DPI) -> str:
+    """PNG кошика поруч з першим графіком (видаляється разом з ним через remove_chart)"""
+    digest = hashlib.sha256('\0'.join(f'{symbol}={path}' for symbol, path in chart_paths.items()).encode())
+    image_path = f'{next(iter(chart_paths.values()))}.basket-{digest.hexdigest()[:16]}.{dpi}.png'
+    if not os.path.exists(image_path):
+        image = render_equity_curves({symbol: ChartData.load(path) for symbol, path in chart_paths.items()}, dpi)
+        tmp_path = f'{image_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(image)
+        os.replace(tmp_path, image_path)
+    return image_path
+
+
+def remove_chart(chart_path: str | None) -> None:
+    """Видалення збереженого графіку та намальованих з нього зображень"""
+    if chart_path:
+        for path in (chart_path, *glob.glob(glob.escape(chart_path) + '.*.png')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
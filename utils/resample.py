@@ -0,0 +1,22 @@
+import numpy as np
+
+
+def resample_ohlcv(timestamps: np.ndarray, ohlcv: np.ndarray, interval_ms: int) -> tuple[np.ndarray, np.ndarray]:
+    """Агрегація відсортованих свічок (час відкриття, OHLCV (5, n)) у бари interval_ms, вирівняні від епохи,
+    як у Binance (до 1d включно).
+
+    open - перша свічка бару, high/low - екстремуми, close - остання, volume - сума; бари без свічок пропускаються.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    ohlcv = np.asarray(ohlcv, dtype=np.float64)
+    if not len(timestamps):
+        return timestamps.copy(), ohlcv.copy()
+    buckets = timestamps - timestamps % interval_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    open_, high, low, close, volume = ohlcv
+    return buckets[starts], np.vstack((open_[starts],
+                                       np.maximum.reduceat(high, starts),
+                                       np.minimum.reduceat(low, starts),
+                                       close[ends],
+                                       np.add.reduceat(volume, starts)))
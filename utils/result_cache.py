@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+from utils.ledger import remove_ledger
+from utils.plotting import remove_chart
+
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 256))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 3600))
+# Порожнє значення - кеш лише в пам'яті
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR',
+                             os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache',
+                                          'results')) or None
+
+
+def result_key(**inputs: Any) -> str:
+    """Ключ результату за повним набором вхідних даних та параметрів"""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Кеш результатів бектестів з LRU та TTL витісненням і об'єднанням однакових запитів, що виконуються.
+
+    Результат - (analysis, chart_path, ledger_path); файли графіку та журналу належать кешу і видаляються
+    разом із записом.
+    Якщо вказано cache_dir, записи зберігаються на диск і переживають перезапуск бота.
+    """
+    def __init__(self, max_items: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL, cache_dir: str | None = None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.entries: OrderedDict[str, tuple[float, tuple]] = OrderedDict()
+        self.inflight: dict[str, asyncio.Task] = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def _load(self) -> None:
+        """Читання збережених записів, прострочені видаляються"""
+        stored = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    with open(path, 'rb') as file:
+                        stored.append((name[:-len('.pkl')], *pickle.load(file)))
+                except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+                    os.remove(path)
+        for key, expires_at, result in sorted(stored, key=lambda item: item[1]):
+            self.entries[key] = (expires_at, result)
+        self._evict()
+
+    def get(self, key: str) -> tuple | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.time() or not all(os.path.exists(path) for path in result[1:]):
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: tuple) -> tuple:
+        """Збереження результату; з cache_dir журнал переноситься в каталог кешу"""
+        expires_at = time.time() + self.ttl
+        if self.cache_dir:
+            result = self._persist(key, expires_at, result)
+        self._store(key, expires_at, result)
+        return result
+
+    def _persist(self, key: str, expires_at: float, result: tuple) -> tuple:
+        """Перенесення файлів графіку й журналу та запис результату на диск (може виконуватись поза циклом подій)"""
+        analysis, chart_path, ledger_path = result
+        stored_chart_path = os.path.join(self.cache_dir, f'{key}.chart.npy')
+        stored_ledger_path = os.path.join(self.cache_dir, f'{key}.ledger')
+        remove_chart(stored_chart_path)
+        shutil.move(chart_path, stored_chart_path)
+        shutil.move(ledger_path, stored_ledger_path)
+        result = (analysis, stored_chart_path, stored_ledger_path)
+        tmp_path = self._entry_path(key) + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump((expires_at, result), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._entry_path(key))
+        return result
+
+    def _store(self, key: str, expires_at: float, result: tuple) -> None:
+        previous = self.entries.pop(key, None)
+        if previous is not None and previous[1][1:] != result[1:]:
+            self._remove_files(previous[1])
+        self.entries[key] = (expires_at, result)
+        self._evict()
+
+    def _drop(self, key: str) -> None:
+        _, result = self.entries.pop(key)
+        self._remove_files(result)
+        if self.cache_dir:
+            remove_ledger(self._entry_path(key))
+
+    @staticmethod
+    def _remove_files(result: tuple) -> None:
+        remove_chart(result[1])
+        remove_ledger(result[2])
+
+    def sweep(self, *directories: str) -> None:
+        """Видалення файлів графіків і журналів, старших за TTL, на які не посилається жоден запис.
+
+        Після перезапуску такі файли вже ніхто не відстежує, хоча шляхи до них могли лишитися в стані діалогів.
+        """
+        referenced = {path for _, result in self.entries.values() for path in result[1:]}
+        deadline = time.time() - self.ttl
+        for directory in directories:
+            try:
+                names = os.listdir(directory)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    if path not in referenced and os.path.isfile(path) and os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [key for key, (expires_at, _) in self.entries.items() if expires_at < now]:
+            self._drop(key)
+        while len(self.entries) > self.max_items:
+            self._drop(next(iter(self.entries)))
+
+    async def get_or_run(self, key: str, compute: Callable[[], Awaitable[tuple]]) -> tuple:
+        """Результат з кешу, або очікування вже запущеного обчислення з тим самим ключем, або новий запуск"""
+        result = self.get(key)
+        if result is not None:
+            return result
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._compute(key, compute))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self.inflight.pop(key) if self.inflight.get(key) is done else None)
+        # shield: скасування одного з очікуючих не зупиняє спільну задачу для решти
+        return await asyncio.shield(task)
+
+    def cancel(self, key: str) -> None:
+        """Скасування обчислення, яке більше ніхто не чекає; наступний запит з тим ключем запустить нове"""
+        task = self.inflight.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[tuple]]) -> tuple:
+        result = await compute()
+        expires_at = time.time() + self.ttl
+        if self.cache_dir:
+            result = await asyncio.to_thread(self._persist, key, expires_at, result)
+        self._store(key, expires_at, result)
+        return result
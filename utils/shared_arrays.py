@@ -0,0 +1,38 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# Опис масивів у спільній пам'яті: ім'я блоку та (назва, dtype, shape, зміщення) кожного масиву
+SharedSpec = tuple[str, tuple[tuple[str, str, tuple[int, ...], int], ...]]
+
+
+def share_arrays(arrays: dict[str, np.ndarray]) -> tuple[shared_memory.SharedMemory, SharedSpec]:
+    """Копіювання масивів в один блок спільної пам'яті; воркерам передається лише невеликий опис"""
+    layout = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        offset = -(-offset // 64) * 64
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (name, dtype, shape, start), array in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype, buffer=block.buf, offset=start)[...] = array
+    return block, (block.name, tuple(layout))
+
+
+def attach_arrays(spec: SharedSpec, writable: bool = False) -> tuple[shared_memory.SharedMemory, dict[str, np.ndarray]]:
+    """Підключення до блоку за описом; масиви - подання без копіювання, за замовчуванням лише для читання"""
+    name, layout = spec
+    block = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for array_name, dtype, shape, offset in layout:
+        array = np.ndarray(shape, dtype, buffer=block.buf, offset=offset)
+        array.flags.writeable = writable
+        arrays[array_name] = array
+    return block, arrays
+
+
+def release_arrays(block: shared_memory.SharedMemory) -> None:
+    """Закриття та видалення блоку власником"""
+    block.close()
+    block.unlink()
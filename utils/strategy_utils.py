@@ -1,5 +1,4 @@
 import backtrader as bt
-from backtrader.indicators import RSI, BollingerBands, ATR
 
 
 class MyBuySell(bt.observers.BuySell):
@@ -29,29 +28,3 @@ class CustomAnalyzer(bt.Analyzer):
             "Total Trades": self.total_trades
         }
 
-
-class IndicatorCalculation(bt.Strategy):
-    """Стратегія для обчислення технічних індикаторів."""
-    def __init__(self):
-        self.rsi = RSI(self.data.close, period=14)
-        self.bollinger_bands = BollingerBands(self.data.close, period=14)
-        self.atr = ATR(self.data, period=14)
-        self.rsi_values = []
-        self.bb_v = []
-        self.atr_values = []
-
-    def next(self):
-        self.rsi_values.append(self.rsi[0])
-        self.bb_v.append((self.bollinger_bands.lines.mid[0],
-                          self.bollinger_bands.lines.top[0],
-                          self.bollinger_bands.lines.bot[0]))
-        self.atr_values.append(self.atr[0])
-
-    def get_rsi_values(self) -> list[float]:
-        return self.rsi_values
-
-    def get_bollinger_bands_values(self) -> list[tuple[float, float, float]]:
-        return self.bb_v
-
-    def get_atr_values(self) -> list[float]:
-        return self.atr_values
\ No newline at end of file
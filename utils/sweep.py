@@ -0,0 +1,61 @@
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.grid_engine import simulate_grid, grid_analysis
+from utils.shared_arrays import SharedSpec, share_arrays, attach_arrays, release_arrays
+
+# Дані процесу-воркера перебору: подання спільної пам'яті, підключаються один раз в ініціалізаторі пулу
+_sweep_data: dict = {}
+
+
+def sweep_parameter_sets(param_grid: dict[str, list], n_random: int | None = None, seed: int = 0) -> list[dict]:
+    """Повний перебір комбінацій або n_random випадкових унікальних комбінацій"""
+    names = list(param_grid)
+    if n_random is None:
+        return [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+    total = int(np.prod([len(values) for values in param_grid.values()]))
+    rng = random.Random(seed)
+    picked = set()
+    while len(picked) < min(n_random, total):
+        picked.add(tuple(rng.randrange(len(param_grid[name])) for name in names))
+    return [{name: param_grid[name][i] for name, i in zip(names, indices)} for indices in sorted(picked)]
+
+
+def _init_sweep_worker(spec: SharedSpec, deposit: float, weeks_n: int) -> None:
+    block, arrays = attach_arrays(spec)
+    _sweep_data.update(arrays, block=block, deposit=deposit, weeks_n=weeks_n)
+
+
+def _evaluate(grid_params: dict) -> dict[str, float | int]:
+    """Прогін однієї комбінації параметрів у воркері"""
+    from strategy import GridStrategy
+    data = _sweep_data
+    open_, high, low, close = data['ohlc']
+    buy_levels, sell_levels, stop_loss, take_profit = GridStrategy.grid_from_params(
+        close[0], data['rsi_values'], data['bb_values'], data['atr_values'], data['weeks_n'], grid_params)
+    values, orders_executed = simulate_grid(open_, high, low, close, buy_levels, sell_levels,
+                                            stop_loss, take_profit, data['deposit'])
+    return grid_analysis(values, data['deposit'], orders_executed)
+
+
+def run_sweep(parameter_sets: list[dict],
+              ohlc: np.ndarray,
+              rsi_values,
+              bb_values,
+              atr_values,
+              deposit: float,
+              weeks_n: int,
+              max_workers: int | None = None) -> list[dict[str, float | int]]:
+    """Паралельна оцінка наборів параметрів; воркери читають дані зі спільної пам'яті без копіювання"""
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(parameter_sets) // (max_workers * 4))
+    block, spec = share_arrays({'ohlc': ohlc, 'rsi_values': rsi_values, 'bb_values': bb_values,
+                                'atr_values': atr_values})
+    try:
+        with ProcessPoolExecutor(max_workers, initializer=_init_sweep_worker,
+                                 initargs=(spec, deposit, weeks_n)) as executor:
+            return list(executor.map(_evaluate, parameter_sets, chunksize=chunksize))
+    finally:
+        release_arrays(block)
@@ -0,0 +1,319 @@
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator
+from utils.job_control import (JOB_ID, CANCELLED, DONE, TOTAL, DEADLINE, JobCancelledError, attach_table, create_table,
+                               run_job)
+from utils.metrics import Metrics
+from utils.shared_arrays import release_arrays
+
+
+class QueueFullError(Exception):
+    """Черга бектестів заповнена."""
+
+
+class ChatLimitError(Exception):
+    """Перевищено кількість одночасних бектестів для одного чату."""
+
+
+# Модулі, що імпортуються один раз у forkserver; воркери форкаються з нього вже з ними
+WORKER_PRELOAD = ('strategy', 'utils.backtest_jobs', 'matplotlib.figure', 'matplotlib.backends.backend_agg')
+WORKER_START_METHOD = os.getenv('BACKTEST_START_METHOD') or \
+    ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+# Ліміт часу виконання задачі (с) та період опитування прогресу для бота (с)
+JOB_TIMEOUT = float(os.getenv('BACKTEST_TIMEOUT', 600))
+PROGRESS_INTERVAL = float(os.getenv('BACKTEST_PROGRESS_INTERVAL', 3))
+
+
+def worker_context(start_method: str = WORKER_START_METHOD) -> multiprocessing.context.BaseContext:
+    """Контекст процесів-воркерів; для forkserver важкі модулі завантажуються в сервер заздалегідь"""
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        context.set_forkserver_preload(list(WORKER_PRELOAD))
+    return context
+
+
+def _init_worker(table_spec) -> None:
+    """Підключення до таблиці керування задачами та попередній імпорт важких модулів
+    (з forkserver вони вже завантажені)"""
+    attach_table(table_spec)
+    for module in WORKER_PRELOAD:
+        importlib.import_module(module)
+
+
+def _noop() -> None:
+    return None
+
+
+@dataclass
+class Job:
+    chat_id: int
+    fn: Callable
+    args: tuple
+    future: asyncio.Future
+    on_position: Callable[[int], Awaitable[None]] | None = None
+    position: int = 0
+    submitted_at: float = 0.0
+    reserved: bool = False
+    job_id: int = 0
+    timeout: float = JOB_TIMEOUT
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None
+    slot: int | None = None
+    executor: ProcessPoolExecutor | None = None
+    progress_task: asyncio.Task | None = None
+    shared: bool = False
+
+
+class BacktestScheduler:
+    """Довгоживучий прогрітий пул процесів з обмеженою чергою, лімітом на чат і чесним (round-robin) плануванням.
+
+    Кожна задача має id та дедлайн; запущені задачі скасовуються кооперативно через таблицю керування
+    у спільній пам'яті (utils.job_control), з неї ж читається прогрес.
+    """
+    def __init__(self, max_workers: int | None = None, max_queue: int = 100, per_chat_limit: int = 1,
+                 metrics: Metrics | None = None, start_method: str = WORKER_START_METHOD,
+                 timeout: float = JOB_TIMEOUT, progress_interval: float = PROGRESS_INTERVAL):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.start_method = start_method
+        self.max_queue = max_queue
+        self.per_chat_limit = per_chat_limit
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.executor: ProcessPoolExecutor | None = None
+        self.queues: OrderedDict[int, deque[Job]] = OrderedDict()
+        self.active: dict[int, int] = {}
+        self.running_jobs: dict[int, Job] = {}
+        self.epochs: dict[int, int] = {}
+        self.metrics = metrics
+        self.table_block = None
+        self.table_spec = None
+        self.table = None
+        self.free_slots: list[int] = []
+        self._job_ids = itertools.count(1)
+        self._notifications: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """Створення таблиці керування, пулу та прогрів усіх воркерів"""
+        if self.executor is not None:
+            return
+        if self.table_block is None:
+            self.table_block, self.table_spec, self.table = create_table(self.max_workers)
+            self.free_slots = list(range(self.max_workers))
+        self.executor = self._create_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _noop) for _ in range(self.max_workers)))
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.max_workers, mp_context=worker_context(self.start_method),
+                                   initializer=_init_worker, initargs=(self.table_spec,))
+
+    def _shutdown_executor(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def shutdown(self) -> None:
+        """Зупинка пулу: запущені задачі скасовуються, таблиця керування звільняється"""
+        if self.table is not None:
+            for slot in self.running_jobs:
+                self.table[slot, CANCELLED] = 1
+        self._shutdown_executor()
+        if self.table_block is not None:
+            self.table = None
+            release_arrays(self.table_block)
+            self.table_block = None
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    @property
+    def running(self) -> int:
+        return len(self.running_jobs)
+
+    def epoch(self, chat_id: int) -> int:
+        """Лічильник скасувань чату: задачі, підготовлені до скасування, з ним не запускаються"""
+        return self.epochs.get(chat_id, 0)
+
+    def progress(self, job_id: int) -> tuple[int, int] | None:
+        """(оброблено барів, всього) запущеної задачі"""
+        for job in self.running_jobs.values():
+            if job.job_id == job_id and self.table is not None:
+                return int(self.table[job.slot, DONE]), int(self.table[job.slot, TOTAL])
+        return None
+
+    def cancel_chat(self, chat_id: int) -> int:
+        """Скасування всіх задач чату: очікуючі знімаються з черги, запущені перериваються на найближчому
+        checkpoint і звільняють воркер. Спільні задачі (shared) не зачіпаються - їх скасовує власник.
+        Повертає кількість скасованих задач."""
+        self.epochs[chat_id] = self.epoch(chat_id) + 1
+        cancelled = 0
+        for job in list(self.queues.get(chat_id, ())):
+            if job.shared:
+                continue
+            self._discard(job)
+            job.future.set_exception(JobCancelledError(job.job_id))
+            cancelled += 1
+        for job in self.running_jobs.values():
+            if job.chat_id == chat_id and not job.shared:
+                self.table[job.slot, CANCELLED] = 1
+                cancelled += 1
+        return cancelled
+
+    @contextmanager
+    def reserve(self, chat_id: int, jobs: int) -> Iterator[None]:
+        """Одне місце в ліміті чату для групи задач (кошик): всередині вони подаються з reserved=True"""
+        if self.active.get(chat_id, 0) >= self.per_chat_limit:
+            raise ChatLimitError(chat_id)
+        if self.queued + jobs > self.max_queue:
+            raise QueueFullError(self.queued)
+        self.active[chat_id] = self.active.get(chat_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._release(chat_id)
+
+    async def submit(self,
+                     chat_id: int,
+                     fn: Callable,
+                     *args: Any,
+                     on_position: Callable[[int], Awaitable[None]] | None = None,
+                     on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+                     reserved: bool = False,
+                     timeout: float | None = None,
+                     epoch: int | None = None,
+                     shared: bool = False) -> Any:
+        """Постановка задачі в чергу та очікування її результату.
+
+        timeout - ліміт часу виконання (с), після нього задача завершується з JobTimeoutError;
+        on_progress(оброблено, всього) викликається раз на progress_interval, поки задача виконується;
+        epoch - значення epoch(chat_id) на момент запиту: якщо чат з тих пір скасовував задачі, JobCancelledError;
+        shared - результат чекають кілька чатів: cancel_chat задачу не скасовує.
+        Скасування очікуючої корутини знімає задачу з черги або перериває її у воркері.
+        """
+        if epoch is not None and epoch != self.epoch(chat_id):
+            raise JobCancelledError(0)
+        if not reserved and self.active.get(chat_id, 0) >= self.per_chat_limit:
+            raise ChatLimitError(chat_id)
+        if self.queued >= self.max_queue:
+            raise QueueFullError(self.queued)
+        await self.start()
+        if epoch is not None and epoch != self.epoch(chat_id):
+            # чат скасував задачі, поки прогрівався пул
+            raise JobCancelledError(0)
+        job = Job(chat_id, fn, args, asyncio.get_running_loop().create_future(), on_position,
+                  submitted_at=time.perf_counter(), reserved=reserved, job_id=next(self._job_ids),
+                  timeout=timeout or self.timeout, on_progress=on_progress, shared=shared)
+        self.queues.setdefault(chat_id, deque()).append(job)
+        if not reserved:
+            self.active[chat_id] = self.active.get(chat_id, 0) + 1
+        self._dispatch()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._discard(job)
+            if job.slot is not None and self.table is not None:
+                # результат більше нікому не потрібен - звільняємо воркер
+                self.table[job.slot, CANCELLED] = 1
+            raise
+
+    def _discard(self, job: Job) -> None:
+        """Видалення з черги задачі, яку ще не запустили"""
+        queue = self.queues.get(job.chat_id)
+        if queue is not None and job in queue:
+            queue.remove(job)
+            if not queue:
+                del self.queues[job.chat_id]
+            if not job.reserved:
+                self._release(job.chat_id)
+            self._notify_positions()
+
+    def _release(self, chat_id: int) -> None:
+        self.active[chat_id] -= 1
+        if not self.active[chat_id]:
+            del self.active[chat_id]
+
+    def _dispatch(self) -> None:
+        """Запуск задач на вільних воркерах, чати обслуговуються по черзі"""
+        loop = asyncio.get_running_loop()
+        while self.running < self.max_workers and self.queues:
+            chat_id, queue = self.queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self.queues[chat_id] = queue
+            job.slot = self.free_slots.pop()
+            self.table[job.slot] = 0
+            self.table[job.slot, JOB_ID] = job.job_id
+            self.table[job.slot, DEADLINE] = time.time() + job.timeout
+            self.running_jobs[job.slot] = job
+            job.executor = self.executor
+            if self.metrics is not None:
+                self.metrics.observe('queue_wait', time.perf_counter() - job.submitted_at)
+            self._set_position(job, 0)
+            if job.on_progress is not None:
+                job.progress_task = asyncio.create_task(self._report_progress(job))
+            exec_future = loop.run_in_executor(self.executor, run_job, job.slot, job.fn, *job.args)
+            exec_future.add_done_callback(lambda future, job=job: self._on_done(job, future))
+        self._notify_positions()
+
+    async def _report_progress(self, job: Job) -> None:
+        """Періодична передача прогресу запущеної задачі боту, лише коли він змінився"""
+        reported = None
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            progress = self.progress(job.job_id)
+            if progress is not None and progress[1] and progress != reported:
+                reported = progress
+                await job.on_progress(*progress)
+
+    def _on_done(self, job: Job, future: Future) -> None:
+        if job.progress_task is not None:
+            job.progress_task.cancel()
+        slot, job.slot = job.slot, None
+        del self.running_jobs[slot]
+        if self.table is not None:
+            self.table[slot] = 0
+        self.free_slots.append(slot)
+        if not job.reserved:
+            self._release(job.chat_id)
+        if not job.future.done():
+            if future.cancelled():
+                job.future.cancel()
+            elif future.exception() is not None:
+                job.future.set_exception(future.exception())
+            else:
+                job.future.set_result(future.result())
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool) \
+                and job.executor is self.executor and self.table_block is not None:
+            # воркер впав, пул більше непридатний - піднімаємо новий (один раз на зламаний пул)
+            self._shutdown_executor()
+            self.executor = self._create_executor()
+        if self.executor is not None:
+            self._dispatch()
+
+    def _notify_positions(self) -> None:
+        """Оновлення позицій очікуючих задач в порядку round-robin"""
+        queues = [list(queue) for queue in self.queues.values()]
+        position = 0
+        for i in range(max(map(len, queues), default=0)):
+            for queue in queues:
+                if i < len(queue):
+                    position += 1
+                    self._set_position(queue[i], position)
+
+    def _set_position(self, job: Job, position: int) -> None:
+        if job.position == position or job.on_position is None:
+            job.position = position
+            return
+        job.position = position
+        task = asyncio.create_task(job.on_position(position))
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)